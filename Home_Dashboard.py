@@ -3,9 +3,12 @@
 
 import streamlit as st
 import pandas as pd
-from datetime import date, datetime, timedelta, time
-from utils_casulo import connect, read_ws
-from utils_ui import set_bg_logo
+from datetime import date, timedelta
+from utils_casulo import (connect, read_many, rollup, session_index, clear_cache, sync_mirror, start_prefetch,
+                          journal_sidebar, archive_closed)
+from utils_ui import set_bg_logo, warn_unparsed
+from utils_perf import perf_panel, span
+from utils_rollup import month_of
 
 st.set_page_config(page_title="Casulo — Dashboard", page_icon="🦋", layout="wide")
 
@@ -39,35 +42,9 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ---------- helpers ----------
-def to_date(s):
-    if s is None: return None
-    s = str(s).strip()
-    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%Y/%m/%d"):
-        try: return datetime.strptime(s, fmt).date()
-        except Exception: pass
-    return None
-
-def to_float(x) -> float:
-    try:
-        s = str(x).strip().replace("R$", "").replace(" ", "")
-        # se vier "1.234,56"
-        if s.count(",")==1 and s.count(".")>=1:
-            s = s.replace(".", "").replace(",", ".")
-        else:
-            s = s.replace(",", ".")
-        return float(s)
-    except Exception:
-        return 0.0
-
 def brl(v: float) -> str:
     return f"R$ {float(v):,.2f}".replace(",", "X").replace(".", ",").replace("X",".")
 
-def parse_hhmm(txt: str):
-    try:
-        return datetime.strptime(str(txt).strip(), "%H:%M").time()
-    except Exception:
-        return None
-
 def week_bounds(anchor: date):
     start = anchor - timedelta(days=anchor.weekday())  # Monday
     end = start + timedelta(days=6)
@@ -77,6 +54,8 @@ WEEKDAYS_PT = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
 
 # ---------- conexão & colunas ----------
 ss = connect()
+journal_sidebar(ss)  # escritas guardadas esperando o Google Sheets
+start_prefetch(ss)  # 1x por processo: mantém Sessões/Pagamentos/Paciente aquecidos em segundo plano
 PAC_COLS = ["PacienteID","Nome","DataNascimento","Responsavel","Telefone","Email",
             "Diagnostico","Convenio","Status","Prioridade","FotoURL","Observacoes"]
 SES_COLS = ["SessaoID","PacienteID","Data","HoraInicio","HoraFim",
@@ -84,132 +63,149 @@ SES_COLS = ["SessaoID","PacienteID","Data","HoraInicio","HoraFim",
 PAG_COLS = ["PagamentoID","PacienteID","Data","Forma","Bruto","Liquido",
             "TaxaValor","TaxaPct","Referencia","Obs","ReciboURL"]
 
-df_pac, _ = read_ws(ss, "Pacientes", PAC_COLS)
-df_ses, _ = read_ws(ss, "Sessoes",   SES_COLS)
-df_pag, _ = read_ws(ss, "Pagamentos",PAG_COLS)
+with st.sidebar:
+    if st.button("🔄 Atualizar dados da planilha", use_container_width=True):
+        clear_cache()
+        sync_mirror(ss)  # no-op se o espelho local (MIRROR_DB) não estiver configurado
+        st.rerun()
+    with st.expander("🗄️ Arquivo"):
+        st.caption(f"Move sessões e pagamentos de anos anteriores a {date.today().year} "
+                   "para abas por ano (ex.: Sessoes_2024). As páginas ficam mais leves; "
+                   "históricos e relatórios continuam enxergando tudo.")
+        if st.button("Arquivar anos fechados", use_container_width=True):
+            with st.spinner("Arquivando…"):
+                try:
+                    feitos = {t: archive_closed(ss, t) for t in ("Sessoes", "Pagamentos")}
+                except RuntimeError as e:
+                    st.error(str(e))
+                else:
+                    resumo = "; ".join(f"{t}: " + ", ".join(f"{a} ({n})" for a, n in anos.items())
+                                       for t, anos in feitos.items() if anos)
+                    st.toast(f"Arquivado — {resumo}." if resumo else "Nada para arquivar.")
+
+sheets = read_many(ss, {"Pacientes": PAC_COLS, "Sessoes": SES_COLS, "Pagamentos": PAG_COLS}, typed=True)
+df_pac, _ = sheets["Pacientes"]
+df_pag, _ = sheets["Pagamentos"]
+# Sessoes vem no mesmo batchGet; recortes por data saem do índice por dia (já com o Nome)
 
 # ---------- normalizações ----------
-df_pac = df_pac.copy()
-df_ses = df_ses.copy()
-df_pag = df_pag.copy()
-
-df_pac["__status_norm"] = df_pac.get("Status","").astype(str).str.strip().str.lower() if not df_pac.empty else []
-df_ses["__dt"] = df_ses.get("Data","").apply(to_date) if "Data" in df_ses else None
-df_ses["__hi"] = df_ses.get("HoraInicio","").apply(parse_hhmm) if "HoraInicio" in df_ses else None
-df_ses["__hf"] = df_ses.get("HoraFim","").apply(parse_hhmm) if "HoraFim" in df_ses else None
-
-df_pag["__dt"] = df_pag.get("Data","").apply(to_date) if "Data" in df_pag else None
-df_pag["__bruto"]   = df_pag.get("Bruto",0).apply(to_float)
-df_pag["__liquido"] = df_pag.get("Liquido",0).apply(to_float)
+# (frames já tipados: __Data = datetime64, __HoraInicio/__HoraFim = minuto do dia, __Bruto/__Liquido = float)
+df_pac["__status_norm"] = df_pac["Status"].astype(str).str.strip().str.lower()
+df_pag["__dt"] = df_pag["__Data"]
+df_pag["__bruto"]   = df_pag["__Bruto"]
+df_pag["__liquido"] = df_pag["__Liquido"]
 
 # ---------- datas base ----------
-hoje = date.today()
+hoje = pd.Timestamp(date.today())
 ini_sem, fim_sem = week_bounds(hoje)
 mes_ini = hoje.replace(day=1)
 
 # ---------- KPIs ----------
 ativos = int((df_pac["__status_norm"] == "ativo").sum()) if not df_pac.empty else 0
 
-semana_atual   = df_ses[(df_ses["__dt"] >= ini_sem) & (df_ses["__dt"] <= fim_sem)] if "__dt" in df_ses else df_ses.iloc[0:0]
-semana_passada = df_ses[(df_ses["__dt"] >= ini_sem - timedelta(days=7)) & (df_ses["__dt"] <= fim_sem - timedelta(days=7))] if "__dt" in df_ses else df_ses.iloc[0:0]
-qtd_semana   = int(len(semana_atual))
-delta_semana = qtd_semana - int(len(semana_passada))
+# semana anterior pode já estar arquivada (virada do ano): o índice inclui o arquivo desse ano
+idx = session_index(ss, ini_sem - timedelta(days=7), fim_sem)
+qtd_semana   = idx.count(ini_sem, fim_sem)
+delta_semana = qtd_semana - idx.count(ini_sem - timedelta(days=7), fim_sem - timedelta(days=7))
 
 pag_mes = df_pag[(df_pag["__dt"] >= mes_ini) & (df_pag["__dt"] <= hoje)]
-fat_mes_bruto   = float(pag_mes["__bruto"].sum())
-fat_mes_liquido = float(pag_mes["__liquido"].sum())
-qtd_pags_mes    = int(len(pag_mes))
+# totais do mês vêm do rollup mês × forma (não reagrupa a aba de pagamentos)
+roll_mes = rollup(ss, "Pagamentos", month_of(hoje), month_of(hoje))
+fat_mes_bruto   = float(roll_mes["Bruto"].sum())
+fat_mes_liquido = float(roll_mes["Liquido"].sum())
+qtd_pags_mes    = int(roll_mes["n"].sum())
 
 c1, c2, c3, c4 = st.columns(4)
 c1.metric("👥 Pacientes ativos", ativos)
 c2.metric("🗓️ Sessões nesta semana", qtd_semana, delta_semana if delta_semana else None)
 c3.metric("💰 Faturamento no mês (líquido)", brl(fat_mes_liquido))
 c4.metric("🧾 Pagamentos no mês", qtd_pags_mes)
+warn_unparsed(df_pag, "Pagamentos")
 
 st.divider()
 
-# ---------- Navegação semanal ----------
+# ---------- Agenda da semana (fragmento) ----------
+# Navegação e filtros reexecutam só este bloco: KPIs, listas e gráficos de
+# receita ficam como estão. O índice de sessões vem do cache em memória,
+# então trocar de semana não chama a API.
 if "week_offset" not in st.session_state:
     st.session_state.week_offset = 0
-col_prev, col_today, col_next = st.columns(3)
-if col_prev.button("← Semana anterior", use_container_width=True):
-    st.session_state.week_offset -= 1; st.rerun()
-if col_today.button("Hoje", use_container_width=True):
-    st.session_state.week_offset = 0; st.rerun()
-if col_next.button("Próxima semana →", use_container_width=True):
-    st.session_state.week_offset += 1; st.rerun()
-
-anchor = hoje + timedelta(weeks=st.session_state.week_offset)
-sem_ini, sem_fim = week_bounds(anchor)
-st.subheader(f"🗓️ Agenda da semana ({sem_ini.strftime('%d/%m')} → {sem_fim.strftime('%d/%m')})")
-
-# filtro por profissional/status (leves)
-colF1, colF2 = st.columns([1,1])
-with colF1:
-    prof_f = st.text_input("Filtrar por profissional (opcional)", "")
-with colF2:
-    status_f = st.multiselect("Status", ["Agendada","Confirmada","Realizada","Falta","Cancelada"], default=["Agendada","Confirmada","Realizada"])
-
-semana = df_ses[(df_ses["__dt"] >= sem_ini) & (df_ses["__dt"] <= sem_fim)].copy()
-if prof_f.strip():
-    semana = semana[semana.get("Profissional","").astype(str).str.contains(prof_f.strip(), case=False, na=False)]
-if status_f:
-    semana = semana[semana.get("Status","").astype(str).isin(status_f)]
-
-# junta nome
-if not semana.empty and "PacienteID" in semana and "PacienteID" in df_pac:
-    semana = semana.merge(df_pac[["PacienteID","Nome"]], on="PacienteID", how="left")
-
-# calendário com Plotly (fallback tabela)
-try:
-    import plotly.express as px
-
-    if not semana.empty:
-        def _dt(row):
-            d = row["__dt"] or sem_ini
-            hi = parse_hhmm(row.get("HoraInicio","")) or time(0,0)
-            hf = parse_hhmm(row.get("HoraFim",""))
-            end_dt = datetime.combine(d, hf) if hf else (datetime.combine(d, hi) + timedelta(minutes=50))
-            return datetime.combine(d, hi), end_dt
-
-        starts, ends = zip(*semana.apply(_dt, axis=1)) if not semana.empty else ([],[])
-        semana["__start"] = list(starts); semana["__end"] = list(ends)
-        semana["__day"] = semana["__dt"].apply(lambda d: WEEKDAYS_PT[d.weekday()] if d else "-")
-        fig = px.timeline(
-            semana, x_start="__start", x_end="__end", y="__day", color="Nome",
-            hover_data={"Data":True,"HoraInicio":True,"HoraFim":True,"Profissional":True,"Status":True,"Tipo":True}
-        )
-        fig.update_yaxes(categoryorder='array', categoryarray=WEEKDAYS_PT)
-        fig.update_layout(height=420, showlegend=True, xaxis_title=None, yaxis_title=None)
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.info("Sem sessões nesta semana com os filtros atuais.")
-except Exception:
-    # fallback por dia
-    if semana.empty:
-        st.info("Sem sessões nesta semana com os filtros atuais.")
-    else:
-        for i in range(7):
-            d = sem_ini + timedelta(days=i)
-            dd = semana[semana["__dt"] == d].copy()
-            if dd.empty: continue
-            st.markdown(f"**{WEEKDAYS_PT[d.weekday()]} — {d.strftime('%d/%m/%Y')}**")
-            dd = dd.sort_values(["HoraInicio","Nome"])
-            cols = ["HoraInicio","HoraFim","Nome","Profissional","Tipo","Status"]
-            cols = [c for c in cols if c in dd.columns]
-            st.dataframe(dd[cols], use_container_width=True, hide_index=True)
+
+def mover_semana(passo: int | None) -> None:
+    st.session_state.week_offset = 0 if passo is None else st.session_state.week_offset + passo
+
+@st.fragment
+def agenda_semana() -> None:
+    col_prev, col_today, col_next = st.columns(3)
+    col_prev.button("← Semana anterior", use_container_width=True, on_click=mover_semana, args=(-1,))
+    col_today.button("Hoje", use_container_width=True, on_click=mover_semana, args=(None,))
+    col_next.button("Próxima semana →", use_container_width=True, on_click=mover_semana, args=(1,))
+
+    anchor = hoje + timedelta(weeks=st.session_state.week_offset)
+    sem_ini, sem_fim = week_bounds(anchor)
+    st.subheader(f"🗓️ Agenda da semana ({sem_ini.strftime('%d/%m')} → {sem_fim.strftime('%d/%m')})")
+
+    # filtro por profissional/status (leves)
+    colF1, colF2 = st.columns([1,1])
+    with colF1:
+        prof_f = st.text_input("Filtrar por profissional (opcional)", "")
+    with colF2:
+        status_f = st.multiselect("Status", ["Agendada","Confirmada","Realizada","Falta","Cancelada"], default=["Agendada","Confirmada","Realizada"])
+
+    semana = session_index(ss, sem_ini, sem_fim).window(sem_ini, sem_fim)
+    semana["__dt"] = semana["__Data"]
+    if prof_f.strip():
+        semana = semana[semana.get("Profissional","").astype(str).str.contains(prof_f.strip(), case=False, na=False)]
+    if status_f:
+        semana = semana[semana.get("Status","").astype(str).isin(status_f)]
+
+    with span("chart", "agenda da semana"):
+        # calendário com Plotly (fallback tabela)
+        try:
+            import plotly.express as px
+
+            if not semana.empty:
+                hi_min = semana["__HoraInicio"].fillna(0).astype("int64")
+                semana["__start"] = semana["__dt"] + pd.to_timedelta(hi_min, unit="m")
+                semana["__end"] = (semana["__dt"] + pd.to_timedelta(semana["__HoraFim"].astype("float64"), unit="m")
+                                   ).fillna(semana["__start"] + pd.Timedelta(minutes=50))
+                semana["__day"] = semana["__dt"].dt.weekday.map(dict(enumerate(WEEKDAYS_PT))).fillna("-")
+                fig = px.timeline(
+                    semana, x_start="__start", x_end="__end", y="__day", color="Nome",
+                    hover_data={"Data":True,"HoraInicio":True,"HoraFim":True,"Profissional":True,"Status":True,"Tipo":True}
+                )
+                fig.update_yaxes(categoryorder='array', categoryarray=WEEKDAYS_PT)
+                fig.update_layout(height=420, showlegend=True, xaxis_title=None, yaxis_title=None)
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("Sem sessões nesta semana com os filtros atuais.")
+        except Exception:
+            # fallback por dia
+            if semana.empty:
+                st.info("Sem sessões nesta semana com os filtros atuais.")
+            else:
+                for i in range(7):
+                    d = sem_ini + timedelta(days=i)
+                    dd = semana[semana["__dt"] == d].copy()
+                    if dd.empty: continue
+                    st.markdown(f"**{WEEKDAYS_PT[d.weekday()]} — {d.strftime('%d/%m/%Y')}**")
+                    dd = dd.sort_values(["HoraInicio","Nome"])
+                    cols = ["HoraInicio","HoraFim","Nome","Profissional","Tipo","Status"]
+                    cols = [c for c in cols if c in dd.columns]
+                    st.dataframe(dd[cols], use_container_width=True, hide_index=True)
+
+agenda_semana()
 
 st.divider()
 
 # ---------- Hoje & próximos 7 dias (lista bonita) ----------
 st.subheader("📅 Hoje & próximos 7 dias")
-prox = df_ses[(df_ses["__dt"] >= hoje) & (df_ses["__dt"] <= hoje + timedelta(days=7))].copy()
-if not prox.empty and "PacienteID" in prox and "PacienteID" in df_pac:
-    prox = prox.merge(df_pac[["PacienteID","Nome"]], on="PacienteID", how="left")
+prox = idx.window(hoje, hoje + timedelta(days=7))
+prox["__dt"] = prox["__Data"]
 if prox.empty:
     st.info("Sem sessões agendadas nos próximos 7 dias.")
 else:
-    prox["__ord_h"] = prox["__hi"].apply(lambda t: (t.hour*60 + t.minute) if t else 9999)
+    prox["__ord_h"] = prox["__HoraInicio"].fillna(9999)
     prox = prox.sort_values(["__dt","__ord_h","Nome"])
     # render grupo por dia
     for d, bloco in prox.groupby("__dt"):
@@ -241,16 +237,17 @@ st.subheader("💵 Receita do mês")
 if pag_mes.empty:
     st.info("Sem pagamentos neste mês.")
 else:
-    # série diária (líquido)
-    daily = (pag_mes.groupby("__dt")["__liquido"].sum()
-             .reindex([mes_ini + timedelta(days=i) for i in range((hoje-mes_ini).days+1)], fill_value=0.0))
-    df_line = pd.DataFrame({"Data": daily.index, "Líquido": daily.values}).set_index("Data")
-    st.line_chart(df_line, use_container_width=True)
-
-    # por forma (líquido)
-    por_forma = pag_mes.groupby("Forma")["__liquido"].sum().sort_values(ascending=False)
-    if not por_forma.empty:
-        st.bar_chart(por_forma, use_container_width=True)
+    with span("chart", "receita do mês"):
+        # série diária (líquido)
+        daily = (pag_mes.groupby("__dt")["__liquido"].sum()
+                 .reindex([mes_ini + timedelta(days=i) for i in range((hoje-mes_ini).days+1)], fill_value=0.0))
+        df_line = pd.DataFrame({"Data": daily.index, "Líquido": daily.values}).set_index("Data")
+        st.line_chart(df_line, use_container_width=True)
+
+        # por forma (líquido)
+        por_forma = roll_mes.groupby("Forma")["Liquido"].sum().sort_values(ascending=False)
+        if not por_forma.empty:
+            st.bar_chart(por_forma, use_container_width=True)
 
 st.divider()
 
@@ -262,3 +259,5 @@ if not df_pac.empty:
     st.dataframe(df_pac[cols_pac], use_container_width=True, hide_index=True)
 else:
     st.info("Nenhum paciente cadastrado ainda.")
+
+perf_panel()
@@ -0,0 +1,195 @@
+# bench/bench_pages.py — Tempo de render das páginas x tamanho da base
+#
+# Roda cada página com o AppTest do Streamlit sobre uma clínica sintética
+# (bench/synth.py) num MemoryBackend — sem Google, sem cota — e mede, por rerun:
+# tempo de parede, pico de memória Python (tracemalloc) e chamadas ao backend.
+#
+#   python bench/bench_pages.py                        # 1k / 10k / 100k sessões, 3 reruns
+#   python bench/bench_pages.py --rows 1000 --reruns 5
+#   python bench/bench_pages.py --compare bench/results/20261017-120000.json
+#
+# Resultado vai p/ bench/results/<AAAAMMDD-HHMMSS>.json.
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import pandas as pd  # noqa: E402
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import utils_casulo  # noqa: E402
+from utils_backend import Backend, MemoryBackend  # noqa: E402
+from synth import check_totals, clinic  # noqa: E402
+
+PAGES = {
+    "Home_Dashboard": "Home_Dashboard.py",
+    "01_Pacientes": "pages/01_Pacientes.py",
+    "03_Sessoes": "pages/03_Sessões.py",
+}
+ROWS_PADRAO = [1_000, 10_000, 100_000]
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+# =========================
+# Contagem de chamadas
+# =========================
+class CountingBackend:
+    """Repassa tudo p/ `inner` contando as chamadas por método."""
+
+    def __init__(self, inner: Backend):
+        self.inner = inner
+        self.calls: Counter[str] = Counter()
+
+    def __getattr__(self, name):
+        attr = getattr(self.inner, name)
+        if not callable(attr):
+            return attr
+
+        def _contado(*args, **kwargs):
+            self.calls[name] += 1
+            return attr(*args, **kwargs)
+        return _contado
+
+
+# =========================
+# Medição
+# =========================
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def bench_page(page: str, data: dict[str, pd.DataFrame], reruns: int, timeout: float,
+               trace_mem: bool = True) -> list[dict]:
+    """
+    Roda `page` `reruns` vezes no mesmo AppTest (1º = cache frio, demais =
+    reruns normais de quem usa a página). Cada página começa com backend e
+    caches novos. O tracemalloc deixa tudo ~2-3x mais lento: compare tempos
+    só entre execuções com a mesma opção.
+    """
+    backend = CountingBackend(MemoryBackend(data))
+    utils_casulo.use_backend(backend)
+    st.cache_data.clear()
+
+    at = AppTest.from_file(str(ROOT / PAGES[page]), default_timeout=timeout)
+    out = []
+    for i in range(reruns):
+        backend.calls.clear()
+        if trace_mem:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        try:
+            at.run()
+            erros, estourou = [str(e.value) for e in at.exception], False
+        except RuntimeError as e:  # AppTest: "script run timed out"
+            erros, estourou = [str(e)], True
+        wall = time.perf_counter() - t0
+        peak = tracemalloc.get_traced_memory()[1] if trace_mem else 0
+        if trace_mem:
+            tracemalloc.stop()
+        out.append({
+            "rerun": i,
+            "wall_s": round(wall, 4),
+            "peak_mb": round(peak / 2**20, 2) if trace_mem else None,
+            "backend_calls": sum(backend.calls.values()),
+            "calls_by_method": dict(sorted(backend.calls.items())),
+            "timeout": estourou,
+            "errors": erros,
+        })
+        if estourou:
+            break  # o script segue rodando na thread do AppTest; não dá p/ medir outro rerun
+    return out
+
+
+def run(rows: list[int], pages: list[str], reruns: int, timeout: float, trace_mem: bool = True) -> dict:
+    resultados = []
+    for n in rows:
+        data = clinic(n)
+        check_totals(data)  # parser de dinheiro errado invalida o benchmark (totais inflados)
+        tamanhos = {t: int(len(df)) for t, df in data.items()}
+        for page in pages:
+            print(f"  {page:<16} {n:>8} sessões ...", end=" ", flush=True)
+            medidas = bench_page(page, data, reruns, timeout, trace_mem)
+            print(" | ".join(f"{m['wall_s']:.2f}s {m['peak_mb'] or 0:.0f}MB {m['backend_calls']}c"
+                             + (" TIMEOUT" if m["timeout"] else "") for m in medidas))
+            resultados.append({"page": page, "rows": n, "tables": tamanhos, "reruns": medidas})
+    utils_casulo.use_backend(None)
+    return {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "streamlit": st.__version__,
+            "platform": platform.platform(),
+            "reruns": reruns,
+            "trace_mem": trace_mem,
+        },
+        "results": resultados,
+    }
+
+
+# =========================
+# Comparação entre execuções
+# =========================
+def _por_chave(doc: dict) -> dict[tuple, dict]:
+    return {(r["page"], r["rows"]): r for r in doc.get("results", [])}
+
+
+def compare(atual: dict, anterior: dict) -> None:
+    """Imprime tempo (1º rerun e mediana dos demais) e memória contra uma execução anterior."""
+    def _resumo(r):
+        ws = [m["wall_s"] for m in r["reruns"]]
+        quente = sorted(ws[1:])[len(ws[1:]) // 2] if len(ws) > 1 else ws[0]
+        return ws[0], quente, max(m["peak_mb"] or 0 for m in r["reruns"])
+
+    antes = _por_chave(anterior)
+    print(f"\nvs. {anterior['meta'].get('git')} ({anterior['meta'].get('started_at')})")
+    print(f"{'página':<16} {'sessões':>8} {'frio':>16} {'quente':>16} {'pico MB':>16}")
+    for chave, r in _por_chave(atual).items():
+        if chave not in antes:
+            continue
+        a, b = _resumo(antes[chave]), _resumo(r)
+        cols = [f"{x:.2f}→{y:.2f} ({(y / x - 1) * 100 if x else 0:+.0f}%)" for x, y in zip(a, b)]
+        print(f"{chave[0]:<16} {chave[1]:>8} " + " ".join(f"{c:>16}" for c in cols))
+
+
+def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--rows", type=int, nargs="+", default=ROWS_PADRAO, help="nº de sessões por clínica")
+    ap.add_argument("--pages", nargs="+", choices=list(PAGES), default=list(PAGES))
+    ap.add_argument("--reruns", type=int, default=3)
+    ap.add_argument("--timeout", type=float, default=300.0, help="limite por rerun (s)")
+    ap.add_argument("--no-mem", action="store_true", help="sem tracemalloc (tempos mais próximos do real)")
+    ap.add_argument("--out", type=Path, default=None, help="arquivo JSON de saída")
+    ap.add_argument("--compare", type=Path, default=None, help="JSON de uma execução anterior")
+    args = ap.parse_args(argv)
+
+    doc = run(args.rows, args.pages, args.reruns, args.timeout, not args.no_mem)
+    out = args.out or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(doc, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nResultados em {out}")
+    if args.compare:
+        compare(doc, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# bench/synth.py — Clínica sintética p/ benchmarks (pacientes, sessões, pagamentos, despesas)
+
+from __future__ import annotations
+
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils_schema import DESP_COLS, PAC_COLS, PAG_COLS, SES_COLS, apply_schema, typed_col  # noqa: E402
+
+# =========================
+# Vocabulário
+# =========================
+NOMES = ["Ana", "Bruno", "Carla", "Davi", "Elisa", "Felipe", "Gabriela", "Heitor", "Isabela", "João",
+         "Laura", "Miguel", "Nina", "Otávio", "Paula", "Rafael", "Sofia", "Theo", "Valentina", "Yuri"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Lima", "Pereira", "Costa", "Almeida", "Ribeiro", "Gomes"]
+PROFISSIONAIS = ["Fernanda", "Mariana", "Ricardo", "Júlia"]
+STATUS_SES = ["Agendada", "Confirmada", "Realizada", "Falta", "Cancelada"]
+PESO_SES = [0.15, 0.10, 0.65, 0.05, 0.05]
+TIPOS = ["Terapia", "Avaliação", "Orientação", "Reavaliação"]
+FORMAS = ["Pix", "Cartão de crédito", "Cartão de débito", "Dinheiro", "Transferência"]
+TAXAS_CARTAO = [1.99, 3.49]  # % da maquininha
+TOTAIS_ATTR = "totals"  # df.attrs[TOTAIS_ATTR] = {coluna: soma dos valores gerados (antes de virar texto)}
+CATEGORIAS = ["Aluguel", "Material", "Impostos", "Salários", "Marketing", "Manutenção"]
+
+
+def _datas(rng: np.random.Generator, n: int, inicio: date, fim: date) -> np.ndarray:
+    dias = rng.integers(0, (fim - inicio).days + 1, n)
+    return (pd.Timestamp(inicio) + pd.to_timedelta(dias, unit="D")).to_numpy()
+
+
+def _br(ts: np.ndarray) -> pd.Series:
+    return pd.Series(pd.DatetimeIndex(ts).strftime("%d/%m/%Y"))
+
+
+def _dinheiro(rng: np.random.Generator, v: np.ndarray) -> pd.Series:
+    """Mistura os formatos que aparecem na planilha: "R$ 1.234,56", "1234,56" e "1234.56"."""
+    br = pd.Series(v).map(lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."))
+    estilo = rng.integers(0, 3, len(v))
+    out = np.where(estilo == 0, "R$ " + br, np.where(estilo == 1, br.str.replace(".", "", regex=False),
+                                                     pd.Series(v).map("{:.2f}".format)))
+    return pd.Series(out)
+
+
+# =========================
+# Gerador
+# =========================
+def clinic(sessions: int, patients: int | None = None, years: float = 3.0,
+           seed: int = 42, today: date | None = None) -> dict[str, pd.DataFrame]:
+    """
+    Clínica sintética com `sessions` sessões espalhadas em `years` anos até
+    `today` (+4 semanas de agenda futura). Por padrão 1 paciente a cada 20
+    sessões, ~0,8 pagamento por sessão e 1 despesa a cada 10 sessões.
+    Retorna {título da aba: DataFrame[str]} com as colunas de utils_schema;
+    Pagamentos e Despesas trazem em attrs["totals"] a soma exata de cada
+    coluna de dinheiro (ver `check_totals`).
+    """
+    rng = np.random.default_rng(seed)
+    today = today or date.today()
+    inicio = today - timedelta(days=int(365 * years))
+    fim = today + timedelta(weeks=4)
+    n_pac = patients or max(10, sessions // 20)
+    n_pag = int(sessions * 0.8)
+    n_desp = max(1, sessions // 10)
+
+    pids = np.array([f"P-{i:06d}" for i in range(n_pac)])
+    nasc = _datas(rng, n_pac, date(2010, 1, 1), date(2022, 12, 31))
+    pac = pd.DataFrame({
+        "PacienteID": pids,
+        "Nome": [f"{NOMES[a]} {SOBRENOMES[b]}" for a, b in zip(rng.integers(0, len(NOMES), n_pac),
+                                                              rng.integers(0, len(SOBRENOMES), n_pac))],
+        "DataNascimento": _br(nasc),
+        "Responsavel": [f"{NOMES[a]} {SOBRENOMES[b]}" for a, b in zip(rng.integers(0, len(NOMES), n_pac),
+                                                                     rng.integers(0, len(SOBRENOMES), n_pac))],
+        "Telefone": [f"(11) 9{x:04d}-{y:04d}" for x, y in zip(rng.integers(0, 10_000, n_pac),
+                                                              rng.integers(0, 10_000, n_pac))],
+        "Email": [f"contato{i}@exemplo.com" for i in range(n_pac)],
+        "Diagnostico": rng.choice(["TEA", "TDAH", "Atraso de fala", "Dislexia", ""], n_pac),
+        "Convenio": rng.choice(["Particular", "Unimed", "Amil", "SulAmérica"], n_pac),
+        "Status": rng.choice(["Ativo", "Inativo"], n_pac, p=[0.8, 0.2]),
+        "Prioridade": rng.choice(["Alta", "Média", "Baixa"], n_pac),
+        "FotoURL": "",
+        "Observacoes": rng.choice(["", "Prefere manhã", "Acompanhar evolução da fala"], n_pac),
+    })
+
+    hi = rng.integers(8 * 60, 18 * 60, sessions) // 10 * 10
+    ses = pd.DataFrame({
+        "SessaoID": [f"S-{i:07d}" for i in range(sessions)],
+        "PacienteID": rng.choice(pids, sessions),
+        "Data": _br(_datas(rng, sessions, inicio, fim)),
+        "HoraInicio": [f"{m // 60:02d}:{m % 60:02d}" for m in hi],
+        "HoraFim": [f"{m // 60:02d}:{m % 60:02d}" for m in hi + 50],
+        "Profissional": rng.choice(PROFISSIONAIS, sessions),
+        "Status": rng.choice(STATUS_SES, sessions, p=PESO_SES),
+        "Tipo": rng.choice(TIPOS, sessions),
+        "ObjetivosTrabalhados": rng.choice(["", "Atenção compartilhada", "Coordenação motora"], sessions),
+        "Observacoes": "",
+        "AnexosURL": "",
+    })
+
+    # como a página de Pagamentos calcula: líquido = bruto - bruto * taxa% / 100, sem
+    # arredondar (o que ela gravava antes do round; "144.765" p/ 3,49% de 150)
+    bruto = rng.choice([120.0, 150.0, 180.0, 200.0, 250.0], n_pag)
+    forma = rng.choice(FORMAS, n_pag)
+    pct = np.where(pd.Series(forma).str.startswith("Cartão"), rng.choice(TAXAS_CARTAO, n_pag), 0.0)
+    taxa = bruto * pct / 100.0
+    liquido = bruto - taxa
+    pag = pd.DataFrame({
+        "PagamentoID": [f"G-{i:07d}" for i in range(n_pag)],
+        "PacienteID": rng.choice(pids, n_pag),
+        "Data": _br(_datas(rng, n_pag, inicio, today)),
+        "Forma": forma,
+        "Bruto": _dinheiro(rng, bruto),
+        "Liquido": np.where(pct > 0, pd.Series(liquido).map(str), _dinheiro(rng, liquido)),
+        "TaxaValor": _dinheiro(rng, np.round(taxa, 2)),
+        "TaxaPct": pd.Series(np.round(pct, 2)).map("{:.2f}".format),
+        "Referencia": "",
+        "Obs": "",
+        "ReciboURL": "",
+    })
+
+    valor = np.round(rng.uniform(50, 5000, n_desp), 2)
+    desp = pd.DataFrame({
+        "DespesaID": [f"D-{i:06d}" for i in range(n_desp)],
+        "Data": _br(_datas(rng, n_desp, inicio, today)),
+        "Categoria": rng.choice(CATEGORIAS, n_desp),
+        "Descricao": "Despesa sintética",
+        "Fornecedor": rng.choice(["Fornecedor A", "Fornecedor B", "Imobiliária"], n_desp),
+        "Forma": rng.choice(FORMAS, n_desp),
+        "Valor": _dinheiro(rng, valor),
+        "CentroCusto": rng.choice(["Clínica", "Administrativo"], n_desp),
+        "Pago": rng.choice(["TRUE", "FALSE"], n_desp, p=[0.9, 0.1]),
+        "Referencia": "", "Obs": "", "ComprovanteURL": "", "RecorrenteID": "", "Parcela": "",
+    })
+
+    out = {
+        "Pacientes": pac[PAC_COLS],
+        "Sessoes": ses[SES_COLS],
+        "Pagamentos": pag[PAG_COLS],
+        "Despesas": desp[DESP_COLS],
+    }
+    out["Pagamentos"].attrs[TOTAIS_ATTR] = {"Bruto": float(bruto.sum()), "Liquido": float(liquido.sum()),
+                                            "TaxaValor": float(np.round(taxa, 2).sum())}
+    out["Despesas"].attrs[TOTAIS_ATTR] = {"Valor": float(valor.sum())}
+    return out
+
+
+def check_totals(data: dict[str, pd.DataFrame], tol: float = 0.01) -> dict[str, dict[str, float]]:
+    """
+    Confere que o frame tipado (utils_schema) soma o mesmo que os valores
+    gerados, coluna a coluna. Levanta AssertionError com as diferenças;
+    retorna {aba: {coluna: soma}} se bater.
+    """
+    out, erros = {}, []
+    for title, df in data.items():
+        esperado = df.attrs.get(TOTAIS_ATTR)
+        if not esperado:
+            continue
+        typed = apply_schema(df, title)
+        out[title] = {}
+        for col, soma in esperado.items():
+            got = float(typed[typed_col(col)].sum())
+            out[title][col] = got
+            if abs(got - soma) > tol:
+                erros.append(f"{title}.{col}: tipado {got:.2f} x gerado {soma:.2f}")
+    if erros:
+        raise AssertionError("Totais não batem: " + "; ".join(erros))
+    return out
+
+
+__all__ = ["clinic", "check_totals"]
@@ -1,11 +1,13 @@
 # pages/00_Cadastrar_Paciente.py
 import streamlit as st
-from utils_casulo import connect, read_ws, append_rows, new_id
+from utils_casulo import connect, read_ws, append_rows, invalidate_ws, new_id, journal_sidebar, saved_notice
+from utils_perf import perf_panel
 
 st.set_page_config(page_title="Casulo — Cadastrar Paciente", page_icon="📝", layout="wide")
 st.title("📝 Cadastrar Paciente")
 
 ss = connect()
+journal_sidebar(ss)
 
 PAC_COLS = [
     "PacienteID","Nome","DataNascimento","Responsavel","Telefone","Email",
@@ -44,6 +46,8 @@ if salvar:
         "Diagnostico": diag.strip(), "Convenio": conv.strip(), "Status": status.strip(),
         "Prioridade": prio.strip(), "FotoURL": foto.strip(), "Observacoes": obs.strip(),
     }], default_headers=PAC_COLS)
-    st.success(f"✅ Paciente cadastrado: **{nome}** (ID: {pid})")
-    st.cache_data.clear()
+    saved_notice(ws_pac, f"✅ Paciente cadastrado: **{nome}** (ID: {pid})")
+    invalidate_ws(ws_pac)
     st.button("Cadastrar outro", on_click=lambda: st.rerun())
+
+perf_panel()
@@ -1,6 +1,6 @@
 # pages/01_Pacientes.py
 # -*- coding: utf-8 -*-
-import re, io
+import re, io, time
 from datetime import datetime
 import pandas as pd
 import streamlit as st
@@ -8,7 +8,9 @@ import gspread
 from gspread.exceptions import APIError
 import requests  # Telegram
 
-from utils_casulo import connect, read_ws, append_rows, new_id
+from utils_casulo import (connect, read_ws, append_rows, update_by_id, update_many_by_id,
+                          diff_by_id, delete_by_id, invalidate_ws, new_id, journal_sidebar, saved_notice)
+from utils_perf import count_call, perf_panel
 
 st.set_page_config(page_title="Casulo — Pacientes", page_icon="👨‍👩‍👧", layout="wide")
 
@@ -73,6 +75,7 @@ def tg_send_photo(file_bytes: bytes | None = None, filename: str = "foto.jpg",
 
     try:
         url = f"https://api.telegram.org/bot{token}/sendPhoto"
+        t0 = time.perf_counter()
         if file_bytes is not None:
             files = {"photo": (filename, file_bytes, "image/jpeg")}
             data = {"chat_id": chat_id, "caption": caption, "parse_mode": "HTML"}
@@ -81,6 +84,7 @@ def tg_send_photo(file_bytes: bytes | None = None, filename: str = "foto.jpg",
             data = {"chat_id": chat_id, "photo": (photo_url or DEFAULT_LOGO_URL),
                     "caption": caption, "parse_mode": "HTML"}
             r = requests.post(url, data=data, timeout=60)
+        count_call("telegram", "sendPhoto", len(r.content or b""), t0)
         ok = (r.status_code == 200 and r.json().get("ok"))
         return ok, "" if ok else r.text
     except Exception as e:
@@ -136,6 +140,7 @@ st.markdown("""
 # Conexão + leitura robusta
 # =========================
 ss = connect()
+journal_sidebar(ss)
 
 def _render_perm_help(err: Exception):
     st.error("Falha de acesso à planilha (provável permissão/escopo).")
@@ -300,23 +305,21 @@ edited_df = st.data_editor(
     key="grid_pacientes",
 )
 
-# Mescla para salvar (grade)
-df_to_save = df.copy()
-orig_by_id = df_to_save.set_index("PacienteID")
-edit_by_id = edited_df.set_index("PacienteID")
-common_ids = edit_by_id.index.intersection(orig_by_id.index)
-orig_by_id.loc[common_ids, cols_show[1:]] = edit_by_id.loc[common_ids, cols_show[1:]]
-df_merged = orig_by_id.reset_index()
+# Diferença célula a célula (grade exibida x editada) -> só o que mudou vai p/ planilha
+mudancas = diff_by_id(df_view[cols_show], edited_df, "PacienteID", cols_show[1:])
 
 save_col1, save_col2 = st.columns([1,1])
 with save_col1:
-    if st.button("💾 Salvar alterações", type="primary", use_container_width=True):
+    if mudancas:
+        st.caption(f"{sum(len(v) for v in mudancas.values())} célula(s) alterada(s) em {len(mudancas)} paciente(s).")
+    if st.button("💾 Salvar alterações", type="primary", use_container_width=True, disabled=not mudancas):
         try:
-            out = df_merged[PAC_COLS].fillna("")
-            values = [PAC_COLS] + out.values.tolist()
-            ws.update("A1", values)
-            st.success("Alterações salvas na planilha ✅")
-            st.cache_data.clear(); st.rerun()
+            sumidos = update_many_by_id(ws, mudancas)
+            if sumidos:
+                st.warning(f"{len(sumidos)} paciente(s) não existem mais na planilha e foram ignorados: {', '.join(sumidos)}")
+            else:
+                saved_notice(ws, "Alterações salvas na planilha ✅")
+                st.rerun()
         except APIError as e:
             _render_perm_help(e); st.error("Erro do Google Sheets ao salvar.")
         except Exception as e:
@@ -324,7 +327,7 @@ with save_col1:
 
 with save_col2:
     # Exclusão por ID, exibindo nomes
-    pid_to_nome = {str(r["PacienteID"]): str(r["Nome"]) for _, r in df_to_save.iterrows()}
+    pid_to_nome = dict(zip(df["PacienteID"].astype(str), df["Nome"].astype(str)))
     options_ids = sorted(df_view["PacienteID"].unique().tolist())
     ids_para_excluir = st.multiselect(
         "Selecionar pacientes para apagar (mostra nomes)",
@@ -334,12 +337,9 @@ with save_col2:
     )
     if st.button("🗑️ Excluir selecionados", use_container_width=True, disabled=(len(ids_para_excluir)==0)):
         try:
-            df_drop = df_to_save[~df_to_save["PacienteID"].isin(ids_para_excluir)]
-            out = df_drop[PAC_COLS].fillna("")
-            values = [PAC_COLS] + out.values.tolist()
-            ws.update("A1", values)
-            st.success(f"{len(ids_para_excluir)} registro(s) excluído(s) ✅")
-            st.cache_data.clear(); st.rerun()
+            n = delete_by_id(ws, ids_para_excluir)
+            saved_notice(ws, f"{n} registro(s) excluído(s) ✅")
+            st.rerun()
         except APIError as e:
             _render_perm_help(e); st.error("Erro do Google Sheets ao excluir.")
         except Exception as e:
@@ -348,19 +348,12 @@ with save_col2:
 # =========================
 # Helpers de atualização por ID
 # =========================
-def _update_row_by_id(ws: gspread.Worksheet, df_full: pd.DataFrame, record: dict):
-    """Atualiza exatamente 1 linha na planilha (match por PacienteID)."""
+def _update_row_by_id(ws: gspread.Worksheet, record: dict):
+    """Atualiza exatamente 1 linha na planilha (linha achada pelo índice PacienteID -> linha)."""
     pid = str(record.get("PacienteID","")).strip()
     if not pid:
         raise ValueError("PacienteID vazio para update.")
-
-    idx = df_full.index[df_full["PacienteID"] == pid]
-    if len(idx) == 0:
-        raise ValueError(f"PacienteID {pid} não encontrado.")
-    row_idx = int(idx[0]) + 2  # +2 por causa do cabeçalho
-
-    row_vals = [record.get(col, "") for col in PAC_COLS]
-    ws.update(f"A{row_idx}:L{row_idx}", [row_vals])
+    update_by_id(ws, pid, {col: record.get(col, "") for col in PAC_COLS if col != "PacienteID"})
 
 # =========================
 # Detalhes rápidos + Edição individual
@@ -490,9 +483,9 @@ else:
                                 "FotoURL": e_foto.strip(),
                                 "Observacoes": e_obs.strip(),
                             }
-                            _update_row_by_id(ws, df, rec)
-                            st.success("Cadastro atualizado ✅")
-                            st.cache_data.clear(); st.rerun()
+                            _update_row_by_id(ws, rec)
+                            saved_notice(ws, "Cadastro atualizado ✅")
+                            st.rerun()
                         except APIError as e:
                             _render_perm_help(e); st.error("Erro do Google Sheets ao atualizar.")
                         except Exception as e:
@@ -544,7 +537,7 @@ with st.form("novo_paciente"):
                     "Observacoes": (obs or "").strip()
                 }
                 append_rows(ws, [record], default_headers=PAC_COLS)
-                st.success(f"Paciente cadastrado: {nome} ({pid}) ✅")
+                saved_notice(ws, f"Paciente cadastrado: {nome} ({pid}) ✅")
 
                 # --- Monta card para Telegram
                 caption = (
@@ -575,10 +568,12 @@ with st.form("novo_paciente"):
                 else:
                     st.caption(f"(Falha no Telegram: {err_tg})")
 
-                st.cache_data.clear()
+                invalidate_ws(ws)
                 st.rerun()
             except APIError as e:
                 _render_perm_help(e)
                 st.error("Erro do Google Sheets ao salvar novo paciente.")
             except Exception as e:
                 st.error(f"Erro ao salvar novo paciente: {e}")
+
+perf_panel()
@@ -2,15 +2,17 @@
 # pages/02_Paciente_Detalhe.py
 
 import io
+import time
 import os
 import base64
 import requests
-from datetime import datetime, date
+from datetime import date
 import pandas as pd
 import numpy as np
 import streamlit as st
 
-from utils_casulo import connect, read_ws, append_rows, new_id  # usa o appender SEGURO
+from utils_casulo import connect, read_many, append_rows, invalidate_ws, new_id, journal_sidebar, saved_notice  # usa o appender SEGURO
+from utils_perf import count_call, perf_panel
 
 # =========================
 # Config & constantes
@@ -89,7 +91,9 @@ def tg_send_pdf(file_bytes: bytes, filename: str, caption: str = "") -> tuple[bo
         url = f"https://api.telegram.org/bot{_tg_token()}/sendDocument"
         files = {"document": (filename, file_bytes, "application/pdf")}
         data = {"chat_id": _tg_chat_id(), "caption": (caption or "")[:1024]}
+        t0 = time.perf_counter()
         r = requests.post(url, data=data, files=files, timeout=60)
+        count_call("telegram", "sendDocument", len(r.content or b""), t0)
         ok = r.ok and r.json().get("ok")
         return (bool(ok), "" if ok else f"HTTP {r.status_code}: {r.text}")
     except Exception as e:
@@ -100,15 +104,6 @@ def tg_send_pdf(file_bytes: bytes, filename: str, caption: str = "") -> tuple[bo
 # =========================
 DATA_FMT = "%d/%m/%Y"
 
-def to_date(s):
-    if s is None: return None
-    s = str(s).strip()
-    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%Y/%m/%d"):
-        try:
-            return datetime.strptime(s, fmt).date()
-        except Exception:
-            pass
-    return None
 
 def brl(v: float) -> str:
     try:
@@ -117,10 +112,12 @@ def brl(v: float) -> str:
         return "R$ 0,00"
 
 def _clean(df: pd.DataFrame, cols: list[str] | None = None) -> pd.DataFrame:
-    """Higieniza NaN -> '', remove 'nan' textual, trim."""
+    """Higieniza NaN -> '' (só colunas texto; as tipadas "__*" ficam), remove 'nan' textual, trim."""
     if df is None or df.empty:
         return df
-    df = df.replace({np.nan: ""})
+    df = df.copy()
+    txt = df.select_dtypes(include=["object", "string"]).columns
+    df[txt] = df[txt].replace({np.nan: ""})
     if cols:
         for c in cols:
             if c in df.columns:
@@ -131,6 +128,7 @@ def _clean(df: pd.DataFrame, cols: list[str] | None = None) -> pd.DataFrame:
 # Leitura das planilhas
 # =========================
 ss = connect()
+journal_sidebar(ss)
 
 PAC_COLS = ["PacienteID","Nome","DataNascimento","Responsavel","Telefone","Email",
             "Diagnostico","Convenio","Status","Prioridade","FotoURL","Observacoes"]
@@ -144,10 +142,16 @@ PAG_COLS = ["PagamentoID","PacienteID","Data","Forma","Bruto","Liquido",
 # Relatórios do paciente (layout novo)
 REL_COLS = ["RelatorioID","PacienteID","Data","Tipo","Titulo","Autor","Texto","ArquivoURL"]
 
-df_pac, _ = read_ws(ss, "Pacientes",  PAC_COLS)
-df_ses, _ = read_ws(ss, "Sessoes",    SES_COLS)
-df_pag, _ = read_ws(ss, "Pagamentos", PAG_COLS)
-df_rel, ws_rel = read_ws(ss, "Relatorios", REL_COLS)  # cria se não existe
+sheets = read_many(ss, {
+    "Pacientes":  PAC_COLS,
+    "Sessoes":    SES_COLS,
+    "Pagamentos": PAG_COLS,
+    "Relatorios": REL_COLS,  # cria se não existe
+}, typed=True, archived=True)  # histórico completo do paciente, inclusive anos arquivados
+df_pac, _ = sheets["Pacientes"]
+df_ses, _ = sheets["Sessoes"]
+df_pag, _ = sheets["Pagamentos"]
+df_rel, ws_rel = sheets["Relatorios"]
 
 # limpeza
 df_pac = _clean(df_pac, ["Nome","FotoURL","Responsavel","Telefone","Diagnostico","Convenio","Status","Prioridade","Observacoes"])
@@ -197,9 +201,9 @@ df_ses_p = df_ses[df_ses["PacienteID"].astype(str) == pid].copy()
 df_pag_p = df_pag[df_pag["PacienteID"].astype(str) == pid].copy()
 df_rel_p = df_rel[df_rel["PacienteID"].astype(str) == pid].copy()
 
-df_ses_p["__dt"] = df_ses_p.get("Data","").apply(to_date)
-df_pag_p["__dt"] = df_pag_p.get("Data","").apply(to_date)
-df_pag_p["__liq"] = pd.to_numeric(df_pag_p.get("Liquido",0), errors="coerce").fillna(0)
+df_ses_p["__dt"] = df_ses_p["__Data"]
+df_pag_p["__dt"] = df_pag_p["__Data"]
+df_pag_p["__liq"] = df_pag_p["__Liquido"]
 
 total_sessoes = int(len(df_ses_p))
 realizadas = int((df_ses_p.get("Status","").astype(str).str.lower() == "realizada").sum())
@@ -212,7 +216,7 @@ k1.metric("Sessões", total_sessoes)
 k2.metric("Realizadas", realizadas)
 k3.metric("Recebido (líquido)", brl(recebido_liq))
 k4.metric("Relatórios", qtd_relatorios)
-k5.metric("Última sessão", ultima_sessao.strftime(DATA_FMT) if ultima_sessao else "-")
+k5.metric("Última sessão", ultima_sessao.strftime(DATA_FMT) if pd.notna(ultima_sessao) else "-")
 
 # =========================
 # Abas
@@ -224,7 +228,7 @@ tab_visao, tab_rel, tab_ses, tab_fin, tab_docs = st.tabs(
 # ---------- Visão geral ----------
 with tab_visao:
     st.subheader("Linha do tempo")
-    df_ses_p["__ord_h"] = pd.to_datetime(df_ses_p.get("HoraInicio",""), format="%H:%M", errors="coerce")
+    df_ses_p["__ord_h"] = df_ses_p["__HoraInicio"]
     df_ses_p = df_ses_p.sort_values(["__dt","__ord_h"], ascending=[True, True])
 
     s_status = df_ses_p.get("Status","").astype(str).str.lower()
@@ -254,8 +258,8 @@ with tab_visao:
 def _compose_md(rows: pd.DataFrame, nome_paciente: str) -> str:
     parts = [f"# Relatórios — {nome_paciente}", ""]
     for _, r in rows.iterrows():
-        d = to_date(r.get("Data"))
-        dtxt = d.strftime(DATA_FMT) if d else "-"
+        d = r.get("__Data")  # já convertida por apply_schema (typed=True)
+        dtxt = d.strftime(DATA_FMT) if pd.notna(d) else "-"
         parts += [
             f"## {dtxt} — {str(r.get('Tipo','-'))} · {str(r.get('Titulo','(sem título)'))}",
             f"**Autor:** {str(r.get('Autor','-'))}",
@@ -354,13 +358,13 @@ with tab_rel:
         ate = st.date_input("Até", value=None)
 
     rel_vis = df_rel_p.copy()
-    rel_vis["__dt"] = rel_vis.get("Data","").apply(to_date)
+    rel_vis["__dt"] = rel_vis["__Data"]
     if tipo_f != "(todos)":
         rel_vis = rel_vis[rel_vis.get("Tipo","").astype(str) == tipo_f]
     if de:
-        rel_vis = rel_vis[rel_vis["__dt"] >= de]
+        rel_vis = rel_vis[rel_vis["__dt"] >= pd.Timestamp(de)]
     if ate:
-        rel_vis = rel_vis[rel_vis["__dt"] <= ate]
+        rel_vis = rel_vis[rel_vis["__dt"] <= pd.Timestamp(ate)]
     rel_vis = rel_vis.sort_values("__dt", ascending=True)
 
     # Lista compacta + seleção
@@ -421,8 +425,8 @@ with tab_rel:
                 from docx import Document
                 doc = Document()
                 for _, r in rows_sel.iterrows():
-                    d = to_date(r.get("Data"))
-                    dtxt = d.strftime(DATA_FMT) if d else "-"
+                    d = r.get("__Data")
+                    dtxt = d.strftime(DATA_FMT) if pd.notna(d) else "-"
                     doc.add_heading(str(r.get("Titulo","(sem título)")), level=1)
                     doc.add_paragraph(f"{dtxt} • {str(r.get('Tipo','-'))} • {str(r.get('Autor','-'))}")
                     doc.add_paragraph(str(r.get("Texto","")))
@@ -469,8 +473,8 @@ with tab_rel:
                 "ArquivoURL": (arq_url or "").strip(),
             }
             append_rows(ws_rel, [row], default_headers=REL_COLS)
-            st.success(f"Relatório salvo ({rid}).")
-            st.cache_data.clear()
+            saved_notice(ws_rel, f"Relatório salvo ({rid}).")
+            invalidate_ws(ws_rel)
             st.rerun()
 
 # ---------- Sessões ----------
@@ -481,7 +485,7 @@ with tab_ses:
     else:
         show_cols = ["Data","HoraInicio","HoraFim","Profissional","Status","Tipo","ObjetivosTrabalhados","Observacoes"]
         show_cols = [c for c in show_cols if c in df_ses_p.columns]
-        df_ses_p["__ord_h"] = pd.to_datetime(df_ses_p.get("HoraInicio",""), format="%H:%M", errors="coerce")
+        df_ses_p["__ord_h"] = df_ses_p["__HoraInicio"]
         df_ses_p2 = df_ses_p.sort_values(["__dt","__ord_h"], ascending=[True, True])
         st.dataframe(df_ses_p2[show_cols], use_container_width=True, hide_index=True)
 
@@ -505,11 +509,13 @@ with tab_docs:
     if rel_com_link.empty:
         st.caption("Nenhum link anexado ainda (ArquivoURL está vazio nos relatórios).")
     else:
-        rel_com_link["__dt"] = rel_com_link.get("Data","").apply(to_date)
+        rel_com_link["__dt"] = rel_com_link["__Data"]
         rel_com_link = rel_com_link.sort_values("__dt")
         for _, r in rel_com_link.iterrows():
-            dtxt = (to_date(r.get("Data")).strftime(DATA_FMT) if to_date(r.get("Data")) else "-")
+            dtxt = r["__dt"].strftime(DATA_FMT) if pd.notna(r["__dt"]) else "-"
             url = str(r.get("ArquivoURL")).strip()
             titulo = (str(r.get("Titulo","")).strip() or "Documento")
             autor = (str(r.get("Autor","")).strip() or nome_sel)
             st.markdown(f"- **{dtxt}** — {autor} · [{titulo}]({url})")
+
+perf_panel()
@@ -1,7 +1,10 @@
 # pages/03_Sessoes.py
 import streamlit as st
+import pandas as pd
 from datetime import date, datetime, timedelta, time
-from utils_casulo import connect, read_ws, append_rows, new_id
+from utils_casulo import connect, read_ws_concurrent, session_index, ws_handle, append_rows, update_by_id, delete_by_id, invalidate_ws, new_id, new_ids, journal_sidebar, saved_notice
+from utils_perf import perf_panel, span
+from utils_agenda import ABA_COL
 
 st.set_page_config(page_title="Casulo — Sessões", page_icon="📅", layout="wide")
 st.title("📅 Sessões")
@@ -42,81 +45,86 @@ STATUS_OPTS = ["Agendada","Confirmada","Realizada","Falta","Cancelada"]
 
 # ================= dados =================
 ss = connect()
+journal_sidebar(ss)
 PAC_COLS = ["PacienteID","Nome","DataNascimento","Responsavel","Telefone","Email",
             "Diagnostico","Convenio","Status","Prioridade","FotoURL","Observacoes"]
 SES_COLS = ["SessaoID","PacienteID","Data","HoraInicio","HoraFim","Profissional","Status",
             "Tipo","ObjetivosTrabalhados","Observacoes","AnexosURL"]
 
-df_pac, _ = read_ws(ss, "Pacientes", PAC_COLS)
-df_ses, ws = read_ws(ss, "Sessoes", SES_COLS)
+sheets = read_ws_concurrent(ss, {
+    "Pacientes": {"expected_cols": PAC_COLS, "usecols": ["PacienteID","Nome"], "typed": True},  # só o que as junções usam (= session_index)
+    "Sessoes": {"expected_cols": SES_COLS, "typed": True},
+})
+df_pac, _ = sheets["Pacientes"]
+_, ws = sheets["Sessoes"]
 
-# mapeia header -> índice de coluna (para update)
-headers = ws.row_values(1)
-col_idx = {h: i+1 for i, h in enumerate(headers)}  # 1-based
-
-# coluna auxiliar com número da linha na planilha
-df_ses = df_ses.copy()
-df_ses["__rownum"] = df_ses.index + 2  # header é linha 1 na planilha
-df_ses["__d"] = df_ses["Data"].apply(parse_br_date)
+# recortes por dia/semana saem do índice (ordenado por data e hora, já com o Nome),
+# que inclui as abas de arquivo dos anos pedidos; edições/exclusões vão pelo
+# SessaoID na aba de onde a sessão veio (a viva ou um arquivo "Sessoes_2024")
+def ws_da_sessao(r):
+    aba = str(r.get(ABA_COL, "") or "Sessoes")
+    return ws if aba == "Sessoes" else ws_handle(ss, aba)
 
 # ================= agenda semanal (calendário) =================
 st.subheader("🗓️ Agenda (semana)")
 
 if "week_offset" not in st.session_state:
     st.session_state.week_offset = 0
-c_prev, c_today, c_next = st.columns(3)
-if c_prev.button("← Semana anterior", use_container_width=True):
-    st.session_state.week_offset -= 1; st.rerun()
-if c_today.button("Hoje", use_container_width=True):
-    st.session_state.week_offset = 0; st.rerun()
-if c_next.button("Próxima semana →", use_container_width=True):
-    st.session_state.week_offset += 1; st.rerun()
-
-anchor = date.today() + timedelta(weeks=st.session_state.week_offset)
-ini_sem, fim_sem = week_bounds(anchor)
-st.caption(f"Semana: **{br_date(ini_sem)} → {br_date(fim_sem)}**")
-
-semana = df_ses[(df_ses["__d"] >= ini_sem) & (df_ses["__d"] <= fim_sem)].copy()
-semana = semana.merge(df_pac[["PacienteID","Nome"]], on="PacienteID", how="left")
-
-# tenta exibir com plotly; senão, lista
-try:
-    import plotly.express as px
-    import pandas as pd
-
-    if not semana.empty:
-        def _dt(row):
-            d = row["__d"] or ini_sem
-            hi = parse_hhmm(row.get("HoraInicio","")) or time(0,0)
-            hf = parse_hhmm(row.get("HoraFim",""))
-            end_dt = datetime.combine(d, hf) if hf else (datetime.combine(d, hi) + timedelta(minutes=50))
-            return datetime.combine(d, hi), end_dt
-
-        starts, ends = zip(*semana.apply(_dt, axis=1)) if not semana.empty else ([],[])
-        semana["__start"] = list(starts); semana["__end"] = list(ends)
-        semana["__day"] = semana["__d"].apply(lambda d: WEEKDAYS_PT[d.weekday()] if d else "-")
-        fig = px.timeline(
-            semana, x_start="__start", x_end="__end", y="__day", color="Nome",
-            hover_data={"Data":True,"HoraInicio":True,"HoraFim":True,"Profissional":True,"Status":True,"Tipo":True}
-        )
-        fig.update_yaxes(categoryorder='array', categoryarray=WEEKDAYS_PT)
-        fig.update_layout(height=420, showlegend=True, xaxis_title=None, yaxis_title=None)
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.info("Sem sessões nesta semana.")
-except Exception:
-    if semana.empty:
-        st.info("Sem sessões nesta semana.")
-    else:
-        for i in range(7):
-            d = ini_sem + timedelta(days=i)
-            dd = semana[semana["__d"] == d].copy()
-            if dd.empty: continue
-            st.markdown(f"**{WEEKDAYS_PT[d.weekday()]} — {br_date(d)}**")
-            dd = dd.sort_values("HoraInicio")
-            cols = ["HoraInicio","HoraFim","Nome","Profissional","Tipo","Status"]
-            cols = [c for c in cols if c in dd.columns]
-            st.dataframe(dd[cols], use_container_width=True, hide_index=True)
+
+def mover_semana(passo: int | None) -> None:
+    st.session_state.week_offset = 0 if passo is None else st.session_state.week_offset + passo
+
+# trocar de semana reexecuta só este fragmento (as abas abaixo não são redesenhadas);
+# o índice vem do cache em memória (só é remontado quando a aba muda)
+@st.fragment
+def agenda_semana() -> None:
+    c_prev, c_today, c_next = st.columns(3)
+    c_prev.button("← Semana anterior", use_container_width=True, on_click=mover_semana, args=(-1,))
+    c_today.button("Hoje", use_container_width=True, on_click=mover_semana, args=(None,))
+    c_next.button("Próxima semana →", use_container_width=True, on_click=mover_semana, args=(1,))
+
+    anchor = date.today() + timedelta(weeks=st.session_state.week_offset)
+    ini_sem, fim_sem = week_bounds(anchor)
+    st.caption(f"Semana: **{br_date(ini_sem)} → {br_date(fim_sem)}**")
+
+    semana = session_index(ss, ini_sem, fim_sem).window(ini_sem, fim_sem)
+    semana["__d"] = semana["__Data"]
+
+    with span("chart", "agenda da semana"):
+        # tenta exibir com plotly; senão, lista
+        try:
+            import plotly.express as px
+
+            if not semana.empty:
+                hi_min = semana["__HoraInicio"].fillna(0).astype("int64")
+                semana["__start"] = semana["__d"] + pd.to_timedelta(hi_min, unit="m")
+                semana["__end"] = (semana["__d"] + pd.to_timedelta(semana["__HoraFim"].astype("float64"), unit="m")
+                                   ).fillna(semana["__start"] + pd.Timedelta(minutes=50))
+                semana["__day"] = semana["__d"].dt.weekday.map(dict(enumerate(WEEKDAYS_PT))).fillna("-")
+                fig = px.timeline(
+                    semana, x_start="__start", x_end="__end", y="__day", color="Nome",
+                    hover_data={"Data":True,"HoraInicio":True,"HoraFim":True,"Profissional":True,"Status":True,"Tipo":True}
+                )
+                fig.update_yaxes(categoryorder='array', categoryarray=WEEKDAYS_PT)
+                fig.update_layout(height=420, showlegend=True, xaxis_title=None, yaxis_title=None)
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("Sem sessões nesta semana.")
+        except Exception:
+            if semana.empty:
+                st.info("Sem sessões nesta semana.")
+            else:
+                for i in range(7):
+                    d = ini_sem + timedelta(days=i)
+                    dd = semana[semana["__d"] == pd.Timestamp(d)].copy()
+                    if dd.empty: continue
+                    st.markdown(f"**{WEEKDAYS_PT[d.weekday()]} — {br_date(d)}**")
+                    dd = dd.sort_values("HoraInicio")
+                    cols = ["HoraInicio","HoraFim","Nome","Profissional","Tipo","Status"]
+                    cols = [c for c in cols if c in dd.columns]
+                    st.dataframe(dd[cols], use_container_width=True, hide_index=True)
+
+agenda_semana()
 
 st.divider()
 
@@ -149,7 +157,8 @@ with tab_pontual:
         if hf and to_min(hf) <= to_min(hi): st.error("**Hora fim** > **Hora início**."); st.stop()
 
         data_str = br_date(data_sel)
-        mesmo_dia = df_ses[(df_ses["PacienteID"].astype(str)==pid) & (df_ses["Data"].astype(str).str.strip()==data_str)]
+        mesmo_dia = session_index(ss, data_sel, data_sel).day(data_sel)
+        mesmo_dia = mesmo_dia[mesmo_dia["PacienteID"].astype(str)==pid]
         conflito = False
         for _, r in mesmo_dia.iterrows():
             e_hi = parse_hhmm(r.get("HoraInicio",""))
@@ -166,8 +175,8 @@ with tab_pontual:
             "Profissional": prof.strip(), "Status": status.strip(), "Tipo": tipo.strip(),
             "ObjetivosTrabalhados": objetivos.strip(), "Observacoes": obs.strip(), "AnexosURL": anexos.strip()
         }], default_headers=SES_COLS)
-        st.success(f"Sessão salva para **{nome_sel}** ({sid})")
-        st.cache_data.clear(); st.rerun()
+        saved_notice(ws, f"Sessão salva para **{nome_sel}** ({sid})")
+        invalidate_ws(ws); st.rerun()
 
 # ---------- Agendar recorrente ----------
 with tab_rec:
@@ -198,13 +207,15 @@ with tab_rec:
         if not dias_semana: st.error("Escolha ao menos um dia da semana."); st.stop()
 
         start_week, _ = week_bounds(data_ini)
+        idx = session_index(ss, start_week, start_week + timedelta(weeks=semanas))
         criadas, puladas = [], []
         for w in range(semanas):
             base = start_week + timedelta(weeks=w)
             for dow in sorted(dias_semana):
                 d = base + timedelta(days=dow)
                 data_str = br_date(d)
-                mesmo_dia = df_ses[(df_ses["PacienteID"].astype(str)==pid_r) & (df_ses["Data"].astype(str).str.strip()==data_str)]
+                mesmo_dia = idx.day(d)
+                mesmo_dia = mesmo_dia[mesmo_dia["PacienteID"].astype(str)==pid_r]
                 tem_conf = False
                 for _, r in mesmo_dia.iterrows():
                     e_hi = parse_hhmm(r.get("HoraInicio",""))
@@ -213,7 +224,7 @@ with tab_rec:
                     if overlap(hi, hf, e_hi, e_hf): tem_conf=True; break
                 if tem_conf: puladas.append(data_str); continue
                 criadas.append({
-                    "SessaoID": new_id("S"), "PacienteID": pid_r, "Data": data_str,
+                    "SessaoID": "", "PacienteID": pid_r, "Data": data_str,
                     "HoraInicio": hi_r.strip(), "HoraFim": hf_r.strip(),
                     "Profissional": prof_r.strip(), "Status": status_r.strip(), "Tipo": tipo_r.strip(),
                     "ObjetivosTrabalhados": "", "Observacoes": obs_r.strip(), "AnexosURL": ""
@@ -222,10 +233,12 @@ with tab_rec:
             st.warning("Nenhuma sessão criada (todas conflitaram?).")
             if puladas: st.caption(f"Puladas: {len(puladas)}")
             st.stop()
+        for r, sid in zip(criadas, new_ids("S", len(criadas))):  # IDs em lote: únicos e em ordem
+            r["SessaoID"] = sid
         append_rows(ws, criadas, default_headers=SES_COLS)
-        st.success(f"✅ Criadas {len(criadas)} sessões recorrentes para **{nome_r}**.")
+        saved_notice(ws, f"✅ Criadas {len(criadas)} sessões recorrentes para **{nome_r}**.")
         if puladas: st.info(f"⚠️ {len(puladas)} data(s) ignoradas por conflito.")
-        st.cache_data.clear(); st.rerun()
+        invalidate_ws(ws); st.rerun()
 
 # ---------- Check-in / Confirmação ----------
 with tab_check:
@@ -236,7 +249,7 @@ with tab_check:
     with coly:
         filtro_prof = st.text_input("Filtrar por profissional (opcional)", "", key="chk_prof")
 
-    hoje_df = df_ses[df_ses["__d"] == dia_chk].merge(df_pac[["PacienteID","Nome"]], on="PacienteID", how="left")
+    hoje_df = session_index(ss, dia_chk, dia_chk).day(dia_chk)
     if filtro_prof.strip():
         hoje_df = hoje_df[hoje_df["Profissional"].astype(str).str.contains(filtro_prof.strip(), case=False, na=False)]
     hoje_df = hoje_df.sort_values(["HoraInicio","Nome"])
@@ -245,35 +258,35 @@ with tab_check:
         st.info("Sem sessões nesse dia.")
     else:
         for _, r in hoje_df.iterrows():
-            sid = r["SessaoID"]; rownum = int(r["__rownum"])
+            sid = r["SessaoID"]
             nome = r.get("Nome","-"); hi = r.get("HoraInicio","--"); hf = r.get("HoraFim","")
             prof = r.get("Profissional",""); status_atual = r.get("Status","Agendada")
             col1, col2, col3, col4, col5 = st.columns([3,1,1,1,1])
             with col1:
                 st.markdown(f"**{nome}** — {hi}{('–'+hf) if hf else ''}  \n_{status_atual}_  • {prof}")
             if col2.button("Confirmar", key=f"b_conf_{sid}"):
-                ws.update_cell(rownum, col_idx["Status"], "Confirmada"); st.cache_data.clear(); st.rerun()
+                update_by_id(ws_da_sessao(r), sid, {"Status": "Confirmada"}); st.rerun()
             if col3.button("Realizada", key=f"b_real_{sid}"):
-                ws.update_cell(rownum, col_idx["Status"], "Realizada"); st.cache_data.clear(); st.rerun()
+                update_by_id(ws_da_sessao(r), sid, {"Status": "Realizada"}); st.rerun()
             if col4.button("Falta", key=f"b_falta_{sid}"):
-                ws.update_cell(rownum, col_idx["Status"], "Falta"); st.cache_data.clear(); st.rerun()
+                update_by_id(ws_da_sessao(r), sid, {"Status": "Falta"}); st.rerun()
             if col5.button("Cancelar", key=f"b_canc_{sid}"):
-                ws.update_cell(rownum, col_idx["Status"], "Cancelada"); st.cache_data.clear(); st.rerun()
+                update_by_id(ws_da_sessao(r), sid, {"Status": "Cancelada"}); st.rerun()
 
 st.divider()
 
 # ---------- Editar / Apagar ----------
 with tab_edit:
     st.markdown("### 🛠️ Editar ou Apagar sessão")
+    # abre na semana da agenda (a do último rerun da página inteira)
+    ini_sem, fim_sem = week_bounds(date.today() + timedelta(weeks=st.session_state.week_offset))
     colf1, colf2 = st.columns(2)
     with colf1:
         de = st.date_input("De", value=ini_sem)
     with colf2:
         ate = st.date_input("Até", value=fim_sem)
 
-    faixa = df_ses[(df_ses["__d"] >= de) & (df_ses["__d"] <= ate)].merge(
-        df_pac[["PacienteID","Nome"]], on="PacienteID", how="left"
-    ).copy()
+    faixa = session_index(ss, de, ate).window(de, ate)
 
     if faixa.empty:
         st.info("Nenhuma sessão no período selecionado.")
@@ -283,14 +296,14 @@ with tab_edit:
         def _label(r):
             return f"{r['Data']} • {r.get('HoraInicio','--')}–{r.get('HoraFim','--')} • {r.get('Nome','-')} • {r.get('Profissional','') or 'Prof.'} • {r.get('Status','') or ''}"
 
-        options = { _label(r): (r["SessaoID"], int(r["__rownum"])) for _, r in faixa.iterrows() }
+        options = { _label(r): r["SessaoID"] for _, r in faixa.iterrows() }
         escolha = st.selectbox("Escolha a sessão", list(options.keys()))
-        sid_sel, rownum = options.get(escolha, (None, None))
+        sid_sel = options.get(escolha)
 
-        if sid_sel and rownum:
-            linha = df_ses[df_ses["SessaoID"] == sid_sel].head(1).iloc[0]
+        if sid_sel:
+            linha = faixa[faixa["SessaoID"] == sid_sel].head(1).iloc[0]
 
-            st.markdown(f"**Sessão:** `{sid_sel}`  •  Linha: {rownum}")
+            st.markdown(f"**Sessão:** `{sid_sel}`")
             with st.form("edit_form"):
                 data_e = st.date_input("Data", value=parse_br_date(linha["Data"]) or date.today())
                 hi_e = st.text_input("Hora início (HH:MM)", str(linha.get("HoraInicio","") or ""))
@@ -337,20 +350,18 @@ with tab_edit:
                     ("Observacoes", obs_e.strip()),
                     ("AnexosURL", anexos_e.strip()),
                 ]
-                for col, val in updates:
-                    ci = col_idx.get(col)
-                    if ci:
-                        ws.update_cell(rownum, ci, val)
+                ws_sel = ws_da_sessao(linha)
+                update_by_id(ws_sel, sid_sel, dict(updates))
 
-                st.success("Sessão atualizada com sucesso.")
-                st.cache_data.clear(); st.rerun()
+                saved_notice(ws_sel, "Sessão atualizada com sucesso.")
+                st.rerun()
 
             # etapa 1: marcar exclusão pendente
             if pedir_apagar:
                 st.session_state["__pending_delete"] = {
                     "sid": sid_sel,
-                    "rownum": int(rownum),
                     "desc": escolha,
+                    "aba": str(linha.get(ABA_COL, "") or "Sessoes"),
                 }
                 st.rerun()
 
@@ -362,13 +373,18 @@ if pend:
     col_c, col_x = st.columns(2)
     if col_c.button("✅ Confirmar exclusão", key="confirm_delete_btn", use_container_width=True):
         try:
-            ws.delete_rows(int(pend["rownum"]))
-            st.success("Sessão apagada.")
+            ws_del = ws_da_sessao({ABA_COL: pend.get("aba")})
+            if delete_by_id(ws_del, pend["sid"]):
+                saved_notice(ws_del, "Sessão apagada.")
+            else:
+                st.warning("Sessão não encontrada (talvez já tenha sido apagada).")
         except Exception as e:
             st.error(f"Erro ao apagar: {e}")
         finally:
             st.session_state.pop("__pending_delete", None)
-            st.cache_data.clear(); st.rerun()
+            st.rerun()
     if col_x.button("❌ Cancelar", key="cancel_delete_btn", use_container_width=True):
         st.session_state.pop("__pending_delete", None)
         st.info("Exclusão cancelada."); st.rerun()
+
+perf_panel()
@@ -2,7 +2,10 @@
 import streamlit as st
 import pandas as pd
 from datetime import date, datetime
-from utils_casulo import connect, read_ws, append_rows, new_id
+from utils_casulo import connect, read_ws_concurrent, read_range, rollup, append_rows, update_by_id, delete_by_id, invalidate_ws, new_id, journal_sidebar, saved_notice
+from utils_perf import perf_panel, span
+from utils_ui import warn_unparsed
+from utils_rollup import MES_COL, aligned_months
 
 st.set_page_config(page_title="Casulo — Pagamentos", page_icon="💳", layout="wide")
 st.title("💳 Pagamentos")
@@ -30,21 +33,22 @@ def _parse_dt_br(s: str):
 
 # ---------------- dados ----------------
 ss = connect()
+journal_sidebar(ss)
 PAC_COLS = ["PacienteID","Nome","DataNascimento","Responsavel","Telefone","Email",
             "Diagnostico","Convenio","Status","Prioridade","FotoURL","Observacoes"]
 PAG_COLS = ["PagamentoID","PacienteID","Data","Forma","Bruto","Liquido","TaxaValor","TaxaPct","Referencia","Obs","ReciboURL"]
 
-df_pac, _ = read_ws(ss, "Pacientes", PAC_COLS)
-df_pag, ws = read_ws(ss, "Pagamentos", PAG_COLS)
-
-# índices de coluna p/ update
-headers = ws.row_values(1)
-col_idx = {h: i+1 for i, h in enumerate(headers)}  # 1-based
+sheets = read_ws_concurrent(ss, {
+    "Pacientes": {"expected_cols": PAC_COLS, "usecols": ["PacienteID","Nome"]},  # só o que as junções usam
+    "Pagamentos": {"expected_cols": PAG_COLS, "typed": True},
+})
+df_pac, _ = sheets["Pacientes"]
+df_pag, ws = sheets["Pagamentos"]
+warn_unparsed(df_pag, "Pagamentos")  # valores que entrariam como 0 nos totais
 
 # prepara df
 df_pag = df_pag.copy()
-df_pag["__rownum"] = df_pag.index + 2  # header na linha 1
-df_pag["__d"] = df_pag["Data"].apply(_parse_dt_br)
+df_pag["__d"] = df_pag["__Data"]  # datetime64 (schema tipado)
 
 # ===================== TABS =====================
 tab_hist, tab_cad, tab_edit = st.tabs(["📚 Histórico & Relatórios", "📝 Registrar", "🛠️ Editar / Apagar"])
@@ -67,25 +71,21 @@ with tab_hist:
 
     ref_txt = st.text_input("Referência (contém, ex.: 09/2025)", "")
 
-    vis = df_pag.copy()
-    if de:
-        vis = vis[vis["__d"] >= de]
-    if ate:
-        vis = vis[vis["__d"] <= ate]
-    if filtro_nome.strip():
-        # junta nome
+    # intervalo de datas resolvido na fonte (consulta indexada quando há espelho local)
+    vis = read_range(ss, "Pagamentos", PAG_COLS, de or None, ate or None, typed=True)
+    vis["__d"] = vis["__Data"]
+    with span("merge", "pagamentos x pacientes"):
         vis = vis.merge(df_pac[["PacienteID","Nome"]], on="PacienteID", how="left")
+    if filtro_nome.strip():
         vis = vis[vis["Nome"].astype(str).str.contains(filtro_nome.strip(), case=False, na=False)]
-    else:
-        vis = vis.merge(df_pac[["PacienteID","Nome"]], on="PacienteID", how="left")
     if forma_sel != "(todas)":
         vis = vis[vis["Forma"].astype(str) == forma_sel]
     if ref_txt.strip():
         vis = vis[vis["Referencia"].astype(str).str.contains(ref_txt.strip(), case=False, na=False)]
 
-    # números
+    # números (já convertidos pelo schema: "R$ 1.234,56" -> 1234.56)
     for c in ["Bruto","Liquido","TaxaValor","TaxaPct"]:
-        vis[c] = pd.to_numeric(vis[c], errors="coerce").fillna(0.0)
+        vis[c] = vis[f"__{c}"]
 
     c1, c2, c3, c4 = st.columns(4)
     c1.metric("Pagamentos", f"{len(vis)}")
@@ -104,12 +104,19 @@ with tab_hist:
     st.markdown("---")
     st.markdown("#### 📊 Resumos")
     if not vis.empty:
-        tmp = vis.copy()
-        # mês/ano da data
-        tmp["MesRef"] = tmp["__d"].apply(lambda d: d.strftime("%Y-%m") if d else "")
+        # meses inteiros e só filtros que o rollup conhece -> tabela pré-agregada
+        meses = None if (filtro_nome.strip() or ref_txt.strip()) else aligned_months(de or None, ate or None)
+        if meses is not None:
+            tmp = rollup(ss, "Pagamentos", *meses).rename(columns={MES_COL: "MesRef"})
+            if forma_sel != "(todas)":
+                tmp = tmp[tmp["Forma"] == forma_sel]
+        else:
+            tmp = vis.copy()
+            # mês/ano da data
+            tmp["MesRef"] = tmp["__d"].dt.strftime("%Y-%m").fillna("")
         grp_mes = (tmp.groupby("MesRef", as_index=False)[["Bruto","Liquido","TaxaValor"]].sum()
                       .sort_values("MesRef", ascending=False))
-        grp_forma = (tmp.groupby("Forma", as_index=False)[["Bruto","Liquido","TaxaValor"]].sum()
+        grp_forma = (tmp.groupby("Forma", as_index=False, observed=True)[["Bruto","Liquido","TaxaValor"]].sum()
                        .sort_values("Liquido", ascending=False))
         col_a, col_b = st.columns(2)
         with col_a:
@@ -200,8 +207,8 @@ with tab_cad:
             "PacienteID": pid,
             "Data": data_pg.strftime("%d/%m/%Y"),
             "Forma": forma,
-            "Bruto": float(bruto),
-            "Liquido": float(liquido),
+            "Bruto": round(float(bruto), 2),
+            "Liquido": round(float(liquido), 2),
             "TaxaValor": round(float(taxa_val), 2),
             "TaxaPct": round(float(taxa_pct), 2),
             "Referencia": ref,
@@ -209,8 +216,8 @@ with tab_cad:
             "ReciboURL": ""
         }], default_headers=PAG_COLS)
 
-        st.success(f"Pagamento registrado para **{nome_sel}** ({pid_pg})")
-        st.cache_data.clear()
+        saved_notice(ws, f"Pagamento registrado para **{nome_sel}** ({pid_pg})")
+        invalidate_ws(ws)
         st.rerun()
 
 # ============================================================
@@ -233,8 +240,8 @@ with tab_edit:
     forma_f = st.selectbox("Forma", ["(todas)","Pix","Dinheiro","Cartão","Transferência"], index=0, key="ed_forma")
 
     lista = df_pag.copy()
-    if de_e:  lista = lista[lista["__d"] >= de_e]
-    if ate_e: lista = lista[lista["__d"] <= ate_e]
+    if de_e:  lista = lista[lista["__d"] >= pd.Timestamp(de_e)]
+    if ate_e: lista = lista[lista["__d"] <= pd.Timestamp(ate_e)]
     lista = lista.merge(df_pac[["PacienteID","Nome"]], on="PacienteID", how="left")
     if nome_f.strip():
         lista = lista[lista["Nome"].astype(str).str.contains(nome_f.strip(), case=False, na=False)]
@@ -247,18 +254,18 @@ with tab_edit:
         lista = lista.sort_values(["Data","Nome"], ascending=[False, True])
 
         def _label(r):
-            return f"{r['Data']} • {r['Nome']} • {r['Forma']} • Bruto {_fmt_brl(r['Bruto'])} • ({r['PagamentoID']})"
+            return f"{r['Data']} • {r['Nome']} • {r['Forma']} • Bruto {_fmt_brl(r['__Bruto'])} • ({r['PagamentoID']})"
 
-        options = { _label(r): (r["PagamentoID"], int(r["__rownum"])) for _, r in lista.iterrows() }
+        options = { _label(r): r["PagamentoID"] for _, r in lista.iterrows() }
         escolha = st.selectbox("Escolha o pagamento", list(options.keys()))
-        pid_sel, rownum = options.get(escolha, (None, None))
+        pid_sel = options.get(escolha)
 
-        if pid_sel and rownum:
+        if pid_sel:
             linha = df_pag[df_pag["PagamentoID"] == pid_sel].head(1).merge(
                 df_pac[["PacienteID","Nome"]], on="PacienteID", how="left"
             ).iloc[0]
 
-            st.markdown(f"**Pagamento:** `{pid_sel}`  •  Linha: {rownum}")
+            st.markdown(f"**Pagamento:** `{pid_sel}`")
             with st.form("edit_pag"):
                 # campos
                 nome_atual = str(linha.get("Nome",""))
@@ -271,9 +278,9 @@ with tab_edit:
                 forma_e = st.selectbox("Forma", ["Pix","Dinheiro","Cartão","Transferência"], index=["Pix","Dinheiro","Cartão","Transferência"].index(str(linha["Forma"]) if str(linha["Forma"]) in ["Pix","Dinheiro","Cartão","Transferência"] else "Pix"))
                 colN1, colN2 = st.columns(2)
                 with colN1:
-                    bruto_e = st.number_input("Bruto", min_value=0.0, step=1.0, format="%.2f", value=float(linha["Bruto"]))
+                    bruto_e = st.number_input("Bruto", min_value=0.0, step=1.0, format="%.2f", value=float(linha["__Bruto"]))
                 with colN2:
-                    liquido_e = st.number_input("Líquido", min_value=0.0, step=1.0, format="%.2f", value=float(linha["Liquido"]), disabled=(forma_e!="Cartão"))
+                    liquido_e = st.number_input("Líquido", min_value=0.0, step=1.0, format="%.2f", value=float(linha["__Liquido"]), disabled=(forma_e!="Cartão"))
 
                 # recomputa taxa se for cartão
                 if forma_e == "Cartão":
@@ -304,20 +311,16 @@ with tab_edit:
                     ("PacienteID", pac_id_new),
                     ("Data", data_e.strftime("%d/%m/%Y")),
                     ("Forma", forma_e),
-                    ("Bruto", float(bruto_e)),
-                    ("Liquido", float(liquido_e)),
+                    ("Bruto", round(float(bruto_e), 2)),
+                    ("Liquido", round(float(liquido_e), 2)),
                     ("TaxaValor", round(float(taxa_val_e), 2)),
                     ("TaxaPct", round(float(taxa_pct_e), 2)),
                     ("Referencia", ref_e.strip()),
                     ("Obs", obs_e.strip()),
                     ("ReciboURL", recibo_e.strip()),
                 ]
-                for col, val in updates:
-                    ci = col_idx.get(col)
-                    if ci:
-                        ws.update_cell(rownum, ci, val)
-                st.success("Pagamento atualizado.")
-                st.cache_data.clear()
+                update_by_id(ws, pid_sel, dict(updates))
+                saved_notice(ws, "Pagamento atualizado.")
                 st.rerun()
 
             if duplicar:
@@ -327,23 +330,22 @@ with tab_edit:
                     "PacienteID": pac_id_new,
                     "Data": data_e.strftime("%d/%m/%Y"),
                     "Forma": forma_e,
-                    "Bruto": float(bruto_e),
-                    "Liquido": float(liquido_e),
+                    "Bruto": round(float(bruto_e), 2),
+                    "Liquido": round(float(liquido_e), 2),
                     "TaxaValor": round(float(taxa_val_e), 2),
                     "TaxaPct": round(float(taxa_pct_e), 2),
                     "Referencia": ref_e.strip(),
                     "Obs": obs_e.strip(),
                     "ReciboURL": recibo_e.strip(),
                 }], default_headers=PAG_COLS)
-                st.success(f"Pagamento duplicado ({novo_id}).")
-                st.cache_data.clear()
+                saved_notice(ws, f"Pagamento duplicado ({novo_id}).")
+                invalidate_ws(ws)
                 st.rerun()
 
             # etapa 1: marcar exclusão pendente
             if pedir_apagar:
                 st.session_state["__pending_delete_pg"] = {
                     "pag_id": pid_sel,
-                    "rownum": int(rownum),
                     "desc": escolha,
                 }
                 st.rerun()
@@ -356,15 +358,18 @@ if pend:
     col_c, col_x = st.columns(2)
     if col_c.button("✅ Confirmar exclusão", key="confirm_delete_pag_btn", use_container_width=True):
         try:
-            ws.delete_rows(int(pend["rownum"]))
-            st.success("Pagamento apagado.")
+            if delete_by_id(ws, pend["pag_id"]):
+                saved_notice(ws, "Pagamento apagado.")
+            else:
+                st.warning("Pagamento não encontrado (talvez já tenha sido apagado).")
         except Exception as e:
             st.error(f"Erro ao apagar: {e}")
         finally:
             st.session_state.pop("__pending_delete_pg", None)
-            st.cache_data.clear()
             st.rerun()
     if col_x.button("❌ Cancelar", key="cancel_delete_pag_btn", use_container_width=True):
         st.session_state.pop("__pending_delete_pg", None)
         st.info("Exclusão cancelada.")
         st.rerun()
+
+perf_panel()
@@ -2,7 +2,10 @@
 import streamlit as st
 import pandas as pd
 from datetime import date, datetime, timedelta
-from utils_casulo import connect, read_ws, append_rows, new_id
+from utils_casulo import connect, read_ws, rollup, append_rows, update_by_id, delete_by_id, invalidate_ws, new_id, new_ids, journal_sidebar, saved_notice
+from utils_perf import perf_panel, span
+from utils_ui import warn_unparsed
+from utils_rollup import MES_COL, aligned_months
 
 st.set_page_config(page_title="Casulo — Despesas", page_icon="🧾", layout="wide")
 st.title("🧾 Despesas")
@@ -48,19 +51,14 @@ DESP_COLS = [
 
 # ---------------- dados ----------------
 ss = connect()
-df_desp, ws = read_ws(ss, "Despesas", DESP_COLS)
-
-# índices de coluna p/ update
-headers = ws.row_values(1)
-col_idx = {h: i+1 for i, h in enumerate(headers)}  # 1-based
+journal_sidebar(ss)
+df_desp, ws = read_ws(ss, "Despesas", DESP_COLS, typed=True)
+warn_unparsed(df_desp, "Despesas")
 
 # prepara df
 df_desp = df_desp.copy()
-df_desp["__rownum"] = df_desp.index + 2
-df_desp["__d"] = df_desp["Data"].apply(_parse_dt_br)
-
-for c in ["Valor"]:
-    df_desp[c] = pd.to_numeric(df_desp[c], errors="coerce").fillna(0.0)
+df_desp["__d"] = df_desp["__Data"]  # datetime64 (schema tipado)
+df_desp["Valor"] = df_desp["__Valor"]  # "R$ 1.234,56" -> 1234.56
 
 # ===================== TABS =====================
 tab_hist, tab_cad, tab_rec, tab_edit = st.tabs([
@@ -92,8 +90,8 @@ with tab_hist:
     ref_txt = st.text_input("Referência (contém, ex.: 09/2025)", "")
 
     vis = df_desp.copy()
-    if de:   vis = vis[vis["__d"] >= de]
-    if ate:  vis = vis[vis["__d"] <= ate]
+    if de:   vis = vis[vis["__d"] >= pd.Timestamp(de)]
+    if ate:  vis = vis[vis["__d"] <= pd.Timestamp(ate)]
     if cat != "(todas)":
         vis = vis[vis["Categoria"].astype(str) == cat]
     if fornecedor.strip():
@@ -101,12 +99,12 @@ with tab_hist:
     if centro != "(todos)":
         vis = vis[vis["CentroCusto"].astype(str) == centro]
     if pago_opt != "(todos)":
-        vis = vis[vis["Pago"].astype(str).str.lower() == ("true" if pago_opt=="Pago" else "false")]
+        vis = vis[vis["__Pago"] == (pago_opt == "Pago")]
     if ref_txt.strip():
         vis = vis[vis["Referencia"].astype(str).str.contains(ref_txt.strip(), case=False, na=False)]
 
     total = vis["Valor"].sum()
-    total_pago = vis[vis["Pago"].astype(str).str.lower()=="true"]["Valor"].sum()
+    total_pago = vis.loc[vis["__Pago"], "Valor"].sum()
     total_aberto = total - total_pago
 
     c1, c2, c3, c4 = st.columns(4)
@@ -124,10 +122,20 @@ with tab_hist:
     st.markdown("---")
     st.markdown("#### 📊 Resumos")
     if not vis.empty:
-        tmp = vis.copy()
-        tmp["MesRef"] = tmp["__d"].apply(lambda d: d.strftime("%Y-%m") if d else "")
+        # meses inteiros e só filtros que o rollup conhece -> tabela pré-agregada
+        meses = (None if (pago_opt != "(todos)" or fornecedor.strip() or ref_txt.strip())
+                 else aligned_months(de or None, ate or None))
+        if meses is not None:
+            tmp = rollup(ss, "Despesas", *meses).rename(columns={MES_COL: "MesRef"})
+            if cat != "(todas)":
+                tmp = tmp[tmp["Categoria"] == cat]
+            if centro != "(todos)":
+                tmp = tmp[tmp["CentroCusto"] == centro]
+        else:
+            tmp = vis.copy()
+            tmp["MesRef"] = tmp["__d"].dt.strftime("%Y-%m").fillna("")
         grp_mes = (tmp.groupby("MesRef", as_index=False)["Valor"].sum().sort_values("MesRef", ascending=False))
-        grp_cat = (tmp.groupby("Categoria", as_index=False)["Valor"].sum().sort_values("Valor", ascending=False))
+        grp_cat = (tmp.groupby("Categoria", as_index=False, observed=True)["Valor"].sum().sort_values("Valor", ascending=False))
         col_a, col_b = st.columns(2)
         with col_a:
             st.write("Por mês (data)")
@@ -213,7 +221,8 @@ with tab_cad:
                 )
                 folder = csec.get("folder_expenses", "casulo/expenses")
                 public_id = f"desp_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-                res = cloudinary.uploader.upload(uploaded, folder=folder, public_id=public_id, overwrite=True, resource_type="auto")
+                with span("cloudinary: upload", folder):
+                    res = cloudinary.uploader.upload(uploaded, folder=folder, public_id=public_id, overwrite=True, resource_type="auto")
                 comp_url = res.get("secure_url","")
             except Exception as e:
                 st.warning(f"Falha ao enviar para Cloudinary: {e}. Você pode colar a URL manualmente depois na edição.")
@@ -226,7 +235,7 @@ with tab_cad:
             "Descricao": desc.strip(),
             "Fornecedor": fornecedor_n.strip(),
             "Forma": forma,
-            "Valor": float(valor),
+            "Valor": round(float(valor), 2),
             "CentroCusto": centro,
             "Pago": bool(pago),
             "Referencia": ref.strip(),
@@ -236,8 +245,8 @@ with tab_cad:
             "Parcela": ""
         }], default_headers=DESP_COLS)
 
-        st.success(f"Despesa lançada ({did}).")
-        st.cache_data.clear()
+        saved_notice(ws, f"Despesa lançada ({did}).")
+        invalidate_ws(ws)
         st.rerun()
 
 # ============================================================
@@ -274,6 +283,7 @@ with tab_rec:
             st.stop()
 
         rid = new_id("DR")  # recorrente id
+        ids = new_ids("D", int(repeticoes))  # IDs em lote: únicos e em ordem
         itens = []
         for i in range(repeticoes):
             if periodic == "Mensal":
@@ -283,13 +293,13 @@ with tab_rec:
 
             ref_use = ref_base.strip() if ref_base.strip() else d.strftime("%m/%Y")
             itens.append({
-                "DespesaID": new_id("D"),
+                "DespesaID": ids[i],
                 "Data": _br_date(d),
                 "Categoria": categoria_final,
                 "Descricao": desc_r.strip(),
                 "Fornecedor": forn_r.strip(),
                 "Forma": forma_r,
-                "Valor": float(valor_r),
+                "Valor": round(float(valor_r), 2),
                 "CentroCusto": centro_r,
                 "Pago": bool(pago_r),
                 "Referencia": ref_use,
@@ -300,8 +310,8 @@ with tab_rec:
             })
 
         append_rows(ws, itens, default_headers=DESP_COLS)
-        st.success(f"✅ Criadas {len(itens)} despesas recorrentes (ID {rid}).")
-        st.cache_data.clear()
+        saved_notice(ws, f"✅ Criadas {len(itens)} despesas recorrentes (ID {rid}).")
+        invalidate_ws(ws)
         st.rerun()
 
 # ============================================================
@@ -323,14 +333,14 @@ with tab_edit:
     pago_e = st.selectbox("Status", ["(todos)","Pago","Em aberto"], index=0, key="ed_pago")
 
     lista = df_desp.copy()
-    if de_e:  lista = lista[lista["__d"] >= de_e]
-    if ate_e: lista = lista[lista["__d"] <= ate_e]
+    if de_e:  lista = lista[lista["__d"] >= pd.Timestamp(de_e)]
+    if ate_e: lista = lista[lista["__d"] <= pd.Timestamp(ate_e)]
     if cat_e != "(todas)":
         lista = lista[lista["Categoria"].astype(str) == cat_e]
     if   pago_e == "Pago":
-        lista = lista[lista["Pago"].astype(str).str.lower()=="true"]
+        lista = lista[lista["__Pago"]]
     elif pago_e == "Em aberto":
-        lista = lista[lista["Pago"].astype(str).str.lower()!="true"]
+        lista = lista[~lista["__Pago"]]
 
     if lista.empty:
         st.info("Nenhuma despesa no filtro.")
@@ -338,17 +348,17 @@ with tab_edit:
         lista = lista.sort_values(["Data","Categoria"], ascending=[False, True])
 
         def _label(r):
-            pago_flag = "✅" if str(r["Pago"]).lower()=="true" else "⏳"
+            pago_flag = "✅" if r["__Pago"] else "⏳"
             return f"{pago_flag} {r['Data']} • {r['Categoria']} • {_fmt_brl(r['Valor'])} • {r.get('Descricao','') or '-'} • ({r['DespesaID']})"
 
-        options = { _label(r): (r["DespesaID"], int(r["__rownum"])) for _, r in lista.iterrows() }
+        options = { _label(r): r["DespesaID"] for _, r in lista.iterrows() }
         escolha = st.selectbox("Escolha a despesa", list(options.keys()))
-        did_sel, rownum = options.get(escolha, (None, None))
+        did_sel = options.get(escolha)
 
-        if did_sel and rownum:
+        if did_sel:
             linha = df_desp[df_desp["DespesaID"] == did_sel].head(1).iloc[0]
 
-            st.markdown(f"**Despesa:** `{did_sel}`  •  Linha: {rownum}")
+            st.markdown(f"**Despesa:** `{did_sel}`")
             with st.form("edit_desp"):
                 data_e = st.date_input("Data", value=_parse_dt_br(linha["Data"]) or date.today())
                 cat_e2 = st.selectbox("Categoria", sorted(list(set(CATEGORIAS_PADRAO + df_desp["Categoria"].dropna().astype(str).tolist())) + ["(outra...)"]),
@@ -382,18 +392,16 @@ with tab_edit:
                     ("Descricao", desc_e.strip()),
                     ("Fornecedor", forn_e.strip()),
                     ("Forma", forma_e),
-                    ("Valor", float(valor_e)),
+                    ("Valor", round(float(valor_e), 2)),
                     ("CentroCusto", centro_e),
                     ("Pago", bool(pago_flag)),
                     ("Referencia", ref_e.strip()),
                     ("Obs", obs_e.strip()),
                     ("ComprovanteURL", comp_e.strip()),
                 ]
-                for col, val in updates:
-                    ci = col_idx.get(col)
-                    if ci: ws.update_cell(rownum, ci, val)
-                st.success("Despesa atualizada.")
-                st.cache_data.clear(); st.rerun()
+                update_by_id(ws, did_sel, dict(updates))
+                saved_notice(ws, "Despesa atualizada.")
+                st.rerun()
 
             if duplicar:
                 novo_id = new_id("D")
@@ -404,7 +412,7 @@ with tab_edit:
                     "Descricao": desc_e.strip(),
                     "Fornecedor": forn_e.strip(),
                     "Forma": forma_e,
-                    "Valor": float(valor_e),
+                    "Valor": round(float(valor_e), 2),
                     "CentroCusto": centro_e,
                     "Pago": bool(pago_flag),
                     "Referencia": ref_e.strip(),
@@ -413,14 +421,13 @@ with tab_edit:
                     "RecorrenteID": str(linha.get("RecorrenteID","") or ""),
                     "Parcela": ""
                 }], default_headers=DESP_COLS)
-                st.success(f"Despesa duplicada ({novo_id}).")
-                st.cache_data.clear(); st.rerun()
+                saved_notice(ws, f"Despesa duplicada ({novo_id}).")
+                invalidate_ws(ws); st.rerun()
 
             # etapa 1: marcar exclusão pendente
             if pedir_apagar:
                 st.session_state["__pending_delete_desp"] = {
                     "desp_id": did_sel,
-                    "rownum": int(rownum),
                     "desc": escolha,
                 }
                 st.rerun()
@@ -433,13 +440,17 @@ if pend:
     col_c, col_x = st.columns(2)
     if col_c.button("✅ Confirmar exclusão", key="confirm_delete_desp_btn", use_container_width=True):
         try:
-            ws.delete_rows(int(pend["rownum"]))
-            st.success("Despesa apagada.")
+            if delete_by_id(ws, pend["desp_id"]):
+                saved_notice(ws, "Despesa apagada.")
+            else:
+                st.warning("Despesa não encontrada (talvez já tenha sido apagada).")
         except Exception as e:
             st.error(f"Erro ao apagar: {e}")
         finally:
             st.session_state.pop("__pending_delete_desp", None)
-            st.cache_data.clear(); st.rerun()
+            st.rerun()
     if col_x.button("❌ Cancelar", key="cancel_delete_desp_btn", use_container_width=True):
         st.session_state.pop("__pending_delete_desp", None)
         st.info("Exclusão cancelada."); st.rerun()
+
+perf_panel()
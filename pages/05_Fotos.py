@@ -6,7 +6,8 @@ import streamlit as st
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
-from utils_casulo import connect, read_ws
+from utils_casulo import connect, read_ws, update_by_id, journal_sidebar, saved_notice
+from utils_perf import perf_panel, span
 
 st.set_page_config(page_title="Casulo — Fotos (Cloudinary)", page_icon="🖼️", layout="wide")
 st.title("🖼️ Upload de Fotos (Cloudinary)")
@@ -39,6 +40,7 @@ dest_folder = st.selectbox("📁 Pasta de destino no Cloudinary", SUB_OPTIONS, i
 
 # ---------- Sheets ----------
 ss = connect()
+journal_sidebar(ss)
 PAC_COLS = [
     "PacienteID","Nome","DataNascimento","Responsavel","Telefone","Email",
     "Diagnostico","Convenio","Status","Prioridade","FotoURL","CloudinaryID","Observacoes"
@@ -72,7 +74,8 @@ if foto_atual:
     st.image(foto_atual, width=220, caption=nome_sel)
 elif cloudinary_id:
     try:
-        _ = cloudinary.api.resource(cloudinary_id)
+        with span("cloudinary: resource", cloudinary_id):
+            _ = cloudinary.api.resource(cloudinary_id)
         url_guess = cloudinary.CloudinaryImage(cloudinary_id).build_url()
         st.image(url_guess, width=220, caption=nome_sel)
     except Exception:
@@ -88,29 +91,24 @@ overwrite = st.checkbox("Sobrescrever se já existir", value=True)
 
 if file and st.button("📤 Enviar imagem", use_container_width=True):
     try:
-        up = cloudinary.uploader.upload(
-            file,
-            folder=dest_folder,              # <<<<<<<<<< pasta de destino (ex.: "Clientes Casulo" ou ".../Logo")
-            public_id=public_id_base,        # não inclua a pasta aqui
-            overwrite=overwrite,
-            resource_type="image",
-            unique_filename=False,
-            use_filename=False,
-        )
+        with span("cloudinary: upload", dest_folder):
+            up = cloudinary.uploader.upload(
+                file,
+                folder=dest_folder,              # <<<<<<<<<< pasta de destino (ex.: "Clientes Casulo" ou ".../Logo")
+                public_id=public_id_base,        # não inclua a pasta aqui
+                overwrite=overwrite,
+                resource_type="image",
+                unique_filename=False,
+                use_filename=False,
+            )
         url = up.get("secure_url", "")
         cid = up.get("public_id", "")       # vem como "<folder>/<public_id>"
 
         # Atualiza planilha
-        idx = int(row.index[0])
-        rownum = idx + 2
-        col_foto = df_pac.columns.get_loc("FotoURL") + 1
-        col_cid  = df_pac.columns.get_loc("CloudinaryID") + 1
-        ws_pac.update_cell(rownum, col_foto, url)
-        ws_pac.update_cell(rownum, col_cid,  cid)
-
-        st.success("✅ Imagem enviada e planilha atualizada!")
+        update_by_id(ws_pac, pid, {"FotoURL": url, "CloudinaryID": cid})
+
+        saved_notice(ws_pac, "✅ Imagem enviada e planilha atualizada!")
         st.image(url, width=260)
-        st.cache_data.clear()
         st.rerun()
     except Exception as e:
         st.error(f"Erro no upload: {e}")
@@ -119,14 +117,10 @@ st.markdown("---")
 st.markdown("#### Apagar foto do paciente")
 if st.button("🗑️ Deletar do Cloudinary", use_container_width=True, disabled=not cloudinary_id):
     try:
-        cloudinary.uploader.destroy(cloudinary_id, resource_type="image")
-        idx = int(row.index[0]); rownum = idx + 2
-        col_foto = df_pac.columns.get_loc("FotoURL") + 1
-        col_cid  = df_pac.columns.get_loc("CloudinaryID") + 1
-        ws_pac.update_cell(rownum, col_foto, "")
-        ws_pac.update_cell(rownum, col_cid, "")
-        st.success("Imagem deletada e planilha atualizada.")
-        st.cache_data.clear()
+        with span("cloudinary: destroy", cloudinary_id):
+            cloudinary.uploader.destroy(cloudinary_id, resource_type="image")
+        update_by_id(ws_pac, pid, {"FotoURL": "", "CloudinaryID": ""})
+        saved_notice(ws_pac, "Imagem deletada e planilha atualizada.")
         st.rerun()
     except Exception as e:
         st.error(f"Erro ao deletar: {e}")
@@ -145,3 +139,5 @@ for _, pr in df_pac.iterrows():
     shown += 1
 if shown == 0:
     st.info("Ainda não há imagens salvas.")
+
+perf_panel()
@@ -8,7 +8,7 @@ import gspread
 from gspread.exceptions import APIError
 import requests  # Telegram
 
-from utils_casulo import connect, read_ws, append_rows, new_id
+from utils_casulo import connect, read_ws, append_rows, invalidate_ws, new_id
 
 st.set_page_config(page_title="Casulo — Pacientes", page_icon="👨‍👩‍👧", layout="wide")
 
@@ -316,7 +316,7 @@ with save_col1:
             values = [PAC_COLS] + out.values.tolist()
             ws.update("A1", values)
             st.success("Alterações salvas na planilha ✅")
-            st.cache_data.clear(); st.rerun()
+            invalidate_ws(ws); st.rerun()
         except APIError as e:
             _render_perm_help(e); st.error("Erro do Google Sheets ao salvar.")
         except Exception as e:
@@ -339,7 +339,7 @@ with save_col2:
             values = [PAC_COLS] + out.values.tolist()
             ws.update("A1", values)
             st.success(f"{len(ids_para_excluir)} registro(s) excluído(s) ✅")
-            st.cache_data.clear(); st.rerun()
+            invalidate_ws(ws); st.rerun()
         except APIError as e:
             _render_perm_help(e); st.error("Erro do Google Sheets ao excluir.")
         except Exception as e:
@@ -439,7 +439,7 @@ else:
                         }
                         _update_row_by_id(ws, df, rec)
                         st.success("Cadastro atualizado ✅")
-                        st.cache_data.clear(); st.rerun()
+                        invalidate_ws(ws); st.rerun()
                     except APIError as e:
                         _render_perm_help(e); st.error("Erro do Google Sheets ao atualizar.")
                     except Exception as e:
@@ -522,7 +522,7 @@ with st.form("novo_paciente"):
                 else:
                     st.caption(f"(Falha no Telegram: {err_tg})")
 
-                st.cache_data.clear()
+                invalidate_ws(ws)
                 st.rerun()
             except APIError as e:
                 _render_perm_help(e)
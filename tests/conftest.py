@@ -0,0 +1,49 @@
+# conftest.py — Coloca a raiz do repositório (utils_*) e bench/ no sys.path
+
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _p in (RAIZ, os.path.join(RAIZ, "bench")):  # bench/synth.py: clínica sintética
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+import pytest
+
+
+class Relogio:
+    """Substitui o módulo `time` de utils_casulo: `sleep` só avança o relógio."""
+
+    def __init__(self, inicio: float = 1000.0):
+        self.agora = inicio
+        self.dormiu: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.agora
+
+    perf_counter = monotonic
+    time = monotonic
+
+    def sleep(self, s: float) -> None:
+        self.dormiu.append(s)
+        self.agora += s
+
+
+@pytest.fixture
+def casulo():
+    """utils_casulo com caches, baldes de cota e avisos de dado velho zerados."""
+    import utils_casulo as uc
+    uc.clear_cache()
+    uc._buckets.clear()
+    uc._stale.clear()
+    yield uc
+    uc.clear_cache()
+    uc._buckets.clear()
+    uc._stale.clear()
+
+
+@pytest.fixture
+def relogio(casulo, monkeypatch):
+    r = Relogio()
+    monkeypatch.setattr(casulo, "time", r)
+    return r
@@ -0,0 +1,55 @@
+# test_agenda.py — Índice de sessões (utils_casulo.session_index) com abas de arquivo
+
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from utils_agenda import ABA_COL
+from utils_backend import LocalSpreadsheet, MemoryBackend
+from utils_schema import PAC_COLS, SES_COLS
+
+
+@pytest.fixture
+def ss(casulo):
+    ses = pd.DataFrame([["S1", "P1", "05/03/2024", "10:00"], ["S2", "P1", "06/03/2024", "11:00"],
+                        ["S3", "P1", "14/01/2026", "09:00"]],
+                       columns=["SessaoID", "PacienteID", "Data", "HoraInicio"]).reindex(columns=SES_COLS)
+    ss = LocalSpreadsheet(MemoryBackend({"Pacientes": pd.DataFrame({"PacienteID": ["P1"], "Nome": ["Ana"]}),
+                                         "Sessoes": ses.fillna("")}), id="teste")
+    assert casulo.archive_closed(ss, "Sessoes", antes_de=date(2026, 1, 1)) == {2024: 2}
+    return ss
+
+
+def test_aba_viva_sem_intervalo(casulo, ss):
+    idx = casulo.session_index(ss)
+    assert idx.window(date(2024, 1, 1), date(2024, 12, 31)).empty
+    assert idx.day(date(2026, 1, 14))["SessaoID"].tolist() == ["S3"]
+
+
+def test_intervalo_arquivado_inclui_o_arquivo(casulo, ss):
+    semana = casulo.session_index(ss, date(2024, 3, 4), date(2024, 3, 10)).window(date(2024, 3, 4), date(2024, 3, 10))
+    assert semana["SessaoID"].tolist() == ["S1", "S2"]
+    assert set(semana[ABA_COL]) == {"Sessoes_2024"}
+    assert semana["Nome"].tolist() == ["Ana", "Ana"]
+    # edição vai p/ a aba de onde a sessão veio
+    ws = casulo.ws_handle(ss, semana[ABA_COL].iloc[0])
+    casulo.update_by_id(ws, "S1", {"Status": "Falta"})
+    dia = casulo.session_index(ss, date(2024, 3, 5), date(2024, 3, 5)).day(date(2024, 3, 5))
+    assert dia["Status"].tolist() == ["Falta"]
+
+
+def test_indice_reaproveitado(casulo, ss):
+    a = casulo.session_index(ss, date(2024, 3, 4), date(2024, 3, 10))
+    assert casulo.session_index(ss, date(2024, 6, 1), date(2024, 6, 7)) is a
+    assert casulo.session_index(ss) is not a
+
+
+def test_pacientes_tipada_da_pagina_e_reaproveitada(casulo, ss, monkeypatch):
+    # Dashboard: Pacientes inteira e tipada; o índice só recorta PacienteID/Nome dela
+    casulo.read_many(ss, {"Pacientes": PAC_COLS, "Sessoes": SES_COLS}, typed=True)
+    pedidos = []
+    monkeypatch.setattr(ss, "values_batch_get", lambda *a, **k: pedidos.append(a) or {})
+    monkeypatch.setattr(ss, "values_get", lambda *a, **k: pedidos.append(a) or {})
+    assert casulo.session_index(ss).day(date(2026, 1, 14))["Nome"].tolist() == ["Ana"]
+    assert pedidos == []
@@ -0,0 +1,33 @@
+# test_backend.py — LocalSpreadsheet (adaptador gspread sobre um Backend)
+
+import pandas as pd
+import pytest
+
+from utils_backend import LocalSpreadsheet, MemoryBackend
+
+
+@pytest.fixture
+def ss():
+    return LocalSpreadsheet(MemoryBackend({"Sessoes": pd.DataFrame({"SessaoID": ["S1", "S2", "S3", "S4"]})}))
+
+
+def _apaga(sheet_id, ini, fim):
+    return {"deleteDimension": {"range": {"sheetId": sheet_id, "dimension": "ROWS",
+                                          "startIndex": ini, "endIndex": fim}}}
+
+
+def test_batch_update_apaga_linhas(ss):
+    ws = ss.worksheet("Sessoes")
+    ss.batch_update({"requests": [_apaga(ws.id, 3, 5), _apaga(ws.id, 1, 2)]})
+    assert ws.get_all_values() == [["SessaoID"], ["S2"]]
+
+
+@pytest.mark.parametrize("pedido", [
+    {"deleteDimension": {"range": {"sheetId": 0, "dimension": "COLUMNS", "startIndex": 0, "endIndex": 1}}},
+    {"updateSheetProperties": {"properties": {"sheetId": 0, "title": "X"}, "fields": "title"}},
+])
+def test_batch_update_recusa_o_que_nao_suporta(ss, pedido):
+    ws = ss.worksheet("Sessoes")
+    with pytest.raises(ValueError):
+        ss.batch_update({"requests": [_apaga(ws.id, 1, 2), pedido]})
+    assert len(ws.get_all_values()) == 5  # nada do lote foi aplicado
@@ -0,0 +1,140 @@
+# test_quota.py — Cota da API: novas tentativas, balde de fichas e dado velho (utils_casulo)
+
+import json
+from types import SimpleNamespace
+
+import gspread
+import pandas as pd
+import pytest
+import requests
+
+from utils_backend import LocalSpreadsheet, MemoryBackend
+
+URL = "https://sheets.googleapis.com/v4/spreadsheets/abc/values/Pacientes"
+
+
+def _resposta(status: int, corpo: dict) -> requests.Response:
+    r = requests.Response()
+    r.status_code = status
+    r._content = json.dumps(corpo).encode("utf-8")
+    r.url = URL
+    return r
+
+
+def _erro_429() -> requests.Response:
+    return _resposta(429, {"error": {"code": 429, "message": "Quota exceeded",
+                                     "status": "RESOURCE_EXHAUSTED"}})
+
+
+class SessaoFalsa:
+    """Session do requests que responde 429 nas `falhas` primeiras chamadas e 200 depois."""
+
+    def __init__(self, falhas: int, relogio=None, status: int = 429):
+        self.falhas = falhas
+        self.status = status
+        self.relogio = relogio
+        self.chamadas: list[float] = []
+
+    def request(self, method, url, **kwargs):
+        self.chamadas.append(self.relogio.monotonic() if self.relogio else 0.0)
+        if len(self.chamadas) <= self.falhas:
+            if self.status == 429:
+                return _erro_429()
+            return _resposta(self.status, {"error": {"code": self.status, "message": "x"}})
+        return _resposta(200, {"values": [["PacienteID"], ["P1"]]})
+
+
+@pytest.fixture
+def sem_jitter(casulo, monkeypatch):
+    """Jitter sempre no teto, p/ a espera de cada tentativa ser conhecida."""
+    monkeypatch.setattr(casulo.random, "uniform", lambda a, b: b)
+
+
+def test_repete_429_ate_dar_certo(casulo, relogio, sem_jitter):
+    sessao = SessaoFalsa(falhas=3)
+    cliente = casulo.QuotaHTTPClient(None, session=sessao)
+    resp = cliente.request("get", URL)
+    assert resp.status_code == 200
+    assert len(sessao.chamadas) == 4
+    assert relogio.dormiu == [1.0, 2.0, 4.0]  # backoff exponencial (base 1 s)
+
+
+def test_desiste_depois_das_tentativas(casulo, relogio, sem_jitter):
+    sessao = SessaoFalsa(falhas=99)
+    cliente = casulo.QuotaHTTPClient(None, session=sessao)
+    with pytest.raises(gspread.exceptions.APIError):
+        cliente.request("get", URL)
+    assert len(sessao.chamadas) == 5
+    assert len(relogio.dormiu) == 4  # não espera depois da última
+
+
+def test_backoff_tem_teto(casulo, relogio, sem_jitter):
+    n = {"chamadas": 0}
+
+    def falha():
+        n["chamadas"] += 1
+        raise gspread.exceptions.APIError(_erro_429())
+
+    with pytest.raises(gspread.exceptions.APIError):
+        casulo.with_backoff(falha, tentativas=6, base=10.0, teto=15.0)
+    assert n["chamadas"] == 6
+    assert relogio.dormiu == [10.0, 15.0, 15.0, 15.0, 15.0]
+
+
+def test_escrita_nao_repete_5xx(casulo, relogio, sem_jitter):
+    # repetir um append depois de 5xx pode duplicar a linha
+    sessao = SessaoFalsa(falhas=1, status=503)
+    cliente = casulo.QuotaHTTPClient(None, session=sessao)
+    with pytest.raises(gspread.exceptions.APIError):
+        cliente.request("post", URL + ":append")
+    assert len(sessao.chamadas) == 1
+
+
+def test_balde_espaca_as_chamadas(casulo, relogio, monkeypatch):
+    balde = casulo._TokenBucket(60)  # 0,8 ficha/s, rajada de 12
+    monkeypatch.setitem(casulo._buckets, "read", balde)
+    sessao = SessaoFalsa(falhas=0, relogio=relogio)
+    cliente = casulo.QuotaHTTPClient(None, session=sessao)
+    for _ in range(16):
+        cliente.request("get", URL)
+    rajada, resto = sessao.chamadas[:12], sessao.chamadas[12:]
+    assert rajada[-1] == rajada[0]                       # a rajada passa direto
+    intervalos = [b - a for a, b in zip([rajada[-1]] + resto, resto)]
+    assert all(i == pytest.approx(1 / balde.rate) for i in intervalos)
+    # nenhuma janela de 60 s passa da cota
+    assert sum(1 for t in sessao.chamadas if t - sessao.chamadas[0] < 60) <= 60
+
+
+def test_serve_dado_velho_quando_as_tentativas_acabam(casulo, relogio, sem_jitter, monkeypatch):
+    avisos = []
+    monkeypatch.setattr(casulo, "st", SimpleNamespace(secrets={}, sidebar=SimpleNamespace(warning=avisos.append)))
+    ss = LocalSpreadsheet(MemoryBackend({"Pacientes": pd.DataFrame({"PacienteID": ["P1", "P2"]})}), id="teste")
+    df, _ = casulo.read_ws(ss, "Pacientes", ["PacienteID"])
+    assert not df.attrs.get("stale")
+
+    tentativas = []
+
+    def values_get(*args, **kwargs):
+        def _call():
+            tentativas.append(1)
+            raise gspread.exceptions.APIError(_erro_429())
+        return casulo.with_backoff(_call)
+
+    monkeypatch.setattr(ss, "values_get", values_get)
+    df, _ = casulo.read_ws(ss, "Pacientes", ["PacienteID"], ttl=0)
+    assert len(tentativas) == 5
+    assert df.attrs["stale"] is True
+    assert df["PacienteID"].tolist() == ["P1", "P2"]
+    assert "Pacientes" in casulo.stale_sheets()
+    assert len(avisos) == 1 and "Pacientes" in avisos[0]
+
+
+def test_sem_dado_anterior_o_erro_sobe(casulo, relogio, sem_jitter, monkeypatch):
+    ss = LocalSpreadsheet(MemoryBackend({"Pacientes": pd.DataFrame({"PacienteID": ["P1"]})}), id="teste")
+
+    def values_get(*args, **kwargs):
+        raise gspread.exceptions.APIError(_erro_429())
+
+    monkeypatch.setattr(ss, "values_get", values_get)
+    with pytest.raises(gspread.exceptions.APIError):
+        casulo.read_ws(ss, "Pacientes", ["PacienteID"])
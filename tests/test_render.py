@@ -0,0 +1,81 @@
+# test_render.py — Datas voltam como texto da API (dateTimeRenderOption=FORMATTED_STRING)
+
+import sqlite3
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from utils_backend import LocalSpreadsheet, MemoryBackend, SheetsBackend
+from utils_mirror import MIRROR_SCHEMA, Mirror
+
+_EPOCA = date(1899, 12, 30)  # dia 0 das datas seriais do Sheets
+
+
+def _serial(v):
+    """"dd/mm/aaaa" -> nº serial (como a API devolve sem FORMATTED_STRING)."""
+    try:
+        d = pd.to_datetime(v, format="%d/%m/%Y").date()
+    except (TypeError, ValueError):
+        return v
+    return (d - _EPOCA).days
+
+
+class PlanilhaSerial(LocalSpreadsheet):
+    """
+    Imita a API: com valueRenderOption=FORMULA, datas só voltam como texto se o
+    pedido trouxer dateTimeRenderOption=FORMATTED_STRING; senão viram serial
+    (01/03/2024 -> 45352). A LocalSpreadsheet sempre devolve o texto.
+    """
+
+    def values_get(self, range, params=None):
+        resp = super().values_get(range, params)
+        if (params or {}).get("dateTimeRenderOption") != "FORMATTED_STRING":
+            resp["values"] = [[_serial(v) for v in linha] for linha in resp["values"]]
+        return resp
+
+
+@pytest.fixture
+def planilha():
+    return PlanilhaSerial(MemoryBackend({
+        "Sessoes": pd.DataFrame({"SessaoID": ["S1", "S2"], "Data": ["01/03/2024", "05/03/2024"]}),
+        "Pacientes": pd.DataFrame({"PacienteID": ["P1"], "Nome": ["Ana"]}),
+    }), id="teste")
+
+
+def test_serial_sem_formatted_string(planilha):
+    resp = planilha.values_get("'Sessoes'", {"valueRenderOption": "FORMULA"})
+    assert resp["values"][1][1] == 45352
+
+
+def test_read_many_datas_em_texto(casulo, planilha):
+    out = casulo.read_many(planilha, {"Sessoes": ["SessaoID", "Data"], "Pacientes": ["PacienteID", "Nome"]})
+    assert out["Sessoes"][0]["Data"].tolist() == ["01/03/2024", "05/03/2024"]
+
+
+def test_read_ws_completo_datas_em_texto(casulo, planilha):
+    df, _ = casulo.read_ws(planilha, "Sessoes", ["SessaoID", "Data"])
+    assert df["Data"].tolist() == ["01/03/2024", "05/03/2024"]
+
+
+def test_sheets_backend_datas_em_texto(planilha):
+    assert SheetsBackend(planilha).read_table("Sessoes")[1] == ["S1", "01/03/2024"]
+
+
+def test_read_ws_colunas_datas_em_texto(casulo, planilha):
+    df, _ = casulo.read_ws(planilha, "Sessoes", ["SessaoID", "Data"], usecols=["Data"])
+    assert df["Data"].tolist() == ["01/03/2024", "05/03/2024"]
+
+
+def test_espelho_antigo_fica_sujo(tmp_path):
+    path = str(tmp_path / "espelho.db")
+    m = Mirror(path)
+    m.replace("Sessoes", pd.DataFrame({"SessaoID": ["S1"], "Data": ["45352"]}), version="v1")
+    assert m.is_fresh("Sessoes", 60)
+    with sqlite3.connect(path) as con:  # arquivo gravado antes do FORMATTED_STRING
+        con.execute("PRAGMA user_version=1")
+    m = Mirror(path)
+    assert not m.is_fresh("Sessoes", 60)
+    assert not m.revalidate("Sessoes", "v1")
+    with sqlite3.connect(path) as con:
+        assert con.execute("PRAGMA user_version").fetchone()[0] == MIRROR_SCHEMA
@@ -0,0 +1,58 @@
+# test_revalidacao.py — Cache vencido revalidado pelo modifiedTime (utils_casulo._cached)
+
+import pandas as pd
+import pytest
+
+from utils_backend import LocalSpreadsheet, MemoryBackend
+
+
+class PlanilhaContada(LocalSpreadsheet):
+    """LocalSpreadsheet que conta downloads da grade e consultas ao modifiedTime."""
+
+    def __init__(self, backend):
+        super().__init__(backend, id="teste")
+        self.downloads = 0
+        self.sinais = 0
+
+    def values_get(self, range, params=None):
+        self.downloads += 1
+        return super().values_get(range, params)
+
+    def get_lastUpdateTime(self):
+        self.sinais += 1
+        return super().get_lastUpdateTime()
+
+
+@pytest.fixture
+def planilha():
+    return PlanilhaContada(MemoryBackend({"Pacientes": pd.DataFrame({"PacienteID": ["P1"]})}))
+
+
+def test_dentro_do_ttl_nao_chama_nada(casulo, relogio, planilha):
+    casulo.read_ws(planilha, "Pacientes", ["PacienteID"], ttl=60)
+    relogio.agora += 30
+    casulo.read_ws(planilha, "Pacientes", ["PacienteID"], ttl=60)
+    assert planilha.downloads == 1
+    assert planilha.sinais == 1  # só o do primeiro download
+
+
+def test_ttl_vencido_sem_mudanca_reaproveita(casulo, relogio, planilha):
+    df1, _ = casulo.read_ws(planilha, "Pacientes", ["PacienteID"], ttl=60)
+    relogio.agora += 61
+    df2, _ = casulo.read_ws(planilha, "Pacientes", ["PacienteID"], ttl=60)
+    assert planilha.downloads == 1  # sem values_get: só a consulta de metadados
+    assert planilha.sinais == 2
+    pd.testing.assert_frame_equal(df1, df2)
+    # revalidado: ganha novo prazo de ttl
+    relogio.agora += 30
+    casulo.read_ws(planilha, "Pacientes", ["PacienteID"], ttl=60)
+    assert (planilha.downloads, planilha.sinais) == (1, 2)
+
+
+def test_modifiedtime_mudou_baixa_de_novo(casulo, relogio, planilha):
+    casulo.read_ws(planilha, "Pacientes", ["PacienteID"], ttl=60)
+    planilha.backend.append("Pacientes", [["P2"]])  # edição feita fora do app
+    relogio.agora += 61
+    df, _ = casulo.read_ws(planilha, "Pacientes", ["PacienteID"], ttl=60)
+    assert planilha.downloads == 2
+    assert df["PacienteID"].tolist() == ["P1", "P2"]
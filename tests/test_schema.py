@@ -0,0 +1,47 @@
+# test_schema.py — Conversão de valores em BRL (parse_money / apply_schema)
+
+import pandas as pd
+import pytest
+
+from utils_schema import UNPARSED_ATTR, apply_schema, parse_money, unparsed_money
+
+
+@pytest.mark.parametrize("dtype", [object, "str"])
+@pytest.mark.parametrize("texto, esperado", [
+    ("144.765", 144.765),      # número cru da API: ponto é decimal, nunca milhar
+    ("5.235", 5.235),
+    ("0.125", 0.125),          # grupo "0" não é milhar
+    ("1.234,56", 1234.56),
+    ("R$ 1.234", 1234.0),      # texto formatado: ponto de milhar
+    ("R$ 1.234,56", 1234.56),
+    ("R$ 1.234,56", 1234.56),
+    ("1.234.567", 1234567.0),
+    ("1,234.56", 1234.56),
+    ("12,5", 12.5),
+    ("(R$ 10,00)", -10.0),
+    ("-5.5", -5.5),
+    ("80", 80.0),
+    ("", 0.0),
+])
+def test_parse_money(texto, esperado, dtype):
+    s = pd.Series([texto], dtype=dtype)
+    assert parse_money(s).iloc[0] == pytest.approx(esperado)
+    assert not unparsed_money(s).iloc[0]
+
+
+def test_invalido_vira_zero_e_fica_registrado():
+    df = pd.DataFrame({"PagamentoID": ["a", "b", "c"], "Data": ["01/01/2024"] * 3,
+                       "Bruto": ["150", "mil reais", "R$ 1.234"],
+                       "Liquido": ["144.765", "10", "1.234,00"]})
+    out = apply_schema(df, "Pagamentos")
+    assert out["__Bruto"].tolist() == [150.0, 0.0, 1234.0]
+    assert out["__Liquido"].tolist() == pytest.approx([144.765, 10.0, 1234.0])
+    assert out.attrs[UNPARSED_ATTR] == {"Bruto": [1]}
+
+
+def test_totais_da_clinica_sintetica():
+    # líquido como a página de Pagamentos calcula (bruto - taxa%, sem arredondar)
+    from synth import check_totals, clinic
+    data = clinic(2000)
+    assert data["Pagamentos"]["Liquido"].str.fullmatch(r"\d+\.\d{3,}").any()
+    check_totals(data)
@@ -0,0 +1,70 @@
+# utils_agenda.py — Índice das sessões por dia (janelas de semana/dia sem varrer a aba)
+
+from __future__ import annotations
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from utils_schema import typed_col
+
+DATA_COL = typed_col("Data")
+HORA_COL = typed_col("HoraInicio")
+ABA_COL = "__Aba"  # aba de onde a sessão veio ("Sessoes" ou um arquivo "Sessoes_2024")
+
+
+def _day(d) -> np.datetime64:
+    """date/Timestamp/datetime -> dia (datetime64[D])."""
+    return np.datetime64(pd.Timestamp(d).date(), "D")
+
+
+class SessionIndex:
+    """
+    Sessões (frame tipado) ordenadas por Data e HoraInicio, com o Nome do
+    paciente já juntado, e uma tabela dia -> fatia de linhas.
+    - `day(d)` é uma consulta no dicionário; `window(de, ate)` são duas buscas
+      binárias. As duas devolvem uma fatia contínua, sem máscara sobre a aba.
+    - Sessões sem Data válida ficam de fora (não caem em janela nenhuma).
+    - O índice é imutável: monte outro quando a aba mudar.
+    """
+
+    def __init__(self, ses: pd.DataFrame, pac: pd.DataFrame | None = None):
+        df = ses[ses[DATA_COL].notna()] if DATA_COL in ses.columns else ses.iloc[0:0]
+        if pac is not None and {"PacienteID", "Nome"} <= set(pac.columns) and "PacienteID" in df.columns:
+            nomes = pac.drop_duplicates("PacienteID").set_index("PacienteID")["Nome"]
+            df = df.assign(Nome=df["PacienteID"].map(nomes))
+        ordem = [c for c in (DATA_COL, HORA_COL) if c in df.columns]
+        if ordem:
+            df = df.sort_values(ordem, kind="stable", na_position="last")
+        self.frame = df.reset_index(drop=True)
+
+        self._dias = (self.frame[DATA_COL].to_numpy().astype("datetime64[D]")
+                      if DATA_COL in self.frame.columns else np.array([], dtype="datetime64[D]"))
+        uniq, ini, n = np.unique(self._dias, return_index=True, return_counts=True)
+        self.offsets: dict[np.datetime64, tuple[int, int]] = {
+            d: (int(i), int(i + k)) for d, i, k in zip(uniq, ini, n)
+        }
+
+    def day(self, d: date | pd.Timestamp) -> pd.DataFrame:
+        """Sessões do dia `d`, em ordem de horário."""
+        i, j = self.offsets.get(_day(d), (0, 0))
+        return self.frame.iloc[i:j].copy()
+
+    def window(self, de: date | pd.Timestamp, ate: date | pd.Timestamp) -> pd.DataFrame:
+        """Sessões com Data entre `de` e `ate` (inclusive), em ordem de data e horário."""
+        i = int(np.searchsorted(self._dias, _day(de), side="left"))
+        j = int(np.searchsorted(self._dias, _day(ate), side="right"))
+        return self.frame.iloc[i:max(i, j)].copy()
+
+    def count(self, de: date | pd.Timestamp, ate: date | pd.Timestamp) -> int:
+        """Quantas sessões entre `de` e `ate` (sem montar o DataFrame)."""
+        i = int(np.searchsorted(self._dias, _day(de), side="left"))
+        j = int(np.searchsorted(self._dias, _day(ate), side="right"))
+        return max(0, j - i)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+
+__all__ = ["ABA_COL", "SessionIndex"]
@@ -0,0 +1,586 @@
+# utils_backend.py — Backends de armazenamento (Google Sheets, SQLite local, memória)
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from typing import Protocol, runtime_checkable
+
+import pandas as pd
+import gspread
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol, absolute_range_name, rowcol_to_a1
+
+# =========================
+# Protocolo
+# =========================
+# Uma "tabela" é uma aba: grade de texto, linha 1 = header, numeração 1-based
+# como na planilha. Células são sempre texto ("" = vazia).
+#
+# Onde o protocolo é a costura: utils_casulo e as páginas falam a API do
+# gspread. Com backend local, connect() devolve um LocalSpreadsheet (abaixo),
+# que traduz essa API p/ o protocolo. Com o Google, read_ws e as escritas
+# usam o gspread direto (batchGet por coluna, modifiedTime, cliente com cota,
+# índice de linhas), sem passar por SheetsBackend — ele só serve a copy_tables.
+
+
+@runtime_checkable
+class Backend(Protocol):
+    def list_tables(self) -> list[str]:
+        """Títulos das tabelas, na ordem das abas."""
+        ...
+
+    def create_table(self, title: str, header: list[str]) -> None:
+        """Cria a tabela (vazia se `header` for vazio). Já existir não é erro."""
+        ...
+
+    def read_table(self, title: str) -> list[list[str]]:
+        """Grade inteira (header incluso), sem linhas/células vazias no fim."""
+        ...
+
+    def append(self, title: str, rows: list[list]) -> int:
+        """Anexa `rows` depois da última linha; retorna o nº da primeira linha gravada."""
+        ...
+
+    def batch_update(self, title: str, cells: list[tuple[int, int, object]]) -> None:
+        """Grava (linha, coluna, valor), 1-based, numa operação só."""
+        ...
+
+    def delete_rows(self, title: str, rows: list[int]) -> None:
+        """Apaga as linhas `rows`; as de baixo sobem, como no Sheets."""
+        ...
+
+    def delete_by_id(self, title: str, id_col: str, ids) -> int:
+        """Apaga as linhas cujo `id_col` está em `ids`; retorna quantas."""
+        ...
+
+    def version(self) -> str:
+        """Sinal de mudança: muda a cada escrita em qualquer tabela."""
+        ...
+
+
+# =========================
+# Helpers
+# =========================
+def cell_text(v) -> str:
+    """Valor Python -> texto como o Sheets devolve (None/NaN -> "", True -> "TRUE", 3.0 -> "3")."""
+    if v is None:
+        return ""
+    try:
+        if pd.isna(v):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def row_blocks(rows) -> list[tuple[int, int]]:
+    """Linhas -> blocos contíguos (início, fim) em ordem crescente ([2,3,4,7] -> [(2,4),(7,7)])."""
+    rows = sorted(set(int(r) for r in rows))
+    if not rows:
+        return []
+    blocos, ini = [], rows[0]
+    for a, b in zip(rows, rows[1:] + [None]):
+        if b != a + 1:
+            blocos.append((ini, a))
+            ini = b
+    return blocos
+
+
+def _trim(grid: list[list[str]]) -> list[list[str]]:
+    """Tira células vazias no fim de cada linha e linhas vazias no fim (como a API)."""
+    out = []
+    for r in grid:
+        r = list(r)
+        while r and r[-1] == "":
+            r.pop()
+        out.append(r)
+    while out and not out[-1]:
+        out.pop()
+    return out
+
+
+class _BaseBackend:
+    """delete_by_id genérico em cima de read_table + delete_rows."""
+
+    def delete_by_id(self, title: str, id_col: str, ids) -> int:
+        grid = self.read_table(title)
+        if not grid or id_col not in grid[0]:
+            return 0
+        j = grid[0].index(id_col)
+        alvo = {str(i) for i in ([ids] if isinstance(ids, (str, int)) else ids)}
+        rows = [i + 1 for i, r in enumerate(grid) if i > 0 and j < len(r) and r[j] in alvo]
+        if rows:
+            self.delete_rows(title, rows)
+        return len(rows)
+
+
+# =========================
+# Memória (testes / benchmarks)
+# =========================
+class MemoryBackend(_BaseBackend):
+    """
+    Tabelas em listas de listas, no processo. Aceita dados iniciais como
+    {título: DataFrame} ou {título: grade (header na 1ª linha)}.
+    """
+
+    def __init__(self, tables: dict | None = None):
+        self._lock = threading.Lock()
+        self._tables: dict[str, list[list[str]]] = {}
+        self._rev = 0
+        for title, data in (tables or {}).items():
+            if isinstance(data, pd.DataFrame):
+                grid = [[str(c) for c in data.columns]]
+                grid += [[cell_text(v) for v in r] for r in data.itertuples(index=False, name=None)]
+            else:
+                grid = [[cell_text(v) for v in r] for r in data]
+            self._tables[title] = grid
+
+    def _grid(self, title: str) -> list[list[str]]:
+        try:
+            return self._tables[title]
+        except KeyError:
+            raise KeyError(f"Tabela {title!r} não existe.") from None
+
+    def list_tables(self) -> list[str]:
+        with self._lock:
+            return list(self._tables)
+
+    def create_table(self, title: str, header: list[str]) -> None:
+        with self._lock:
+            if title not in self._tables:
+                self._tables[title] = [[cell_text(h) for h in header]] if header else []
+                self._rev += 1
+
+    def read_table(self, title: str) -> list[list[str]]:
+        with self._lock:
+            return _trim(self._grid(title))
+
+    def append(self, title: str, rows: list[list]) -> int:
+        with self._lock:
+            grid = self._grid(title)
+            grid[:] = _trim(grid)
+            first = len(grid) + 1
+            grid.extend([cell_text(v) for v in r] for r in rows)
+            self._rev += 1
+            return first
+
+    def batch_update(self, title: str, cells: list[tuple[int, int, object]]) -> None:
+        with self._lock:
+            grid = self._grid(title)
+            for row, col, val in cells:
+                row, col = int(row), int(col)
+                while len(grid) < row:
+                    grid.append([])
+                r = grid[row - 1]
+                if len(r) < col:
+                    r.extend([""] * (col - len(r)))
+                r[col - 1] = cell_text(val)
+            self._rev += 1
+
+    def delete_rows(self, title: str, rows: list[int]) -> None:
+        with self._lock:
+            grid = self._grid(title)
+            for r in sorted(set(int(x) for x in rows), reverse=True):
+                if 0 < r <= len(grid):
+                    del grid[r - 1]
+            self._rev += 1
+
+    def version(self) -> str:
+        with self._lock:
+            return str(self._rev)
+
+
+# =========================
+# SQLite (uso offline)
+# =========================
+def _q(name: str) -> str:
+    """Identificador SQL entre aspas."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class SQLiteBackend(_BaseBackend):
+    """
+    Planilha inteira num arquivo SQLite.
+    - Cada aba vira uma tabela `__row INTEGER PRIMARY KEY, c1, c2, ...` (TEXT),
+      header na linha 1; cresce com ALTER TABLE quando chega coluna nova.
+    - `__tables` guarda a ordem e a largura das abas; `__meta.rev` é o sinal de mudança.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._write(bump=False) as con:
+            con.execute("CREATE TABLE IF NOT EXISTS __tables (title TEXT PRIMARY KEY, width INTEGER NOT NULL, pos INTEGER)")
+            con.execute("CREATE TABLE IF NOT EXISTS __meta (k TEXT PRIMARY KEY, v INTEGER)")
+            con.execute("INSERT OR IGNORE INTO __meta (k, v) VALUES ('rev', 0)")
+
+    # ---------- conexão ----------
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    @contextmanager
+    def _write(self, bump: bool = True):
+        """Transação de escrita serializada no processo; toda escrita sobe o `rev`."""
+        with self._lock, closing(self._connect()) as con:
+            try:
+                yield con
+                if bump:
+                    con.execute("UPDATE __meta SET v = v + 1 WHERE k='rev'")
+                con.commit()
+            except Exception:
+                con.rollback()
+                raise
+
+    def _width(self, con: sqlite3.Connection, title: str) -> int:
+        row = con.execute("SELECT width FROM __tables WHERE title=?", (title,)).fetchone()
+        if row is None:
+            raise KeyError(f"Tabela {title!r} não existe.")
+        return int(row[0])
+
+    def _widen(self, con: sqlite3.Connection, title: str, width: int) -> None:
+        atual = self._width(con, title)
+        for j in range(atual + 1, width + 1):
+            con.execute(f"ALTER TABLE {_q(title)} ADD COLUMN c{j} TEXT DEFAULT ''")
+        if width > atual:
+            con.execute("UPDATE __tables SET width=? WHERE title=?", (width, title))
+
+    # ---------- protocolo ----------
+    def list_tables(self) -> list[str]:
+        with closing(self._connect()) as con:
+            return [r[0] for r in con.execute("SELECT title FROM __tables ORDER BY pos")]
+
+    def create_table(self, title: str, header: list[str]) -> None:
+        with self._write() as con:
+            if con.execute("SELECT 1 FROM __tables WHERE title=?", (title,)).fetchone():
+                return
+            con.execute(f"CREATE TABLE {_q(title)} (__row INTEGER PRIMARY KEY)")
+            pos = con.execute("SELECT COALESCE(MAX(pos), -1) + 1 FROM __tables").fetchone()[0]
+            con.execute("INSERT INTO __tables (title, width, pos) VALUES (?, 0, ?)", (title, pos))
+            if header:
+                self._widen(con, title, len(header))
+                cols = ", ".join(f"c{j}" for j in range(1, len(header) + 1))
+                marks = ", ".join("?" for _ in header)
+                con.execute(f"INSERT INTO {_q(title)} (__row, {cols}) VALUES (1, {marks})",
+                            [cell_text(h) for h in header])
+
+    def read_table(self, title: str) -> list[list[str]]:
+        with closing(self._connect()) as con:
+            width = self._width(con, title)
+            cols = ", ".join(["__row"] + [f"c{j}" for j in range(1, width + 1)])
+            rows = con.execute(f"SELECT {cols} FROM {_q(title)} ORDER BY __row").fetchall()
+        grid: list[list[str]] = []
+        for r in rows:
+            while len(grid) < r[0] - 1:
+                grid.append([])
+            grid.append(["" if v is None else v for v in r[1:]])
+        return _trim(grid)
+
+    def append(self, title: str, rows: list[list]) -> int:
+        with self._write() as con:
+            width = max((len(r) for r in rows), default=0)
+            self._widen(con, title, width)
+            first = con.execute(f"SELECT COALESCE(MAX(__row), 0) + 1 FROM {_q(title)}").fetchone()[0]
+            if width:
+                cols = ", ".join(f"c{j}" for j in range(1, width + 1))
+                marks = ", ".join("?" for _ in range(width + 1))
+                con.executemany(
+                    f"INSERT INTO {_q(title)} (__row, {cols}) VALUES ({marks})",
+                    ([first + i] + [cell_text(v) for v in (list(r) + [""] * width)[:width]]
+                     for i, r in enumerate(rows)),
+                )
+            return int(first)
+
+    def batch_update(self, title: str, cells: list[tuple[int, int, object]]) -> None:
+        cells = [(int(r), int(c), cell_text(v)) for r, c, v in cells]
+        if not cells:
+            return
+        with self._write() as con:
+            self._widen(con, title, max(c for _, c, _ in cells))
+            t = _q(title)
+            con.executemany(f"INSERT OR IGNORE INTO {t} (__row) VALUES (?)", {(r,) for r, _, _ in cells})
+            for r, c, v in cells:
+                con.execute(f"UPDATE {t} SET c{c}=? WHERE __row=?", (v, r))
+
+    def delete_rows(self, title: str, rows: list[int]) -> None:
+        if not rows:
+            return
+        t = _q(title)
+        with self._write() as con:
+            self._width(con, title)
+            # de baixo p/ cima, um bloco por vez
+            for ini, fim in reversed(row_blocks(rows)):
+                con.execute(f"DELETE FROM {t} WHERE __row BETWEEN ? AND ?", (ini, fim))
+                # em 2 passos p/ não colidir com a PRIMARY KEY no meio do UPDATE
+                con.execute(f"UPDATE {t} SET __row = -(__row - ?) WHERE __row > ?", (fim - ini + 1, fim))
+                con.execute(f"UPDATE {t} SET __row = -__row WHERE __row < 0")
+
+    def version(self) -> str:
+        with closing(self._connect()) as con:
+            return str(con.execute("SELECT v FROM __meta WHERE k='rev'").fetchone()[0])
+
+
+# =========================
+# Google Sheets
+# =========================
+class SheetsBackend(_BaseBackend):
+    """
+    O protocolo em cima de um gspread.Spreadsheet, usado por `copy_tables`
+    (ex.: copiar a planilha p/ o SQLite). NÃO é o caminho de leitura/escrita
+    do app com o Google: utils_casulo fala com o gspread direto.
+    """
+
+    def __init__(self, ss: gspread.Spreadsheet):
+        self.ss = ss
+
+    def list_tables(self) -> list[str]:
+        return [w.title for w in self.ss.worksheets()]
+
+    def create_table(self, title: str, header: list[str]) -> None:
+        if title in self.list_tables():
+            return
+        ws = self.ss.add_worksheet(title=title, rows=1, cols=max(len(header), 1))
+        if header:
+            ws.update(values=[list(header)], range_name="A1")
+
+    def read_table(self, title: str) -> list[list[str]]:
+        resp = self.ss.values_get(absolute_range_name(title), params={
+            "valueRenderOption": "FORMULA", "dateTimeRenderOption": "FORMATTED_STRING"})
+        return [[cell_text(v) for v in r] for r in resp.get("values", [])]
+
+    def append(self, title: str, rows: list[list]) -> int:
+        resp = self.ss.worksheet(title).append_rows(
+            [[cell_text(v) for v in r] for r in rows],
+            value_input_option="USER_ENTERED",
+            insert_data_option="INSERT_ROWS",
+            table_range="A1",
+        )
+        rng = resp["updates"]["updatedRange"].split("!")[-1].split(":")[0]
+        return a1_to_rowcol(rng)[0]
+
+    def batch_update(self, title: str, cells: list[tuple[int, int, object]]) -> None:
+        data = [{"range": rowcol_to_a1(int(r), int(c)), "values": [[cell_text(v)]]} for r, c, v in cells]
+        if data:
+            self.ss.worksheet(title).batch_update(data, value_input_option="USER_ENTERED")
+
+    def delete_rows(self, title: str, rows: list[int]) -> None:
+        blocos = row_blocks(rows)
+        if not blocos:
+            return
+        sheet_id = self.ss.worksheet(title).id
+        self.ss.batch_update({"requests": [
+            {"deleteDimension": {"range": {
+                "sheetId": sheet_id, "dimension": "ROWS", "startIndex": ini - 1, "endIndex": fim,
+            }}}
+            for ini, fim in reversed(blocos)
+        ]})
+
+    def version(self) -> str:
+        return str(self.ss.get_lastUpdateTime())
+
+
+def copy_tables(src: Backend, dst: Backend, titles: list[str] | None = None) -> dict[str, int]:
+    """
+    Copia abas de `src` p/ `dst` (ex.: Sheets -> SQLite p/ rodar offline).
+    Tabelas que já existem no destino são esvaziadas antes. Retorna {título: nº de linhas de dados}.
+    """
+    out = {}
+    existentes = set(dst.list_tables())
+    for title in titles or src.list_tables():
+        grid = src.read_table(title)
+        if title in existentes:
+            dst.delete_rows(title, list(range(1, len(dst.read_table(title)) + 1)))
+        else:
+            dst.create_table(title, [])
+        if grid:
+            dst.append(title, grid)
+        out[title] = max(len(grid) - 1, 0)
+    return out
+
+
+# =========================
+# Adaptador gspread (p/ utils_casulo e as páginas)
+# =========================
+# Expõe o pedaço da API do gspread que o app usa, em cima de qualquer Backend,
+# para que connect() devolva um "Spreadsheet" local sem mudar nenhuma página.
+
+def _split_range(rng: str) -> tuple[str, str]:
+    """"'Aba'!B2:B" -> ("Aba", "B2:B"); "'Aba'" ou "Aba" -> ("Aba", "")."""
+    if rng.startswith("'"):
+        i, buf = 1, []
+        while i < len(rng):
+            ch = rng[i]
+            if ch == "'":
+                if rng[i + 1:i + 2] == "'":
+                    buf.append("'")
+                    i += 2
+                    continue
+                i += 1
+                break
+            buf.append(ch)
+            i += 1
+        return "".join(buf), rng[i + 1:] if rng[i:i + 1] == "!" else ""
+    title, _, a1 = rng.partition("!")
+    return title, a1
+
+
+def _slice(grid: list[list[str]], a1: str, major: str = "ROWS") -> list[list[str]]:
+    """Recorte `a1` da grade, no formato de resposta da API (ROWS ou COLUMNS)."""
+    if a1:
+        g = a1_range_to_grid_range(a1)
+        r0, r1 = g.get("startRowIndex", 0), g.get("endRowIndex")
+        c0, c1 = g.get("startColumnIndex", 0), g.get("endColumnIndex")
+        grid = [r[c0:c1] for r in grid[r0:r1]]
+    if major == "COLUMNS":
+        width = max((len(r) for r in grid), default=0)
+        grid = [[r[j] if j < len(r) else "" for r in grid] for j in range(width)]
+    return _trim(grid)
+
+
+class LocalWorksheet:
+    def __init__(self, spreadsheet: "LocalSpreadsheet", title: str, sheet_id: int):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+
+    def __repr__(self) -> str:
+        return f"<LocalWorksheet {self.title!r} id:{self.id}>"
+
+    @property
+    def _backend(self) -> Backend:
+        return self.spreadsheet.backend
+
+    @property
+    def spreadsheet_id(self) -> str:
+        return self.spreadsheet.id
+
+    @property
+    def row_count(self) -> int:
+        return max(len(self._backend.read_table(self.title)), 1)
+
+    @property
+    def col_count(self) -> int:
+        return max((len(r) for r in self._backend.read_table(self.title)), default=1) or 1
+
+    # ---------- leitura ----------
+    def get_all_values(self, **kwargs) -> list[list[str]]:
+        grid = self._backend.read_table(self.title)
+        width = max((len(r) for r in grid), default=0)
+        return [r + [""] * (width - len(r)) for r in grid]
+
+    def row_values(self, row: int, **kwargs) -> list[str]:
+        grid = self._backend.read_table(self.title)
+        return list(grid[row - 1]) if 0 < row <= len(grid) else []
+
+    def col_values(self, col: int, **kwargs) -> list[str]:
+        letra = rowcol_to_a1(1, col)[:-1]
+        return (_slice(self._backend.read_table(self.title), f"{letra}:{letra}", "COLUMNS") or [[]])[0]
+
+    def batch_get(self, ranges: list[str], **kwargs) -> list[list[list[str]]]:
+        grid = self._backend.read_table(self.title)
+        return [_slice(grid, a1) for a1 in ranges]
+
+    # ---------- escrita ----------
+    def _cells(self, a1: str, values: list[list]) -> list[tuple[int, int, object]]:
+        row, col = a1_to_rowcol(a1.split(":")[0]) if a1 else (1, 1)
+        return [(row + i, col + j, v) for i, r in enumerate(values) for j, v in enumerate(r)]
+
+    def append_rows(self, values: list[list], value_input_option=None, insert_data_option=None,
+                    table_range=None, **kwargs) -> dict:
+        first = self._backend.append(self.title, values)
+        width = max((len(r) for r in values), default=1) or 1
+        rng = f"A{first}:{rowcol_to_a1(first + len(values) - 1, width)}"
+        return {"updates": {"updatedRange": absolute_range_name(self.title, rng), "updatedRows": len(values)}}
+
+    def append_row(self, values: list, **kwargs) -> dict:
+        return self.append_rows([values], **kwargs)
+
+    def batch_update(self, data: list[dict], value_input_option=None, **kwargs) -> dict:
+        cells = [c for d in data for c in self._cells(d["range"], d["values"])]
+        self._backend.batch_update(self.title, cells)
+        return {"totalUpdatedCells": len(cells)}
+
+    def update(self, values=None, range_name=None, **kwargs) -> dict:
+        if isinstance(values, str):  # forma antiga: ws.update("A1", valores)
+            values, range_name = range_name, values
+        if values and not isinstance(values[0], (list, tuple)):
+            values = [values]
+        cells = self._cells(range_name or "A1", values or [])
+        self._backend.batch_update(self.title, cells)
+        return {"updatedCells": len(cells)}
+
+    def delete_rows(self, start_index: int, end_index: int | None = None) -> None:
+        self._backend.delete_rows(self.title, list(range(start_index, (end_index or start_index) + 1)))
+
+
+class LocalSpreadsheet:
+    """Spreadsheet "de mentira" sobre um Backend (SQLite ou memória)."""
+
+    def __init__(self, backend: Backend, id: str = "local", title: str = "Casulo (local)"):
+        self.backend = backend
+        self.id = id
+        self.title = title
+        self._ids: dict[str, int] = {}
+
+    def __repr__(self) -> str:
+        return f"<LocalSpreadsheet {self.title!r} backend:{type(self.backend).__name__}>"
+
+    def _ws(self, title: str) -> LocalWorksheet:
+        sheet_id = self._ids.setdefault(title, len(self._ids))
+        return LocalWorksheet(self, title, sheet_id)
+
+    def worksheets(self, **kwargs) -> list[LocalWorksheet]:
+        return [self._ws(t) for t in self.backend.list_tables()]
+
+    def worksheet(self, title: str) -> LocalWorksheet:
+        if title not in self.backend.list_tables():
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self._ws(title)
+
+    def add_worksheet(self, title: str, rows: int = 1, cols: int = 1, index=None) -> LocalWorksheet:
+        self.backend.create_table(title, [])
+        return self._ws(title)
+
+    def values_get(self, range: str, params: dict | None = None) -> dict:
+        title, a1 = _split_range(range)
+        major = (params or {}).get("majorDimension", "ROWS")
+        return {"range": range, "majorDimension": major,
+                "values": _slice(self.backend.read_table(title), a1, major)}
+
+    def values_batch_get(self, ranges: list[str], params: dict | None = None) -> dict:
+        return {"spreadsheetId": self.id, "valueRanges": [self.values_get(r, params) for r in ranges]}
+
+    def batch_update(self, body: dict) -> dict:
+        """
+        Só deleteDimension de linhas (ROWS) — o único pedido estrutural que o
+        app manda (delete_by_id / SheetsBackend.delete_rows). Qualquer outro
+        levanta ValueError, antes de aplicar o lote.
+        """
+        por_id = {v: k for k, v in self._ids.items()}
+        for req in body.get("requests", []):
+            rng = (req.get("deleteDimension") or {}).get("range") or {}
+            if rng.get("dimension") != "ROWS":
+                raise ValueError(f"batch_update local só aceita deleteDimension de linhas (ROWS); "
+                                 f"recebido: {list(req)}")
+            if rng.get("sheetId") not in por_id:
+                raise ValueError(f"batch_update local: sheetId desconhecido {rng.get('sheetId')!r}")
+        for req in body.get("requests", []):
+            rng = req["deleteDimension"]["range"]
+            self.backend.delete_rows(por_id[rng["sheetId"]],
+                                     list(range(rng["startIndex"] + 1, rng["endIndex"] + 1)))
+        return {"spreadsheetId": self.id, "replies": [{} for _ in body.get("requests", [])]}
+
+    def get_lastUpdateTime(self) -> str:
+        return self.backend.version()
+
+
+__all__ = [
+    "Backend", "MemoryBackend", "SQLiteBackend", "SheetsBackend", "LocalSpreadsheet", "LocalWorksheet",
+    "copy_tables", "cell_text", "row_blocks",
+]
@@ -2,12 +2,568 @@
 
 from __future__ import annotations
 
+import random
+import sqlite3
 import time
+import threading
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from datetime import date, datetime
+
 import pandas as pd
+import requests
 import streamlit as st
 import gspread
 from google.oauth2.service_account import Credentials
-from gspread_dataframe import get_as_dataframe, set_with_dataframe
+from gspread.http_client import HTTPClient
+from gspread.utils import a1_to_rowcol, absolute_range_name, rowcol_to_a1
+
+from utils_agenda import ABA_COL, SessionIndex
+from utils_backend import Backend, LocalSpreadsheet, MemoryBackend, SQLiteBackend, row_blocks
+from utils_journal import DONE, FAILED, PENDING, Journal, get_journal
+from utils_mirror import MIRROR_TABLES, Mirror, get_mirror, iso_dates
+from utils_perf import count_call, endpoint_label, timed
+from utils_rollup import ROLLUPS, Rollup
+from utils_schema import (DESP_COLS, ID_COLS, PAC_COLS, PAG_COLS, REL_COLS, SES_COLS,
+                          apply_schema, archive_title, base_title, parse_dates, split_archive, typed_col)
+import utils_snapshot as snapshot
+
+
+# =========================
+# Cache de leituras (por worksheet)
+# =========================
+CACHE_TTL_PADRAO = 120  # segundos; sobrescreva com SHEETS_CACHE_TTL em st.secrets
+
+MIRROR_MAX_AGE_PADRAO = 300  # segundos; sobrescreva com MIRROR_MAX_AGE em st.secrets
+
+SIGNAL_TTL_PADRAO = 5  # segundos entre consultas ao modifiedTime; sobrescreva com SHEETS_SIGNAL_TTL
+
+READ_WORKERS_PADRAO = 4  # leituras simultâneas em read_ws_concurrent; sobrescreva com SHEETS_READ_WORKERS
+
+SHARED_GEN_TTL = 1.0  # segundos entre leituras das gerações do espelho compartilhado
+
+# chave -> (momento da validação, df, ws, sinal de mudança quando foi baixado)
+_ws_cache: dict[tuple, tuple[float, pd.DataFrame, gspread.Worksheet, str | None]] = {}
+_header_cache: dict[tuple, list[str]] = {}
+_handle_cache: dict[tuple, gspread.Worksheet] = {}
+_signal_cache: dict[str | None, tuple[float, str | None]] = {}
+# (spreadsheet_id, título) -> (coluna de ID, {ID: nº da linha na planilha})
+_row_index: dict[tuple, tuple[str, dict[str, int]]] = {}
+# chave do _ws_cache -> `gen` da aba no espelho quando a entrada foi gravada
+_ws_gen: dict[tuple, int] = {}
+_gen_snapshot: tuple[float, dict[str, int]] | None = None
+_ws_cache_lock = threading.Lock()
+
+
+def _cache_ttl() -> float:
+    try:
+        return float(st.secrets.get("SHEETS_CACHE_TTL", CACHE_TTL_PADRAO))
+    except Exception:
+        return float(CACHE_TTL_PADRAO)
+
+
+def _cache_key(ss: gspread.Spreadsheet, title: str, expected_cols: list[str] | None,
+               typed: bool = False) -> tuple:
+    return (getattr(ss, "id", None), title, tuple(expected_cols or ()), bool(typed))
+
+
+def _ws_title(target) -> str | None:
+    if isinstance(target, str):
+        return target
+    return getattr(target, "title", None)
+
+
+def _signal_ttl() -> float:
+    try:
+        return float(st.secrets.get("SHEETS_SIGNAL_TTL", SIGNAL_TTL_PADRAO))
+    except Exception:
+        return float(SIGNAL_TTL_PADRAO)
+
+
+def _change_signal(ss: gspread.Spreadsheet) -> str | None:
+    """
+    Sinal barato de mudança: `modifiedTime` do arquivo no Drive (1 chamada de
+    metadados, sem baixar células). O valor é reaproveitado por SHEETS_SIGNAL_TTL
+    segundos, então várias abas lidas no mesmo rerun custam uma consulta só.
+    Retorna None se o Drive não responder (aí vale só o TTL, como antes).
+    """
+    sid = getattr(ss, "id", None)
+    now = time.monotonic()
+    with _ws_cache_lock:
+        hit = _signal_cache.get(sid)
+    if hit and now - hit[0] < _signal_ttl():
+        return hit[1]
+    try:
+        sig = str(ss.get_lastUpdateTime())
+    except Exception:
+        sig = None
+    with _ws_cache_lock:
+        _signal_cache[sid] = (now, sig)
+    return sig
+
+
+def _cached(ss: gspread.Spreadsheet, key: tuple, ttl: float) -> tuple[pd.DataFrame, gspread.Worksheet] | None:
+    """
+    Entrada do cache ainda válida para `key`:
+      - dentro do `ttl` -> volta sem nenhuma chamada;
+      - vencida, mas o sinal de mudança é o mesmo de quando foi baixada ->
+        revalida (novo prazo de `ttl`) e volta sem baixar a grade.
+    Com espelho, só vale se nenhum processo mexeu na aba depois (ver `_shared_ok`).
+    """
+    with _ws_cache_lock:
+        hit = _ws_cache.get(key)
+    if not hit or ttl <= 0 or not _shared_ok(key):
+        return None
+    ts, df, ws, sig = hit
+    now = time.monotonic()
+    if now - ts < ttl:
+        return df, ws
+    if sig is not None and _change_signal(ss) == sig:
+        with _ws_cache_lock:
+            if _ws_cache.get(key) is hit:
+                _ws_cache[key] = (now, df, ws, sig)
+        return df, ws
+    return None
+
+
+def _mirror() -> Mirror | None:
+    """Espelho SQLite local, habilitado por MIRROR_DB (caminho do arquivo) em st.secrets."""
+    try:
+        path = (st.secrets.get("MIRROR_DB", "") or "").strip()
+    except Exception:
+        path = ""
+    return get_mirror(path) if path else None
+
+
+def _mirror_max_age() -> float:
+    try:
+        return float(st.secrets.get("MIRROR_MAX_AGE", MIRROR_MAX_AGE_PADRAO))
+    except Exception:
+        return float(MIRROR_MAX_AGE_PADRAO)
+
+
+def _mirror_ok(m: Mirror, ss: gspread.Spreadsheet, title: str) -> bool:
+    """Espelho utilizável: puxado há pouco OU o arquivo não mudou desde então."""
+    if m.is_fresh(title, _mirror_max_age()):
+        return True
+    sig = _change_signal(ss)
+    return sig is not None and m.revalidate(title, sig)
+
+
+def _mirror_fresh(m: Mirror | None, ss: gspread.Spreadsheet, title: str) -> tuple[pd.DataFrame, str | None] | None:
+    """(aba inteira, versão) do espelho, se ele estiver em dia; senão None."""
+    if m is None or not _mirror_ok(m, ss, title):
+        return None
+    raw = m.read(title)
+    if raw is None:
+        return None
+    _index_from_frame(ss, title, raw)
+    return raw, m.version(title)
+
+
+@contextmanager
+def _fetch_locks(m: Mirror | None, titles: list[str]):
+    """
+    Com espelho, só um processo baixa cada aba por vez: os outros esperam e
+    depois a encontram em dia no espelho. Locks em ordem alfabética (sem deadlock).
+    """
+    with ExitStack() as stack:
+        if m is not None:
+            for t in sorted(set(titles)):
+                stack.enter_context(m.fetch_lock(t))
+        yield
+
+
+# =========================
+# Cache compartilhado entre processos (via espelho)
+# =========================
+# Vários servidores Streamlit apontando MIRROR_DB p/ o mesmo arquivo dividem
+# os downloads: quem baixa grava no espelho e os demais leem dele. Cada
+# entrada do cache em memória lembra o `gen` da aba no espelho; se outro
+# processo escreveu/baixou depois, o gen mudou e a entrada deixa de valer.
+def _shared_gens(m: Mirror, fresh: bool = False) -> dict[str, int]:
+    """{aba: gen} do espelho, relido no máximo a cada SHARED_GEN_TTL s (ou agora, se `fresh`)."""
+    global _gen_snapshot
+    now = time.monotonic()
+    with _ws_cache_lock:
+        snap = _gen_snapshot
+    if not fresh and snap is not None and now - snap[0] < SHARED_GEN_TTL:
+        return snap[1]
+    try:
+        gens = m.generations()
+    except sqlite3.Error:
+        gens = {}
+    with _ws_cache_lock:
+        _gen_snapshot = (now, gens)
+    return gens
+
+
+def _remember_gen(key: tuple) -> None:
+    """Anota o gen atual da aba de `key` (chame logo depois de gravar no _ws_cache)."""
+    m = _mirror()
+    if m is None:
+        return
+    gen = _shared_gens(m, fresh=True).get(key[1], 0)
+    with _ws_cache_lock:
+        _ws_gen[key] = gen
+
+
+def _shared_ok(key: tuple) -> bool:
+    """False se a aba mudou no espelho compartilhado desde que `key` foi guardada."""
+    m = _mirror()
+    if m is None:
+        return True
+    with _ws_cache_lock:
+        want = _ws_gen.get(key)
+    return want is None or _shared_gens(m).get(key[1], 0) == want
+
+
+def _drop_cached(title: str | None) -> None:
+    """Remove a aba só do cache em memória (o espelho já foi atualizado por quem escreveu)."""
+    global _gen_snapshot
+    with _ws_cache_lock:
+        for k in [k for k in _ws_cache if k[1] == title]:
+            del _ws_cache[k]
+            _ws_gen.pop(k, None)
+        # a escrita mudou o modifiedTime: o próximo sinal tem que vir do Drive
+        _signal_cache.clear()
+        _gen_snapshot = None
+
+
+def invalidate_ws(target) -> None:
+    """
+    Descarta do cache as leituras de UMA worksheet (e marca o espelho como sujo).
+    `target` pode ser o título ("Sessoes") ou o próprio gspread.Worksheet.
+    Use depois de escritas feitas direto no gspread (ex.: ws.delete_rows).
+    """
+    title = _ws_title(target)
+    _drop_cached(title)
+    with _ws_cache_lock:
+        for k in [k for k in _row_index if k[1] == title]:
+            del _row_index[k]
+        for k, ent in _rollups.items():
+            if k[1] == title:
+                ent[0] = 0.0  # próximo rollup() confere o sinal de mudança
+    m = _mirror()
+    if m is not None and title:
+        m.mark_stale(title)
+
+
+def clear_cache() -> None:
+    """Esvazia o cache de todas as worksheets (inclui os headers)."""
+    global _gen_snapshot
+    with _ws_cache_lock:
+        _ws_cache.clear()
+        _ws_gen.clear()
+        _gen_snapshot = None
+        _header_cache.clear()
+        _handle_cache.clear()
+        _signal_cache.clear()
+        _row_index.clear()
+        _rollups.clear()
+        _partitions.clear()
+        _session_index.clear()
+
+
+def _header_key(ws: gspread.Worksheet) -> tuple:
+    return (getattr(ws, "spreadsheet_id", None), ws.title)
+
+
+def _ws_header(ws: gspread.Worksheet) -> list[str]:
+    """Header (linha 1) da worksheet, lido uma vez e guardado em cache."""
+    key = _header_key(ws)
+    with _ws_cache_lock:
+        hdr = _header_cache.get(key)
+    if hdr is None:
+        hdr = [str(h).strip() for h in ws.row_values(1)]
+        # remove células vazias à direita
+        while hdr and not hdr[-1]:
+            hdr.pop()
+        with _ws_cache_lock:
+            _header_cache[key] = hdr
+    return list(hdr)
+
+
+def _set_ws_header(ws: gspread.Worksheet, headers: list[str]) -> None:
+    """Escreve o header na linha 1 e atualiza o cache de headers."""
+    ws.update(values=[list(headers)], range_name="A1")
+    with _ws_cache_lock:
+        _header_cache[_header_key(ws)] = list(headers)
+
+
+# =========================
+# Cota da API (token bucket + backoff)
+# =========================
+READ_QPM_PADRAO = 60   # leituras/min por usuário (cota do Sheets); sobrescreva com SHEETS_READ_QPM
+WRITE_QPM_PADRAO = 60  # escritas/min por usuário; sobrescreva com SHEETS_WRITE_QPM
+
+# erros que valem nova tentativa: em leituras, 408/429/5xx; em escritas, só
+# 429 (a API recusou antes de processar — repetir um append após 5xx pode duplicar)
+_RETRY_READ = {408, 429, 500, 502, 503, 504}
+_RETRY_WRITE = {429}
+
+
+class _TokenBucket:
+    """
+    Balde de fichas compartilhado pelo processo.
+    Enche a `per_minute`*0.8 fichas/min e guarda no máximo `per_minute`*0.2, então
+    nenhuma janela de 60 s passa de `per_minute` chamadas.
+    """
+
+    def __init__(self, per_minute: float):
+        per_minute = max(float(per_minute), 1.0)
+        self.rate = per_minute * 0.8 / 60.0
+        self.capacity = max(per_minute * 0.2, 1.0)
+        self.tokens = self.capacity
+        self.ts = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Pega 1 ficha, esperando se preciso. Retorna quantos segundos esperou."""
+        esperou = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+                self.ts = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return esperou
+                falta = (1 - self.tokens) / self.rate
+            time.sleep(falta)
+            esperou += falta
+
+
+_buckets: dict[str, _TokenBucket] = {}
+
+
+def _bucket(kind: str) -> _TokenBucket:
+    with _ws_cache_lock:
+        b = _buckets.get(kind)
+        if b is None:
+            chave, padrao = (("SHEETS_READ_QPM", READ_QPM_PADRAO) if kind == "read"
+                             else ("SHEETS_WRITE_QPM", WRITE_QPM_PADRAO))
+            try:
+                qpm = float(st.secrets.get(chave, padrao))
+            except Exception:
+                qpm = float(padrao)
+            b = _buckets[kind] = _TokenBucket(qpm)
+        return b
+
+
+def _request_kind(method: str, endpoint: str) -> str:
+    """'read' p/ GET e consultas via POST (values:batchGet, getByDataFilter); senão 'write'."""
+    if method.upper() == "GET" or endpoint.endswith((":batchGet", ":batchGetByDataFilter", ":getByDataFilter")):
+        return "read"
+    return "write"
+
+
+def _should_retry(err: gspread.exceptions.APIError, kind: str) -> bool:
+    code = getattr(err, "code", None)
+    # Drive API devolve 403/usageLimits quando estoura a cota
+    erros = (getattr(err, "error", None) or {}).get("errors") or [{}]
+    if code == 403 and erros[0].get("domain") == "usageLimits":
+        return True
+    return code in (_RETRY_READ if kind == "read" else _RETRY_WRITE)
+
+
+def with_backoff(fn, kind: str = "read", tentativas: int = 5, base: float = 1.0, teto: float = 32.0):
+    """
+    Executa `fn()` respeitando o balde de `kind` ("read"/"write") e repetindo
+    em erro de cota/servidor com backoff exponencial + jitter total
+    (espera aleatória entre 0 e min(teto, base*2^n) s). Demais erros sobem na hora.
+    """
+    for n in range(tentativas):
+        _bucket(kind).acquire()
+        try:
+            return fn()
+        except gspread.exceptions.APIError as e:
+            if n == tentativas - 1 or not _should_retry(e, kind):
+                raise
+        time.sleep(random.uniform(0, min(teto, base * 2 ** n)))
+
+
+class QuotaHTTPClient(HTTPClient):
+    """HTTPClient do gspread que passa TODA chamada por `with_backoff` (cota + retry)."""
+
+    def request(self, method, endpoint, *args, **kwargs):
+        kind = _request_kind(method, endpoint)
+
+        def _call():
+            t0 = time.perf_counter()
+            resp = super(QuotaHTTPClient, self).request(method, endpoint, *args, **kwargs)
+            count_call("sheets", endpoint_label(method, endpoint), len(resp.content or b""), t0)
+            return resp
+        return with_backoff(_call, kind)
+
+
+# =========================
+# Leituras de contingência (dados "velhos")
+# =========================
+# erros de leitura que, esgotadas as tentativas, caem no último dado bom
+_READ_ERRORS = (gspread.exceptions.APIError, requests.exceptions.RequestException)
+
+_stale: dict[str, tuple[float, str]] = {}  # título -> (quando o dado servido foi baixado, motivo)
+
+
+def stale_sheets() -> dict[str, tuple[float, str]]:
+    """Abas servidas do último dado bom por falha do Google: {título: (epoch do dado, erro)}."""
+    with _ws_cache_lock:
+        return dict(_stale)
+
+
+def _mark_stale_read(title: str, since: float, err: Exception) -> None:
+    """Registra e avisa (na barra lateral) que `title` está vindo de dado antigo."""
+    with _ws_cache_lock:
+        _stale[title] = (since, str(err))
+    try:
+        hora = datetime.fromtimestamp(since).strftime("%d/%m %H:%M") if since else "?"
+        st.sidebar.warning(f"⚠️ Google Sheets indisponível — **{title}** mostra os dados de {hora}.")
+    except Exception:
+        pass
+
+
+def _clear_stale(title: str) -> None:
+    with _ws_cache_lock:
+        _stale.pop(title, None)
+
+
+def _last_good(title: str, key: tuple, expected_cols: list[str] | None,
+               typed: bool) -> tuple[pd.DataFrame, gspread.Worksheet | None, float] | None:
+    """
+    Último dado bom de `title`, ignorando validade: o frame do cache em memória
+    ou, sem ele, a tabela do espelho local. Retorna (df, ws, epoch do dado) ou None.
+    """
+    with _ws_cache_lock:
+        hit = _ws_cache.get(key)
+        ws = _handle_cache.get((key[0], title))
+    if hit is not None:
+        return hit[1], hit[2], time.time() - (time.monotonic() - hit[0])
+    m = _mirror()
+    raw = m.read(title) if m is not None else None
+    if raw is not None:
+        return _prepare(raw, title, expected_cols, typed), ws, m.pulled_at(title)
+    return None
+
+
+def _serve_stale(title: str, key: tuple, expected_cols: list[str] | None, typed: bool,
+                 err: Exception) -> tuple[pd.DataFrame, gspread.Worksheet | None]:
+    """Devolve o último dado bom (com df.attrs["stale"]) ou repassa `err` se não houver."""
+    bom = _last_good(title, key, expected_cols, typed)
+    if bom is None:
+        raise err
+    df, ws, since = bom
+    _mark_stale_read(title, since, err)
+    df = df.copy()
+    df.attrs["stale"] = True
+    df.attrs["stale_since"] = since
+    return df, ws
+
+
+# =========================
+# Partida a quente (snapshot em disco)
+# =========================
+# Com SNAPSHOT_DIR em st.secrets, cada aba lida por inteiro (já tipada) é
+# fotografada em Parquet. Depois de um deploy/restart, o 1º acesso do processo
+# serve a fotografia na hora e uma thread busca o dado novo, que entra no
+# cache para o rerun seguinte. Backends locais não precisam disso.
+SNAPSHOT_MIN_INTERVAL = 30  # s entre regravações da mesma aba quando não há sinal de mudança
+
+_snap_saved: dict[tuple, tuple[float, str | None]] = {}  # chave -> (quando gravou, sinal gravado)
+_snap_tried: set[tuple] = set()  # chaves que já passaram pela partida a quente neste processo
+
+
+def _snapshot_dir(ss: gspread.Spreadsheet) -> str | None:
+    """Pasta dos snapshots (SNAPSHOT_DIR em st.secrets); None = desligado."""
+    if not snapshot.available() or str(getattr(ss, "id", "")).startswith("local-"):
+        return None
+    try:
+        path = (st.secrets.get("SNAPSHOT_DIR", "") or "").strip()
+    except Exception:
+        path = ""
+    return path or None
+
+
+def _snapshot_save(ss: gspread.Spreadsheet, key: tuple, df: pd.DataFrame,
+                   ws: gspread.Worksheet, sig: str | None) -> None:
+    """Grava (em segundo plano) o frame recém-carregado, se mudou desde a última gravação."""
+    folder = _snapshot_dir(ss)
+    if folder is None:
+        return
+    now = time.monotonic()
+    with _ws_cache_lock:
+        prev = _snap_saved.get(key)
+        if prev is not None and (prev[1] == sig if sig is not None else now - prev[0] < SNAPSHOT_MIN_INTERVAL):
+            return
+        _snap_saved[key] = (now, sig)
+    # propriedades da aba: no boot o handle é remontado sem buscar metadados
+    props = dict(ws._properties) if isinstance(ws, gspread.Worksheet) else None
+    meta = {"sig": sig, "saved_at": time.time(), "ws": props}
+    threading.Thread(target=snapshot.save, args=(snapshot.snapshot_path(folder, key), df, meta),
+                     name="casulo-snapshot", daemon=True).start()
+
+
+def _ws_from_props(ss: gspread.Spreadsheet, title: str, expected_cols: list[str] | None,
+                   props: dict | None) -> gspread.Worksheet:
+    """Handle da aba a partir das propriedades salvas no snapshot (sem chamada à API)."""
+    hkey = (getattr(ss, "id", None), title)
+    if props and isinstance(ss, gspread.Spreadsheet):
+        with _ws_cache_lock:
+            return _handle_cache.setdefault(hkey, gspread.Worksheet(ss, props, ss.id, ss.client))
+    return _open_or_create_ws(ss, title, expected_cols)
+
+
+def _warm_start(ss: gspread.Spreadsheet, key: tuple, title: str,
+                expected_cols: list[str] | None) -> tuple[pd.DataFrame, gspread.Worksheet] | None:
+    """
+    1º acesso do processo a `key` sem nada no cache: coloca o snapshot do disco
+    no cache e devolve (df, ws). Quem chama agenda `_refresh_later`.
+    """
+    folder = _snapshot_dir(ss)
+    if folder is None:
+        return None
+    with _ws_cache_lock:
+        if key in _snap_tried or key in _ws_cache:
+            return None
+        _snap_tried.add(key)
+    got = snapshot.load(snapshot.snapshot_path(folder, key))
+    if got is None:
+        return None
+    df, meta = got
+    ws = _ws_from_props(ss, title, expected_cols, meta.get("ws"))
+    now = time.monotonic()
+    with _ws_cache_lock:
+        df, ws = _ws_cache.setdefault(key, (now, df, ws, meta.get("sig")))[1:3]
+        _snap_saved[key] = (now, meta.get("sig"))
+    return df, ws
+
+
+def _refresh_later(ss: gspread.Spreadsheet, specs: dict[str, list[str] | None], typed: bool) -> None:
+    """
+    Em segundo plano, troca no cache as abas servidas do snapshot pelo dado
+    atual: se o sinal de mudança bate com o do snapshot, só revalida; senão
+    baixa (um batchGet p/ todas). Falhou? Fica o snapshot até vencer o ttl.
+    """
+    def _run() -> None:
+        try:
+            sig = _change_signal(ss)
+            now = time.monotonic()
+            pendentes = {}
+            for title, cols in specs.items():
+                key = _cache_key(ss, title, cols, typed)
+                with _ws_cache_lock:
+                    hit = _ws_cache.get(key)
+                    if hit is not None and sig is not None and hit[3] == sig:
+                        _ws_cache[key] = (now, hit[1], hit[2], sig)
+                        continue
+                pendentes[title] = cols
+            if pendentes:
+                read_many(ss, pendentes, ttl=0, typed=typed)
+        except Exception:
+            pass
+
+    threading.Thread(target=_run, name="casulo-warm", daemon=True).start()
 
 
 # =========================
@@ -43,7 +599,7 @@ def _get_ss() -> gspread.Spreadsheet:
         "https://www.googleapis.com/auth/drive",
     ]
     creds = Credentials.from_service_account_info(sa, scopes=scopes)
-    gc = gspread.authorize(creds)
+    gc = gspread.authorize(creds, http_client=QuotaHTTPClient)
 
     # Aceita URL completa ou apenas ID
     if planilha_ref.startswith("http"):
@@ -51,12 +607,62 @@ def _get_ss() -> gspread.Spreadsheet:
     return gc.open_by_key(planilha_ref)
 
 
+# =========================
+# Backend local (SQLite / memória)
+# =========================
+# Só estes passam pelo protocolo de utils_backend (via LocalSpreadsheet); com o
+# Google, as leituras e escritas abaixo usam o gspread direto.
+SQLITE_PATH_PADRAO = "casulo.db"
+
+_backend_override: Backend | None = None
+_memory_backend: MemoryBackend | None = None
+
+
+def _local_backend() -> Backend | None:
+    """Backend escolhido por use_backend() ou por BACKEND em st.secrets; None = Google Sheets."""
+    global _memory_backend
+    if _backend_override is not None:
+        return _backend_override
+    try:
+        kind = (st.secrets.get("BACKEND", "sheets") or "sheets").strip().lower()
+        path = (st.secrets.get("SQLITE_PATH", SQLITE_PATH_PADRAO) or SQLITE_PATH_PADRAO).strip()
+    except Exception:
+        kind, path = "sheets", SQLITE_PATH_PADRAO
+    if kind == "sqlite":
+        return SQLiteBackend(path)
+    if kind == "memory":
+        if _memory_backend is None:
+            _memory_backend = MemoryBackend()
+        return _memory_backend
+    return None
+
+
+def use_backend(backend: Backend | None) -> None:
+    """
+    Troca a fonte de dados do processo (testes, benchmarks, uso offline):
+    connect() passa a devolver um LocalSpreadsheet sobre `backend`.
+    None volta ao que está em st.secrets. Limpa os caches.
+    """
+    global _backend_override
+    _backend_override = backend
+    connect.clear()
+    clear_cache()
+
+
 # =========================
 # API pública estável
 # =========================
 @st.cache_resource(show_spinner="Conectando ao Google Sheets…")
 def connect() -> gspread.Spreadsheet:
-    """Retorna o Spreadsheet (gspread.Spreadsheet)."""
+    """
+    Retorna o Spreadsheet (gspread.Spreadsheet).
+    Com BACKEND = "sqlite" (arquivo em SQLITE_PATH) ou "memory" em st.secrets,
+    ou depois de use_backend(), devolve um LocalSpreadsheet com a mesma API
+    usada pelas páginas — nada muda nelas e o Google não é chamado.
+    """
+    backend = _local_backend()
+    if backend is not None:
+        return LocalSpreadsheet(backend, id=f"local-{type(backend).__name__}-{id(backend)}")
     try:
         return _get_ss()
     except gspread.exceptions.APIError as e:
@@ -76,24 +682,8 @@ def connect() -> gspread.Spreadsheet:
         st.stop()
 
 
-def read_ws(ss: gspread.Spreadsheet, title: str, expected_cols: list[str] | None = None) -> tuple[pd.DataFrame, gspread.Worksheet]:
-    """
-    Lê (ou cria) a worksheet `title`.
-    - Se não existir, cria com as colunas de `expected_cols`.
-    - Retorna (df: DataFrame[str], ws: gspread.Worksheet)
-    - O DataFrame vem normalizado para conter exatamente `expected_cols` quando fornecido.
-    """
-    try:
-        ws = ss.worksheet(title)
-    except gspread.exceptions.WorksheetNotFound:
-        cols = max(len(expected_cols or []), 1)
-        ws = ss.add_worksheet(title=title, rows=1, cols=cols)
-        if expected_cols:
-            # cria header
-            set_with_dataframe(ws, pd.DataFrame(columns=expected_cols), include_index=False)
-
-    df = get_as_dataframe(ws, evaluate_formulas=False, dtype=str)
-
+def _normalize_frame(df: pd.DataFrame | None, expected_cols: list[str] | None) -> pd.DataFrame:
+    """Normaliza colunas na ordem esperada e troca NaN por ""."""
     # Normaliza colunas na ordem esperada (quando fornecida)
     if expected_cols:
         if df is None or df.empty:
@@ -107,46 +697,1519 @@ def read_ws(ss: gspread.Spreadsheet, title: str, expected_cols: list[str] | None
         df = pd.DataFrame(columns=(expected_cols or []))
     else:
         df = df.fillna("")
+    return df
+
+
+def _frame_from_values(values: list[list]) -> pd.DataFrame:
+    """Monta DataFrame[str] a partir da grade crua da API (linha 1 = header)."""
+    if not values:
+        return pd.DataFrame()
+    header = [str(h).strip() for h in values[0]]
+    width = len(header)
+    body = [(list(r) + [""] * width)[:width] for r in values[1:]]
+    df = pd.DataFrame(body, columns=header, dtype=str)
+    # descarta colunas sem nome e nomes repetidos (mantém a 1ª ocorrência)
+    df = df.loc[:, [bool(c) for c in df.columns]]
+    return df.loc[:, ~df.columns.duplicated()]
+
+
+def _open_or_create_ws(ss: gspread.Spreadsheet, title: str, expected_cols: list[str] | None,
+                       existing: dict[str, gspread.Worksheet] | None = None) -> gspread.Worksheet:
+    """Abre a worksheet `title`; se não existir, cria com o header `expected_cols`."""
+    hkey = (getattr(ss, "id", None), title)
+    with _ws_cache_lock:
+        ws = _handle_cache.get(hkey)
+    if ws is not None:
+        return ws
+
+    if existing is not None and title in existing:
+        ws = existing[title]
+    else:
+        try:
+            ws = ss.worksheet(title)
+        except gspread.exceptions.WorksheetNotFound:
+            cols = max(len(expected_cols or []), 1)
+            ws = ss.add_worksheet(title=title, rows=1, cols=cols)
+            if expected_cols:
+                # cria header
+                _set_ws_header(ws, expected_cols)
+    with _ws_cache_lock:
+        _handle_cache[hkey] = ws
+    return ws
+
+
+def _fetch_ws(ss: gspread.Spreadsheet, title: str,
+              expected_cols: list[str] | None = None) -> tuple[pd.DataFrame, gspread.Worksheet, str | None]:
+    """
+    Obtém a aba inteira (todas as colunas, sem normalizar).
+    Usa o espelho local quando ele está em dia; senão baixa do Google Sheets
+    e atualiza o espelho. Retorna também o sinal de mudança a que os dados
+    correspondem (o do espelho, se vieram dele).
+    """
+    ws = _open_or_create_ws(ss, title, expected_cols)
+    m = _mirror()
+    hit = _mirror_fresh(m, ss, title)
+    if hit is not None:
+        return hit[0], ws, hit[1]
+
+    with _fetch_locks(m, [title]):
+        # outro processo pode ter baixado a aba enquanto esperávamos o lock
+        hit = _mirror_fresh(m, ss, title)
+        if hit is not None:
+            return hit[0], ws, hit[1]
+        sig = _change_signal(ss)  # antes do download: mudança no meio dele força novo download depois
+        resp = ss.values_get(absolute_range_name(title), params={
+            "valueRenderOption": "FORMULA", "dateTimeRenderOption": "FORMATTED_STRING"})
+        raw = _frame_from_values(resp.get("values", []))
+        if raw.empty and not len(raw.columns):
+            raw = pd.DataFrame(columns=(expected_cols or []))
+        if m is not None:
+            m.replace(title, raw, version=sig)
+    _index_from_frame(ss, title, raw)
+    return raw, ws, sig
+
+
+def _col_letter(n: int) -> str:
+    """Índice 1-based -> letra da coluna (1 -> "A", 28 -> "AB")."""
+    return rowcol_to_a1(1, n)[:-1]
+
+
+def _fetch_cols(ss: gspread.Spreadsheet, title: str, usecols: list[str],
+                nrows: int | None = None,
+                expected_cols: list[str] | None = None) -> tuple[pd.DataFrame, gspread.Worksheet, str | None]:
+    """
+    Baixa SÓ as colunas `usecols` (e no máximo `nrows` linhas de dados) em UM
+    values.batchGet, um intervalo A1 por coluna ("'Aba'!C2:C"). A API já corta
+    as células vazias no fim de cada coluna; as mais curtas são completadas com "".
+    Colunas que não existem no header voltam vazias.
+    """
+    ws = _open_or_create_ws(ss, title, expected_cols or usecols)
+    header = _ws_header(ws)
+    presentes = [c for c in usecols if c in header]
+    sig = _change_signal(ss)
+    if not presentes or nrows == 0:
+        return pd.DataFrame(columns=usecols, dtype=str), ws, sig
+
+    fim = str(int(nrows) + 1) if nrows else ""
+    ranges = []
+    for c in presentes:
+        letra = _col_letter(header.index(c) + 1)
+        ranges.append(absolute_range_name(title, f"{letra}2:{letra}{fim}"))
+    resp = ss.values_batch_get(ranges, params={
+        "valueRenderOption": "FORMULA", "dateTimeRenderOption": "FORMATTED_STRING",
+        "majorDimension": "COLUMNS"})
+    value_ranges = resp.get("valueRanges", [])
+
+    colunas = {}
+    for i, c in enumerate(presentes):
+        vals = value_ranges[i].get("values", []) if i < len(value_ranges) else []
+        colunas[c] = ["" if v is None else str(v) for v in (vals[0] if vals else [])]
+    n = max((len(v) for v in colunas.values()), default=0)
+    raw = pd.DataFrame({c: v + [""] * (n - len(v)) for c, v in colunas.items()}, dtype=str)
+    if nrows is None and ID_COLS.get(base_title(title)) in raw.columns:
+        _index_from_frame(ss, title, raw)
+    return raw.reindex(columns=usecols), ws, sig
+
+
+def _project_cached(ss: gspread.Spreadsheet, title: str, usecols: list[str], typed: bool,
+                    ttl: float) -> tuple[pd.DataFrame, gspread.Worksheet, str | None] | None:
+    """Recorta `usecols` de uma leitura completa da aba que ainda esteja válida no cache."""
+    sid = getattr(ss, "id", None)
+    with _ws_cache_lock:
+        cands = [k for k, v in _ws_cache.items()
+                 if k[0] == sid and k[1] == title and len(k) == 4 and k[3] == typed
+                 and all(c in v[1].columns for c in usecols)]
+    for k in cands:
+        hit = _cached(ss, k, ttl)
+        if hit is not None:
+            with _ws_cache_lock:
+                sig = _ws_cache.get(k, (None, None, None, None))[3]
+            return hit[0], hit[1], sig
+    return None
+
+
+def _batch_fetch(ss: gspread.Spreadsheet, specs: dict[str, list[str] | None]) -> dict[str, tuple[pd.DataFrame, gspread.Worksheet]]:
+    """Baixa várias abas (sem normalizar) em UM values.batchGet e atualiza o espelho."""
+    titles = list(specs)
+    with _ws_cache_lock:
+        need_meta = any((getattr(ss, "id", None), t) not in _handle_cache for t in titles)
+    existing = {w.title: w for w in ss.worksheets()} if need_meta else None
+    handles = {t: _open_or_create_ws(ss, t, specs[t], existing) for t in titles}
+
+    sig = _change_signal(ss)
+    resp = ss.values_batch_get(
+        [absolute_range_name(t) for t in titles],
+        params={"valueRenderOption": "FORMULA", "dateTimeRenderOption": "FORMATTED_STRING"},
+    )
+    value_ranges = resp.get("valueRanges", [])
+
+    m = _mirror()
+    out = {}
+    for i, title in enumerate(titles):
+        values = value_ranges[i].get("values", []) if i < len(value_ranges) else []
+        raw = _frame_from_values(values)
+        if raw.empty and not len(raw.columns):
+            raw = pd.DataFrame(columns=(specs[title] or []))
+        if m is not None:
+            m.replace(title, raw, version=sig)
+        _index_from_frame(ss, title, raw)
+        out[title] = (raw, handles[title])
+    return out
+
+
+def _prepare(raw: pd.DataFrame | None, title: str, expected_cols: list[str] | None,
+             typed: bool) -> pd.DataFrame:
+    """Normaliza as colunas e, se pedido, aplica os tipos de utils_schema."""
+    df = _normalize_frame(raw, expected_cols)
+    return apply_schema(df, title) if typed else df
+
+
+@timed()
+def read_ws(ss: gspread.Spreadsheet, title: str, expected_cols: list[str] | None = None,
+            ttl: float | None = None, typed: bool = False,
+            usecols: list[str] | None = None, nrows: int | None = None,
+            de: date | None = None, ate: date | None = None,
+            archived: bool = False) -> tuple[pd.DataFrame, gspread.Worksheet]:
+    """
+    Lê (ou cria) a worksheet `title`.
+    - Se não existir, cria com as colunas de `expected_cols`.
+    - Retorna (df: DataFrame[str], ws: gspread.Worksheet)
+    - O DataFrame vem normalizado para conter exatamente `expected_cols` quando fornecido.
+    - `typed=True` aplica utils_schema.SCHEMAS[title] (colunas "__Data", "__Bruto"...,
+      categorias em Status/Forma); o parse roda uma vez por carga e fica no cache.
+    - Resultado fica em cache por (título, colunas) durante `ttl` segundos
+      (padrão: SHEETS_CACHE_TTL). Escritas via utils_casulo invalidam só a aba tocada.
+    - Vencido o `ttl`, consulta antes o modifiedTime da planilha no Drive: se
+      nada mudou desde o download, reaproveita o cache (1 chamada de metadados
+      em vez de baixar a grade inteira).
+    - Se o Google falhar mesmo após as novas tentativas (cota/5xx/rede), devolve
+      o último dado bom (cache ou espelho) com df.attrs["stale"] = True e um
+      aviso na barra lateral; sem dado anterior, o erro sobe.
+    - Com SNAPSHOT_DIR, o 1º acesso depois de um restart devolve a última
+      fotografia em disco e atualiza em segundo plano (ver "Partida a quente").
+    - `usecols` / `nrows` (como no pandas): baixa só essas colunas e no máximo
+      `nrows` linhas de dados, um intervalo A1 por coluna. O df vem com
+      exatamente `usecols`; `expected_cols` só define o header se a aba for criada.
+      Ex.: read_ws(ss, "Pacientes", usecols=["PacienteID", "Nome"]).
+    - `de` / `ate`: só as linhas com Data no intervalo, buscadas na aba e nas
+      abas de arquivo ("Sessoes_2023"...) dos anos que o intervalo cobre; as
+      outras nem são lidas. `archived=True` sem datas traz o histórico inteiro.
+      O ws devolvido é sempre o da aba viva (onde as escritas vão).
+    """
+    ttl = _cache_ttl() if ttl is None else float(ttl)
+    if de is not None or ate is not None or archived:
+        cols = list(usecols) if usecols is not None else expected_cols
+        df = read_range(ss, title, cols, de, ate, typed=typed, ttl=ttl)
+        if nrows is not None:
+            df = df.head(int(nrows))
+        return df, _open_or_create_ws(ss, title, expected_cols or cols)
+    if usecols is not None or nrows is not None:
+        return _read_projected(ss, title, expected_cols, ttl, typed, usecols, nrows)
+    key = _cache_key(ss, title, expected_cols, typed)
+
+    hit = _cached(ss, key, ttl)
+    if hit is not None:
+        return hit[0].copy(), hit[1]
+    warm = _warm_start(ss, key, title, expected_cols)
+    if warm is not None:
+        _refresh_later(ss, {title: expected_cols}, typed)
+        return warm[0].copy(), warm[1]
+
+    now = time.monotonic()
+    try:
+        raw, ws, sig = _fetch_ws(ss, title, expected_cols)
+    except _READ_ERRORS as e:
+        return _serve_stale(title, key, expected_cols, typed, e)
+    _clear_stale(title)
+    df = _prepare(raw, title, expected_cols, typed)
+    with _ws_cache_lock:
+        _ws_cache[key] = (now, df, ws, sig)
+    _remember_gen(key)
+    _snapshot_save(ss, key, df, ws, sig)
+    return df.copy(), ws
+
+
+def _read_projected(ss: gspread.Spreadsheet, title: str, expected_cols: list[str] | None, ttl: float,
+                    typed: bool, usecols: list[str] | None,
+                    nrows: int | None) -> tuple[pd.DataFrame, gspread.Worksheet]:
+    """`read_ws` com recorte de colunas/linhas (ver docstring de `read_ws`)."""
+    usecols = list(usecols or expected_cols or [])
+    key = _cache_key(ss, title, usecols, typed) + (nrows,)
+
+    hit = _cached(ss, key, ttl)
+    if hit is not None:
+        return hit[0].copy(), hit[1]
+
+    def _corta(df: pd.DataFrame) -> pd.DataFrame:
+        return df if nrows is None else df.head(int(nrows))
+
+    now = time.monotonic()
+    # leitura completa ainda válida (cache ou espelho) -> recorta localmente
+    proj = _project_cached(ss, title, usecols, typed, ttl)
+    if proj is not None:
+        full, ws, sig = proj
+        keep = usecols + [typed_col(c) for c in usecols if typed_col(c) in full.columns]
+        df = _corta(full[keep]).reset_index(drop=True)
+    else:
+        m = _mirror()
+        try:
+            if m is not None and _mirror_ok(m, ss, title):
+                ws = _open_or_create_ws(ss, title, expected_cols or usecols)
+                raw, sig = m.read(title, cols=usecols), m.version(title)
+                if raw is None:
+                    raw, ws, sig = _fetch_cols(ss, title, usecols, nrows, expected_cols)
+            else:
+                raw, ws, sig = _fetch_cols(ss, title, usecols, nrows, expected_cols)
+        except _READ_ERRORS as e:
+            df, ws = _serve_stale(title, key, usecols, typed, e)
+            return _corta(df), ws
+        _clear_stale(title)
+        df = _prepare(_corta(raw).reset_index(drop=True), title, usecols, typed)
+
+    with _ws_cache_lock:
+        _ws_cache[key] = (now, df, ws, sig)
+    _remember_gen(key)
+    return df.copy(), ws
+
+
+@timed()
+def read_many(ss: gspread.Spreadsheet, specs: dict[str, list[str] | None],
+              ttl: float | None = None, typed: bool = False,
+              archived: bool = False) -> dict[str, tuple[pd.DataFrame, gspread.Worksheet]]:
+    """
+    Lê várias worksheets de uma vez:
+        read_many(ss, {"Pacientes": PAC_COLS, "Sessoes": SES_COLS})
+    - O que estiver no cache (ou no espelho local) volta direto; o resto vem
+      em UM values.batchGet.
+    - Com SNAPSHOT_DIR, abas ainda não lidas neste processo voltam do snapshot
+      em disco e são atualizadas juntas em segundo plano.
+    - Retorna {titulo: (df, ws)} com o mesmo contrato de `read_ws` (inclusive `typed`
+      e a revalidação pelo modifiedTime, feita uma vez para todas as abas).
+    - `archived=True` junta a cada aba as suas abas de arquivo (todos os anos,
+      do mais antigo p/ o mais novo, a aba viva por último).
+    """
+    ttl = _cache_ttl() if ttl is None else float(ttl)
+    if archived:
+        anos = {t: archive_years(ss, t) for t in specs}
+        out = read_many(ss, {t: c for t, c in specs.items() if not anos[t]}, ttl=ttl, typed=typed)
+        # abas com arquivo: todas as partições num batchGet só, sem tipos (aplicados no conjunto)
+        partes = read_many(ss, {archive_title(t, y): specs[t] for t in specs for y in anos[t]}
+                           | {t: specs[t] for t in specs if anos[t]}, ttl=ttl)
+        for t in specs:
+            if anos[t]:
+                raws = [partes[archive_title(t, y)][0] for y in anos[t]] + [partes[t][0]]
+                out[t] = (_prepare(_concat_parts(raws), t, specs[t], typed), partes[t][1])
+        return {t: out[t] for t in specs}
+    out: dict[str, tuple[pd.DataFrame, gspread.Worksheet]] = {}
+    faltando: list[str] = []
+    aquecidas: dict[str, list[str] | None] = {}
+
+    for title, cols in specs.items():
+        key = _cache_key(ss, title, cols, typed)
+        hit = _cached(ss, key, ttl)
+        if hit is None:
+            hit = _warm_start(ss, key, title, cols)
+            if hit is not None:
+                aquecidas[title] = cols
+        if hit is not None:
+            out[title] = (hit[0].copy(), hit[1])
+        else:
+            faltando.append(title)
+    if aquecidas:
+        _refresh_later(ss, aquecidas, typed)
+
+    if not faltando:
+        return out
+
+    now = time.monotonic()
+
+    def _guardar(title: str, raw: pd.DataFrame, ws: gspread.Worksheet, sig: str | None) -> None:
+        df = _prepare(raw, title, specs[title], typed)
+        key = _cache_key(ss, title, specs[title], typed)
+        with _ws_cache_lock:
+            _ws_cache[key] = (now, df, ws, sig)
+        _remember_gen(key)
+        _snapshot_save(ss, key, df, ws, sig)
+        out[title] = (df.copy(), ws)
+
+    def _do_espelho() -> None:
+        """Espelho local em dia -> não precisa ir ao Google."""
+        for title in list(faltando):
+            hit = _mirror_fresh(m, ss, title)
+            if hit is not None:
+                _guardar(title, hit[0], _open_or_create_ws(ss, title, specs[title]), hit[1])
+                faltando.remove(title)
+
+    m = _mirror()
+    if m is not None:
+        _do_espelho()
+
+    if faltando:
+        with _fetch_locks(m, faltando):
+            # outro processo pode ter baixado enquanto esperávamos os locks
+            if m is not None:
+                _do_espelho()
+            if faltando:
+                sig = _change_signal(ss)  # o mesmo que _batch_fetch grava no espelho
+                try:
+                    lote = _batch_fetch(ss, {t: specs[t] for t in faltando})
+                except _READ_ERRORS as e:
+                    for title in faltando:
+                        out[title] = _serve_stale(title, _cache_key(ss, title, specs[title], typed),
+                                                  specs[title], typed, e)
+                else:
+                    for title, (raw, ws) in lote.items():
+                        _clear_stale(title)
+                        _guardar(title, raw, ws, sig)
+
+    return {t: out[t] for t in specs}
+
+
+@timed()
+def read_ws_concurrent(ss: gspread.Spreadsheet, specs: dict[str, list[str] | dict | None],
+                       ttl: float | None = None, typed: bool = False,
+                       max_workers: int | None = None) -> dict[str, tuple[pd.DataFrame, gspread.Worksheet]]:
+    """
+    Várias chamadas independentes de `read_ws` ao mesmo tempo, num pool de no
+    máximo `max_workers` threads (padrão: SHEETS_READ_WORKERS) que divide a
+    sessão autenticada de `ss`. O tempo total é o da leitura mais lenta, não a soma.
+    - `specs`: {título: colunas} como em read_many, ou {título: kwargs de read_ws}
+      quando cada aba precisa de algo diferente:
+          read_ws_concurrent(ss, {
+              "Pacientes": {"expected_cols": PAC_COLS, "usecols": ["PacienteID", "Nome"]},
+              "Sessoes":   {"expected_cols": SES_COLS, "typed": True},
+          })
+    - `ttl`/`typed` valem para as abas que não os definem.
+    - Retorna {título: (df, ws)} na ordem de `specs`; o 1º erro sobe depois de
+      todas terminarem. Prefira read_many quando todas as abas são lidas inteiras
+      com as mesmas opções (1 batchGet gasta menos cota que N leituras).
+    """
+    if max_workers is None:
+        try:
+            max_workers = int(st.secrets.get("SHEETS_READ_WORKERS", READ_WORKERS_PADRAO))
+        except Exception:
+            max_workers = READ_WORKERS_PADRAO
+    kwargs = {t: (dict(v) if isinstance(v, dict) else {"expected_cols": v}) for t, v in specs.items()}
+    for kw in kwargs.values():
+        kw.setdefault("ttl", ttl)
+        kw.setdefault("typed", typed)
+
+    # o contexto do rerun segue p/ as threads: spans, contagem de chamadas e avisos na barra lateral
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        ctx = None
+
+    def _ler(title: str) -> tuple[pd.DataFrame, gspread.Worksheet]:
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return read_ws(ss, title, **kwargs[title])
+
+    if len(specs) <= 1 or max_workers <= 1:
+        return {t: read_ws(ss, t, **kwargs[t]) for t in specs}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(specs)),
+                            thread_name_prefix="casulo-read") as pool:
+        futs = {t: pool.submit(_ler, t) for t in specs}
+        wait(futs.values())
+    return {t: f.result() for t, f in futs.items()}
+
+
+def _range_one(ss: gspread.Spreadsheet, title: str, cols: list[str] | None,
+               de: date | None, ate: date | None, typed: bool, ttl: float | None) -> pd.DataFrame:
+    """Linhas de UMA aba com Data em [de, ate]: SQL no espelho em dia, senão filtra o read_ws."""
+    # a Data entra na leitura p/ filtrar mesmo quando `cols` não a pede
+    leitura = list(cols) + ["Data"] if cols and "Data" not in cols else cols
+
+    def _sai(df: pd.DataFrame) -> pd.DataFrame:
+        if leitura is cols:
+            return df
+        return df.drop(columns=[c for c in ("Data", typed_col("Data")) if c in df.columns])
+
+    m = _mirror()
+    if m is not None and _mirror_ok(m, ss, title):
+        raw = m.read(title, cols=leitura, de=de, ate=ate)
+        if raw is not None:
+            return _sai(_prepare(raw, title, leitura, typed))
+
+    df, _ = read_ws(ss, title, leitura, ttl=ttl, typed=typed)
+    if "Data" not in df.columns or (de is None and ate is None):
+        return _sai(df)
+    iso = iso_dates(df["Data"]).fillna("")
+    mask = iso != ""
+    if de is not None:
+        mask &= iso >= de.isoformat()
+    if ate is not None:
+        mask &= iso <= ate.isoformat()
+    return _sai(df[mask].reset_index(drop=True))
+
+
+def _concat_parts(parts: list[pd.DataFrame]) -> pd.DataFrame:
+    """Empilha partições de uma aba (mesmas colunas; a 1ª define a ordem)."""
+    parts = [p for p in parts if len(p.columns)]
+    if not parts:
+        return pd.DataFrame()
+    if len(parts) == 1:
+        return parts[0].reset_index(drop=True)
+    return pd.concat([p.reindex(columns=parts[0].columns) for p in parts], ignore_index=True)
+
+
+@timed()
+def read_range(ss: gspread.Spreadsheet, title: str, expected_cols: list[str] | None = None,
+               de: date | None = None, ate: date | None = None, typed: bool = False,
+               ttl: float | None = None) -> pd.DataFrame:
+    """
+    Linhas de `title` com Data entre `de` e `ate` (inclusive; None = sem limite).
+    Com o espelho local em dia, vira uma consulta SQL indexada; senão filtra
+    o DataFrame de `read_ws`.
+    Também consulta as abas de arquivo ("Sessoes_2023"...) dos anos que o
+    intervalo alcança, mais antigas primeiro; as demais não são lidas.
+    """
+    anos = [y for y in archive_years(ss, title)
+            if (de is None or y >= de.year) and (ate is None or y <= ate.year)]
+    if not anos:
+        return _range_one(ss, title, expected_cols, de, ate, typed, ttl)
+    # tipos aplicados 1x no conjunto (categorias iguais em todas as partições)
+    parts = [_range_one(ss, archive_title(title, y), expected_cols, de, ate, False, ttl) for y in anos]
+    parts.append(_range_one(ss, title, expected_cols, de, ate, False, ttl))
+    return _prepare(_concat_parts(parts), title, expected_cols, typed)
+
+
+@timed()
+def sync_mirror(ss: gspread.Spreadsheet, titles: list[str] | None = None) -> dict[str, int]:
+    """
+    Puxa do Google Sheets as abas `titles` (padrão: todas de MIRROR_TABLES)
+    para o espelho local em UM values.batchGet. Retorna {titulo: nº de linhas}.
+    """
+    if _mirror() is None:
+        return {}
+    titles = list(titles or MIRROR_TABLES)
+    fetched = _batch_fetch(ss, {t: None for t in titles})
+    for t in titles:
+        _drop_cached(t)
+    return {t: int(len(raw)) for t, (raw, _) in fetched.items()}
 
-    return df, ws
 
+def _cell_value(v):
+    """Converte um valor Python para algo serializável pela API (NaN/None -> "")."""
+    if v is None:
+        return ""
+    try:
+        if pd.isna(v):
+            return ""
+    except (TypeError, ValueError):
+        pass
+    if isinstance(v, (bool, int, float, str)):
+        return v
+    return str(v)
+
+
+def _first_row_of(resp) -> int | None:
+    """Linha inicial do intervalo gravado por values.append ("Aba!A12:K14" -> 12)."""
+    try:
+        rng = resp["updates"]["updatedRange"].split("!")[-1].split(":")[0]
+        return a1_to_rowcol(rng)[0]
+    except Exception:
+        return None
 
+
+@timed()
 def append_rows(ws: gspread.Worksheet, rows, default_headers: list[str] | None = None) -> bool:
     """
-    Append seguro: aceita lista de dicts OU lista de listas.
+    Append incremental: aceita lista de dicts OU lista de listas.
     - Se a planilha estiver vazia e houver `default_headers`, escreve o header.
-    - Reescreve a planilha inteira (gspread_dataframe) para evitar desalinhamento.
+    - Dicts são alinhados ao header (chaves fora do header são ignoradas).
+    - Envia SÓ as linhas novas (values.append), sem baixar/reescrever a aba.
+    - Com o diário de escritas ligado (JOURNAL_DB), se o Google estiver fora do
+      ar as linhas ficam guardadas em disco e são enviadas depois, na ordem
+      (ver "Diário de escritas"; avise o usuário com `saved_notice`).
     """
-    df_atual = get_as_dataframe(ws, evaluate_formulas=False, dtype=str)
-    if df_atual is None or df_atual.empty:
-        if default_headers:
-            set_with_dataframe(ws, pd.DataFrame(columns=default_headers), include_index=False)
-            df_atual = pd.DataFrame(columns=default_headers)
-        else:
-            df_atual = pd.DataFrame()
-
-    # Caso entrada seja lista de dicts -> alinhar chaves às colunas existentes
-    if isinstance(rows, list) and rows and isinstance(rows[0], dict):
-        cols = list(df_atual.columns) if len(df_atual.columns) else (default_headers or sorted({k for r in rows for k in r.keys()}))
-        novos = pd.DataFrame(rows)
-        for c in cols:
-            if c not in novos.columns:
-                novos[c] = ""
-        novos = novos[cols]
+    if not rows:
+        return True
+    if isinstance(rows, list) and isinstance(rows[0], dict):
+        rows = [{str(k): _cell_value(v) for k, v in r.items()} for r in rows]
     else:
-        # Assume listas alinhadas às colunas existentes ou default_headers
-        cols = list(df_atual.columns) if len(df_atual.columns) else (default_headers or [])
-        novos = pd.DataFrame(rows, columns=cols if cols else None)
+        rows = [[_cell_value(v) for v in r] for r in rows]
+    _journaled(ws, "append", {"rows": rows, "default_headers": list(default_headers or [])})
+    return True
 
-    # Garantir strings e substituir NaN
-    df_out = pd.concat([df_atual, novos], ignore_index=True).fillna("")
-    set_with_dataframe(ws, df_out, include_index=False)
+
+def _append_rows_now(ws: gspread.Worksheet, rows, default_headers: list[str] | None = None) -> bool:
+    """`append_rows` direto na API (sem diário)."""
+    if not rows:
+        return True
+
+    header = _ws_header(ws)
+    dict_rows = isinstance(rows, list) and isinstance(rows[0], dict)
+    if not header:
+        header = list(default_headers or [])
+        if not header and dict_rows:
+            header = sorted({k for r in rows for k in r.keys()})
+        if header:
+            _set_ws_header(ws, header)
+
+    if dict_rows:
+        values = [[_cell_value(r.get(c, "")) for c in header] for r in rows]
+    else:
+        # Assume listas alinhadas às colunas do header
+        width = len(header)
+        values = []
+        for r in rows:
+            vals = [_cell_value(v) for v in r]
+            if width:
+                vals = (vals + [""] * width)[:width]
+            values.append(vals)
+
+    resp = ws.append_rows(
+        values,
+        value_input_option="USER_ENTERED",
+        insert_data_option="INSERT_ROWS",
+        table_range="A1",
+    )
+    _drop_cached(ws.title)
+
+    first_row = _first_row_of(resp)
+    _index_append(ws, header, values, first_row)
+    _rollup_touch(ws, lambda r: r.add(pd.DataFrame([(v + [""] * len(header))[:len(header)] for v in values],
+                                                   columns=header)))
+
+    m = _mirror()
+    if m is not None:
+        if first_row and header:
+            m.append(ws.title, [dict(zip(header, v)) for v in values], first_row)
+        else:
+            m.mark_stale(ws.title)
     return True
 
 
+@timed()
+def update_cells(ws: gspread.Worksheet, changes, value_input_option: str = "USER_ENTERED") -> dict:
+    """
+    Aplica várias alterações de célula em UMA chamada (values.batchUpdate).
+    - `changes`: iterável de (linha, coluna, valor); linha é 1-based (header = 1)
+      e coluna pode ser o nome no header ("Status") ou o índice 1-based.
+    - Colunas que não existem no header são ignoradas.
+    - Retorna a resposta da API ({} se nada foi enviado).
+    - Não passa pelo diário de escritas (o nº da linha muda com appends/exclusões
+      na fila); p/ edições que precisam sobreviver a uma queda, use update_by_id.
+    """
+    header = _ws_header(ws)
+    data, por_nome = [], []
+    for row, col, val in changes:
+        if isinstance(col, str):
+            if col not in header:
+                continue
+            name, col = col, header.index(col) + 1
+        else:
+            name = header[int(col) - 1] if 0 < int(col) <= len(header) else None
+        data.append({
+            "range": rowcol_to_a1(int(row), int(col)),
+            "values": [[_cell_value(val)]],
+        })
+        if name:
+            por_nome.append((int(row), name, _cell_value(val)))
+    if not data:
+        return {}
+
+    resp = ws.batch_update(data, value_input_option=value_input_option)
+    _drop_cached(ws.title)
+    with _ws_cache_lock:
+        ent = _row_index.get(_header_key(ws))
+        if ent and any(name == ent[0] for _, name, _ in por_nome):
+            del _row_index[_header_key(ws)]  # trocou um ID: reconstrói na próxima busca
+    m = _mirror()
+    if m is not None:
+        m.update(ws.title, por_nome)
+    return resp
+
+
+# =========================
+# Índice ID -> linha (por worksheet)
+# =========================
+def _id_col_of(ws: gspread.Worksheet, id_col: str | None) -> str:
+    col = id_col or ID_COLS.get(base_title(ws.title))
+    if not col:
+        raise ValueError(f"Aba {ws.title!r} sem coluna de ID conhecida; informe `id_col`.")
+    return col
+
+
+def _index_store(key: tuple, id_col: str, ids) -> dict[str, int]:
+    """Guarda {ID: linha} a partir de IDs na ordem da planilha (1º ID = linha 2)."""
+    idx: dict[str, int] = {}
+    for i, v in enumerate(ids, start=2):
+        v = "" if v is None else str(v).strip()
+        if v and v not in idx:  # IDs repetidos: vale a 1ª ocorrência
+            idx[v] = i
+    with _ws_cache_lock:
+        _row_index[key] = (id_col, idx)
+    return idx
+
+
+def _index_from_frame(ss: gspread.Spreadsheet, title: str, raw: pd.DataFrame | None) -> None:
+    """Reconstrói o índice da aba a partir de uma leitura completa (linha i -> i+2)."""
+    col = ID_COLS.get(base_title(title))
+    if raw is None or not col or col not in raw.columns:
+        return
+    _index_store((getattr(ss, "id", None), title), col, raw[col].fillna("").tolist())
+
+
+def _index_rebuild(ws: gspread.Worksheet, id_col: str) -> dict[str, int]:
+    """Relê SÓ a coluna de ID (1 chamada) e refaz o índice."""
+    header = _ws_header(ws)
+    if id_col not in header:
+        raise ValueError(f"Coluna {id_col!r} não existe na aba {ws.title!r}.")
+    vals = ws.col_values(header.index(id_col) + 1)
+    return _index_store(_header_key(ws), id_col, vals[1:])
+
+
+def _index_append(ws: gspread.Worksheet, header: list[str], values: list[list], first_row: int | None) -> None:
+    """Acrescenta ao índice as linhas recém-anexadas (se o índice já existir)."""
+    key = _header_key(ws)
+    with _ws_cache_lock:
+        ent = _row_index.get(key)
+        if ent is None:
+            return
+        id_col, idx = ent
+        if not first_row or id_col not in header:
+            del _row_index[key]
+            return
+        pos = header.index(id_col)
+        for i, vals in enumerate(values):
+            v = str(vals[pos]).strip() if pos < len(vals) else ""
+            if v and v not in idx:
+                idx[v] = first_row + i
+
+
+def _index_delete(ws: gspread.Worksheet, rows: list[int]) -> None:
+    """Tira as linhas apagadas do índice e sobe as de baixo (como o Sheets faz)."""
+    key = _header_key(ws)
+    gone = sorted(set(rows))
+    with _ws_cache_lock:
+        ent = _row_index.get(key)
+        if ent is None:
+            return
+        id_col, idx = ent
+        novo = {}
+        for pid, r in idx.items():
+            n = bisect_left(gone, r)
+            if n < len(gone) and gone[n] == r:
+                continue
+            novo[pid] = r - n
+        _row_index[key] = (id_col, novo)
+
+
+def rows_of(ws: gspread.Worksheet, ids, id_col: str | None = None) -> dict[str, int]:
+    """
+    Linha atual na planilha de cada ID em `ids` ({ID: linha}; IDs ausentes ficam de fora).
+    - Busca O(1) no índice mantido em memória (montado nas leituras e ajustado
+      em append/delete feitos por aqui).
+    - Antes de devolver, confere numa única leitura (values.batchGet) se as
+      células de ID ainda batem; se alguém inseriu/apagou linhas, descarta o
+      cache/espelho da aba, relê só a coluna de ID e refaz o índice.
+    """
+    id_col = _id_col_of(ws, id_col)
+    wanted = [str(i).strip() for i in ids if str(i).strip()]
+    if not wanted:
+        return {}
+    key = _header_key(ws)
+    with _ws_cache_lock:
+        ent = _row_index.get(key)
+    idx = ent[1] if ent and ent[0] == id_col else None
+
+    if idx is not None and all(p in idx for p in wanted):
+        header = _ws_header(ws)
+        if id_col in header:
+            c = header.index(id_col) + 1
+            found = {p: idx[p] for p in wanted}
+            got = ws.batch_get([rowcol_to_a1(r, c) for r in found.values()])
+            atuais = [str(v[0][0]).strip() if v and v[0] else "" for v in got]
+            if atuais == list(found):
+                return found
+
+    if idx is not None:
+        invalidate_ws(ws)  # a planilha mudou por fora: o que temos em cache está defasado
+    idx = _index_rebuild(ws, id_col)
+    return {p: idx[p] for p in wanted if p in idx}
+
+
+def row_of(ws: gspread.Worksheet, id_value, id_col: str | None = None) -> int | None:
+    """Linha atual do registro `id_value` (None se não existir). Ver `rows_of`."""
+    return rows_of(ws, [id_value], id_col).get(str(id_value).strip())
+
+
+@timed()
+def update_by_id(ws: gspread.Worksheet, id_value, values: dict, id_col: str | None = None) -> dict:
+    """
+    Atualiza as colunas de `values` ({coluna: valor}) na linha do registro
+    `id_value`, em UMA chamada (`update_cells`). Levanta ValueError se o ID não existir.
+    Com o diário ligado (JOURNAL_DB) e o Google fora, volta {} e a edição é
+    enviada depois (um ID que sumiu nesse meio-tempo aparece como falha).
+    """
+    res = _journaled(ws, "update", {"changes": {str(id_value).strip(): _jsonable_values(values)},
+                                    "id_col": id_col, "strict": True})
+    return res[0] if res else {}
+
+
+@timed()
+def update_many_by_id(ws: gspread.Worksheet, changes: dict, id_col: str | None = None) -> list[str]:
+    """
+    Várias edições {ID: {coluna: valor}} numa só ida: resolve as linhas
+    (`rows_of`) e manda tudo em UM values.batchUpdate (`update_cells`).
+    Retorna os IDs que não existem mais na planilha (não gravados); se a
+    edição ficou no diário (JOURNAL_DB) esperando o Google, retorna [].
+    """
+    if not changes:
+        return []
+    res = _journaled(ws, "update", {"changes": {str(pid).strip(): _jsonable_values(vals)
+                                                for pid, vals in changes.items()},
+                                    "id_col": id_col, "strict": False})
+    return res[1] if res else []
+
+
+def _update_many_now(ws: gspread.Worksheet, changes: dict,
+                     id_col: str | None = None) -> tuple[dict, list[str]]:
+    """`update_many_by_id` direto na API: (resposta, IDs não encontrados)."""
+    rows = rows_of(ws, list(changes), id_col)
+    cells = [(rows[str(pid).strip()], col, val)
+             for pid, vals in changes.items() if str(pid).strip() in rows
+             for col, val in vals.items()]
+    resp = update_cells(ws, cells)
+    _rollup_touch(ws, lambda r: r.update({pid: vals for pid, vals in changes.items()
+                                          if str(pid).strip() in rows}))
+    return resp, [str(pid) for pid in changes if str(pid).strip() not in rows]
+
+
+def _jsonable_values(values: dict) -> dict:
+    return {str(c): _cell_value(v) for c, v in values.items()}
+
+
+def diff_by_id(before: pd.DataFrame, after: pd.DataFrame, id_col: str,
+               cols: list[str] | None = None) -> dict[str, dict[str, object]]:
+    """
+    Diferença célula a célula entre dois frames com a mesma chave `id_col`
+    (ex.: o que foi carregado x o que voltou do st.data_editor).
+    Retorna {ID: {coluna: valor novo}} só com as células que mudaram; IDs que
+    estão em apenas um dos frames são ignorados. Compara como texto ("" = vazio).
+    """
+    cols = [c for c in (cols or list(after.columns))
+            if c != id_col and c in before.columns and c in after.columns]
+    if not cols or before.empty or after.empty:
+        return {}
+    b = before.drop_duplicates(id_col).set_index(id_col)[cols]
+    a = after.drop_duplicates(id_col).set_index(id_col)[cols]
+    comuns = a.index.intersection(b.index)
+    a_txt = a.loc[comuns].fillna("").astype(str)
+    b_txt = b.loc[comuns].fillna("").astype(str)
+
+    novos = a.loc[comuns].astype(object).where(a.loc[comuns].notna(), "")
+    out: dict[str, dict[str, object]] = {}
+    linhas, colunas = (a_txt.to_numpy() != b_txt.to_numpy()).nonzero()
+    for i, j in zip(linhas, colunas):
+        out.setdefault(str(comuns[i]), {})[cols[j]] = novos.iat[i, j]
+    return out
+
+
+@timed()
+def delete_by_id(ws: gspread.Worksheet, ids, id_col: str | None = None) -> int:
+    """
+    Apaga as linhas dos registros `ids` (IDs inexistentes são ignorados).
+    Vai tudo em UM spreadsheets.batchUpdate com um deleteDimension por bloco de
+    linhas vizinhas, de baixo p/ cima; depois ajusta índice e espelho local.
+    Retorna quantas linhas foram apagadas (ou quantos IDs ficaram no diário
+    de escritas, se o Google estava fora).
+    """
+    if isinstance(ids, (str, int)):
+        ids = [ids]
+    ids = list(dict.fromkeys(str(i).strip() for i in ids))
+    if not ids:
+        return 0
+    res = _journaled(ws, "delete", {"ids": ids, "id_col": id_col})
+    return len(ids) if res is None else res
+
+
+def _delete_by_id_now(ws: gspread.Worksheet, ids, id_col: str | None = None) -> int:
+    """`delete_by_id` direto na API (sem diário)."""
+    rows = sorted(rows_of(ws, ids, id_col).values())
+    if not rows:
+        return 0
+
+    # blocos contíguos, de baixo p/ cima (apagar um bloco não mexe nos de cima)
+    blocos = row_blocks(rows)
+    ws.spreadsheet.batch_update({"requests": [
+        {"deleteDimension": {"range": {
+            "sheetId": ws.id, "dimension": "ROWS",
+            "startIndex": ini - 1, "endIndex": fim,  # 0-based, fim exclusivo
+        }}}
+        for ini, fim in reversed(blocos)
+    ]})
+
+    _index_delete(ws, rows)
+    _rollup_touch(ws, lambda r: r.remove(ids))
+    _drop_cached(ws.title)
+    m = _mirror()
+    if m is not None:
+        m.delete(ws.title, rows)
+    return len(rows)
+
+
+# =========================
+# Arquivo por ano (Sessoes / Pagamentos)
+# =========================
+# Anos fechados saem da aba viva p/ abas "<aba>_<ano>" (ex.: "Sessoes_2023"),
+# com o mesmo header. As páginas do dia a dia leem só a aba viva (pequena);
+# read_range / read_ws(de=, ate=) abrem só os arquivos dos anos pedidos e
+# read_many(archived=True) junta tudo p/ relatórios históricos.
+ARCHIVE_SOURCES = {"Sessoes": SES_COLS, "Pagamentos": PAG_COLS}
+
+_partitions: dict[str | None, tuple[float, dict[str, list[int]]]] = {}  # spreadsheet_id -> (ts, {aba: anos})
+
+
+def archive_years(ss: gspread.Spreadsheet, title: str) -> list[int]:
+    """
+    Anos que têm aba de arquivo de `title`, em ordem. A lista de abas vem de
+    1 chamada de metadados, reaproveitada por SHEETS_CACHE_TTL segundos.
+    """
+    sid = getattr(ss, "id", None)
+    now = time.monotonic()
+    with _ws_cache_lock:
+        hit = _partitions.get(sid)
+    if hit is None or now - hit[0] >= _cache_ttl():
+        anos: dict[str, list[int]] = {}
+        for w in ss.worksheets():
+            base, ano = split_archive(w.title)
+            if ano is not None:
+                anos.setdefault(base, []).append(ano)
+                with _ws_cache_lock:
+                    _handle_cache.setdefault((sid, w.title), w)
+        hit = (now, {b: sorted(a) for b, a in anos.items()})
+        with _ws_cache_lock:
+            _partitions[sid] = hit
+    return list(hit[1].get(title, []))
+
+
+@timed()
+def archive_closed(ss: gspread.Spreadsheet, title: str, antes_de: date | None = None) -> dict[int, int]:
+    """
+    Move p/ "<title>_<ano>" as linhas de `title` com Data anterior a `antes_de`
+    (padrão: 1º de janeiro do ano corrente). Copia primeiro e só então apaga da
+    aba viva; linhas já presentes no arquivo (mesmo ID) não são duplicadas, então
+    repetir depois de uma falha no meio é seguro. Linhas sem ID ou sem Data
+    válida ficam onde estão. Retorna {ano: linhas movidas}.
+    """
+    if title not in ARCHIVE_SOURCES:
+        raise ValueError(f"A aba {title!r} não tem arquivo por ano.")
+    flush_journal(ss, wait=JOURNAL_WAIT)
+    if pending_writes(ss)[PENDING].get(title):
+        raise RuntimeError(f"Há gravações de {title} esperando o Google Sheets; arquive depois de enviá-las.")
+
+    antes_de = antes_de or date(date.today().year, 1, 1)
+    id_col = ID_COLS[title]
+    df, ws = read_ws(ss, title, ttl=0)  # todas as colunas da aba, inclusive as fora do layout
+    if "Data" not in df.columns or id_col not in df.columns:
+        return {}
+    header = _ws_header(ws) or ARCHIVE_SOURCES[title]
+    d = parse_dates(df["Data"])
+    ids = df[id_col].astype(str).str.strip()
+    fechadas = d.notna() & (d < pd.Timestamp(antes_de)) & (ids != "")
+
+    movidas: dict[int, int] = {}
+    for ano in sorted(d[fechadas].dt.year.unique().tolist()):
+        linhas = df[fechadas & (d.dt.year == ano)]
+        arq, ws_arq = read_ws(ss, archive_title(title, ano), header, ttl=0)  # cria com o header
+        ja = set(arq[id_col].astype(str).str.strip())
+        novas = linhas[~ids[linhas.index].isin(ja)]
+        if len(novas):
+            append_rows(ws_arq, novas.reindex(columns=header).fillna("").to_dict("records"),
+                        default_headers=header)
+        delete_by_id(ws, ids[linhas.index].tolist(), id_col)
+        movidas[int(ano)] = int(len(linhas))
+
+    sid = getattr(ss, "id", None)
+    with _ws_cache_lock:
+        _partitions.pop(sid, None)
+        _rollups.pop((sid, title), None)  # remonta na próxima consulta, já com os arquivos
+    return movidas
+
+
+# =========================
+# Rollups mensais
+# =========================
+# Totais mês × Forma (Pagamentos) e mês × Categoria × CentroCusto (Despesas),
+# ver utils_rollup. Montados 1x a partir da aba tipada e depois corrigidos a
+# cada append/edição/exclusão feitos por aqui, sem reagrupar a aba. Vencido o
+# ttl, o sinal de mudança decide: igual (ou só escritas nossas desde a última
+# conferência) -> segue; diferente -> remonta. clear_cache() / rebuild_rollups() refazem tudo.
+_ROLLUP_SOURCES = {"Pagamentos": PAG_COLS, "Despesas": DESP_COLS}
+_ROLLUP_LOCAL = "__local__"  # sinal "só mudou por escritas nossas" (adotado na próxima conferência)
+
+_rollups: dict[tuple, list] = {}  # (spreadsheet_id, título) -> [ts, Rollup, sinal]
+
+
+def rebuild_rollups(ss: gspread.Spreadsheet, titles: list[str] | None = None) -> dict[str, int]:
+    """Remonta os rollups do zero (reparo). Retorna {aba: lançamentos agregados}."""
+    out = {}
+    for title in titles or list(ROLLUPS):
+        sig = _change_signal(ss)  # antes da leitura: mudança no meio força nova montagem depois
+        df, _ = read_ws(ss, title, _ROLLUP_SOURCES.get(title), typed=True, archived=True)
+        r = Rollup(title).build(df)
+        with _ws_cache_lock:
+            _rollups[(getattr(ss, "id", None), title)] = [time.monotonic(), r, sig]
+        out[title] = len(r)
+    return out
+
+
+@timed()
+def rollup(ss: gspread.Spreadsheet, title: str, de_mes: str | None = None,
+           ate_mes: str | None = None) -> pd.DataFrame:
+    """
+    Tabela pré-agregada de `title` ("Pagamentos" ou "Despesas"):
+    colunas Mes ("AAAA-MM"), chaves, somas e n (nº de lançamentos), só com os
+    meses entre `de_mes` e `ate_mes` (inclusive; None = sem limite).
+        rollup(ss, "Pagamentos", "2025-01", "2025-12")
+    """
+    key = (getattr(ss, "id", None), title)
+    with _ws_cache_lock:
+        ent = _rollups.get(key)
+    if ent is not None:
+        now = time.monotonic()
+        if now - ent[0] < _cache_ttl():
+            return ent[1].frame(de_mes, ate_mes)
+        cur = _change_signal(ss)
+        if cur is not None and ent[2] in (cur, _ROLLUP_LOCAL):
+            with _ws_cache_lock:
+                ent[0], ent[2] = now, cur
+            return ent[1].frame(de_mes, ate_mes)
+    rebuild_rollups(ss, [title])
+    with _ws_cache_lock:
+        return _rollups[key][1].frame(de_mes, ate_mes)
+
+
+def _rollup_touch(ws: gspread.Worksheet, fn) -> None:
+    """Aplica `fn(rollup)` ao rollup da aba de `ws`, se existir; `fn` devolvendo False descarta."""
+    key = (getattr(ws, "spreadsheet_id", None), ws.title)
+    with _ws_cache_lock:
+        ent = _rollups.get(key)
+        if ent is None:
+            return
+        try:
+            ok = fn(ent[1]) is not False
+        except Exception:
+            ok = False
+        if ok:
+            ent[2] = _ROLLUP_LOCAL
+        else:
+            del _rollups[key]
+
+
+# =========================
+# Índice de sessões por dia
+# =========================
+# Agenda, check-in e KPIs semanais recortam Sessoes por data. O SessionIndex
+# (utils_agenda) ordena a aba 1x, junta o Nome e guarda a fatia de cada dia;
+# é remontado só quando o frame em cache muda (novo download ou escrita).
+# Pedido com um intervalo, inclui também as abas de arquivo ("Sessoes_2024")
+# dos anos que ele alcança; cada linha diz de que aba veio (ABA_COL).
+_AGENDA_PAC = ["PacienteID", "Nome"]
+
+# (spreadsheet_id, anos de arquivo) -> (frames de Sessoes, frame de Pacientes, índice)
+_session_index: dict[tuple, tuple[tuple[pd.DataFrame, ...], pd.DataFrame, SessionIndex]] = {}
+
+
+def _frame_ref(ss: gspread.Spreadsheet, title: str, expected_cols: list[str],
+               typed: bool = False, usecols: list[str] | None = None) -> pd.DataFrame:
+    """O DataFrame guardado no cache (sem cópia: não altere), lendo a aba se preciso."""
+    key = _cache_key(ss, title, usecols or expected_cols, typed) + ((None,) if usecols else ())
+    if _cached(ss, key, _cache_ttl()) is None:
+        read_ws(ss, title, expected_cols, typed=typed, usecols=usecols)  # popula o cache
+    with _ws_cache_lock:
+        ent = _ws_cache.get(key)
+    if ent is None:  # último dado bom (fica fora do cache) ou invalidada no meio
+        return read_ws(ss, title, expected_cols, typed=typed, usecols=usecols)[0]
+    return ent[1]
+
+
+@timed()
+def session_index(ss: gspread.Spreadsheet, de: date | None = None,
+                  ate: date | None = None) -> SessionIndex:
+    """
+    SessionIndex de Sessoes (tipada) com o Nome de Pacientes, compartilhado no
+    processo e reaproveitado enquanto as abas não mudarem no cache:
+        idx = session_index(ss)
+        semana = session_index(ss, seg, dom).window(seg, dom)
+    Sem `de`, só a aba viva. Com `de` (e `ate`), entram também as abas de
+    arquivo dos anos do intervalo, lidas só quando alguém pede esses anos.
+    Edite/apague a sessão na aba da coluna ABA_COL (ver `ws_handle`).
+    """
+    anos = () if de is None else tuple(
+        y for y in archive_years(ss, "Sessoes")
+        if y >= pd.Timestamp(de).year and (ate is None or y <= pd.Timestamp(ate).year))
+    titulos = [archive_title("Sessoes", y) for y in anos] + ["Sessoes"]
+    frames = tuple(_frame_ref(ss, t, SES_COLS, typed=True) for t in titulos)
+    # tipada como Pacientes do Dashboard/Sessões: recorta do que elas já leram
+    pac = _frame_ref(ss, "Pacientes", PAC_COLS, typed=True, usecols=_AGENDA_PAC)
+    chave = (getattr(ss, "id", None), anos)
+    with _ws_cache_lock:
+        hit = _session_index.get(chave)
+    if hit is not None and hit[1] is pac and len(hit[0]) == len(frames) \
+            and all(a is b for a, b in zip(hit[0], frames)):
+        return hit[2]
+    ses = _concat_parts([f.assign(**{ABA_COL: t}) for t, f in zip(titulos, frames)])
+    idx = SessionIndex(ses, pac)
+    with _ws_cache_lock:
+        _session_index[chave] = (frames, pac, idx)
+    return idx
+
+
+def ws_handle(ss: gspread.Spreadsheet, title: str) -> gspread.Worksheet:
+    """Worksheet `title` (ex.: a ABA_COL de uma sessão), sem baixar a grade."""
+    return _open_or_create_ws(ss, title, None)
+
+
+# =========================
+# Diário de escritas (write-ahead)
+# =========================
+# Com JOURNAL_DB (caminho do arquivo) em st.secrets, append_rows /
+# update_by_id / update_many_by_id / delete_by_id gravam a mutação num SQLite
+# local ANTES de chamar o Google; sem ele (padrão), escrevem direto na API.
+# Confirmada, a entrada vira "done". Erro passageiro (cota, 5xx, rede) deixa
+# a entrada pendente: a função volta normalmente, um aviso aparece na barra
+# lateral (journal_sidebar) e o replayer reenvia a fila na ordem, juntando
+# appends/edições seguidos da mesma aba numa só chamada.
+# Erro definitivo (ID que não existe mais, 4xx) marca a entrada como falha.
+# Gravação que ficou pendente NÃO está na planilha: a página avisa com
+# `saved_notice` em vez de st.success.
+# JOURNAL_ASYNC = true: a escrita só entra no diário e o envio roda em 2º plano.
+JOURNAL_PATH_PADRAO = ""  # desligado; ex.: JOURNAL_DB = "casulo_journal.db"
+JOURNAL_RETRY = 30   # s entre reenvios automáticos da fila
+JOURNAL_BATCH = 200  # entradas lidas por rodada do replayer
+JOURNAL_WAIT = 10    # s que uma escrita espera outro replayer (outro processo) terminar
+
+_journal_last_try: dict[str, float] = {}
+_journal_waiting: set[int] = set()              # seqs cujas escritas esperam o resultado (modo síncrono)
+_journal_results: dict[int, object] = {}        # seq -> retorno da API
+_journal_errors: dict[int, Exception] = {}      # seq -> erro definitivo (mesmo tipo que subiria sem diário)
+_journal_threads: dict[str, threading.Thread] = {}
+
+
+def _journal(ss: gspread.Spreadsheet) -> Journal | None:
+    """Diário de `ss`; None se desligado ou backend local (que não cai)."""
+    if str(getattr(ss, "id", "")).startswith("local-"):
+        return None
+    try:
+        path = str(st.secrets.get("JOURNAL_DB", JOURNAL_PATH_PADRAO) or "").strip()
+    except Exception:
+        path = JOURNAL_PATH_PADRAO
+    return get_journal(path) if path else None
+
+
+def _journal_async() -> bool:
+    try:
+        return str(st.secrets.get("JOURNAL_ASYNC", "")).strip().lower() in ("1", "true", "sim", "yes")
+    except Exception:
+        return False
+
+
+def _transient(err: Exception) -> bool:
+    """Erro que passa sozinho (vale a pena reenviar depois)?"""
+    if isinstance(err, requests.exceptions.RequestException):
+        return True
+    return isinstance(err, gspread.exceptions.APIError) and _should_retry(err, "read")
+
+
+def _batch_key(e: dict) -> tuple | None:
+    """Entradas seguidas com a mesma chave vão juntas; exclusões (None) vão uma a uma."""
+    p = e["payload"]
+    if e["op"] == "append":
+        return (e["title"], "append", tuple(p["default_headers"]),
+                bool(p["rows"]) and isinstance(p["rows"][0], dict))
+    if e["op"] == "update":
+        return (e["title"], "update", p.get("id_col"))
+    return None
+
+
+def _journal_batches(fila: list[dict]) -> list[list[dict]]:
+    """Agrupa entradas seguidas da mesma aba e operação (appends e edições) num lote."""
+    lotes: list[list[dict]] = []
+    for e in fila:
+        chave = _batch_key(e)
+        if chave is not None and lotes and _batch_key(lotes[-1][0]) == chave:
+            lotes[-1].append(e)
+        else:
+            lotes.append([e])
+    return lotes
+
+
+def _append_pending_rows(ws: gspread.Worksheet, lote: list[dict]) -> list:
+    """
+    Linhas do lote de appends. Numa 2ª tentativa o append pode ter chegado ao
+    Google mesmo com erro na resposta: linhas cujo ID já está na aba saem.
+    """
+    rows = [r for e in lote for r in e["payload"]["rows"]]
+    id_col = ID_COLS.get(base_title(ws.title))
+    if not id_col or not any(e["tries"] for e in lote):
+        return rows
+    header = _ws_header(ws)
+    pos = header.index(id_col) if id_col in header else None
+
+    def _id(r):
+        if isinstance(r, dict):
+            return str(r.get(id_col, "")).strip()
+        return str(r[pos]).strip() if pos is not None and pos < len(r) else ""
+
+    ids = [i for i in (_id(r) for r in rows) if i]
+    existentes = rows_of(ws, ids, id_col) if ids else {}
+    return [r for r in rows if not _id(r) or _id(r) not in existentes]
+
+
+def _journal_apply(ss: gspread.Spreadsheet, lote: list[dict],
+                   hint: gspread.Worksheet | None = None) -> list:
+    """
+    Envia um lote ao Google. Retorna, por entrada, o resultado ou a exceção
+    definitiva só daquela entrada; erro do lote inteiro sobe.
+    """
+    e0 = lote[0]
+    title, op, p0 = e0["title"], e0["op"], e0["payload"]
+    ws = hint if hint is not None and hint.title == title else \
+        _open_or_create_ws(ss, title, p0.get("default_headers") or None)
+    if op == "append":
+        rows = _append_pending_rows(ws, lote)
+        ok = _append_rows_now(ws, rows, p0["default_headers"] or None) if rows else True
+        return [ok] * len(lote)
+    if op == "update":
+        changes: dict[str, dict] = {}
+        for e in lote:
+            for pid, vals in e["payload"]["changes"].items():
+                changes.setdefault(pid, {}).update(vals)
+        resp, faltam = _update_many_now(ws, changes, p0.get("id_col"))
+        out = []
+        for e in lote:
+            miss = [pid for pid in e["payload"]["changes"] if pid in faltam]
+            if e["payload"].get("strict") and miss:
+                out.append(ValueError(f"{_id_col_of(ws, p0.get('id_col'))} {miss[0]} não encontrado."))
+            else:
+                out.append((resp, miss))
+        return out
+    if op == "delete":
+        return [_delete_by_id_now(ws, p0["ids"], p0.get("id_col"))]
+    raise ValueError(f"Operação desconhecida no diário: {op!r}")
+
+
+def _journal_send(ss: gspread.Spreadsheet, j: Journal, lote: list[dict],
+                  hint: gspread.Worksheet | None) -> int | None:
+    """Envia um lote e marca as entradas; retorna quantas saíram ou None em erro passageiro."""
+    try:
+        res = _journal_apply(ss, lote, hint)
+    except Exception as err:
+        if _transient(err):
+            j.mark_failed([e["seq"] for e in lote], str(err), final=False)
+            return None
+        if len(lote) > 1:  # lote recusado por inteiro: cada entrada sozinha acha a culpada
+            total = 0
+            for e in lote:
+                n = _journal_send(ss, j, [e], hint)
+                if n is None:
+                    return None
+                total += n
+            return total
+        res = [err]
+    n = 0
+    for e, r in zip(lote, res):
+        if isinstance(r, Exception):
+            if e["seq"] in _journal_waiting:
+                _journal_errors[e["seq"]] = r
+            j.mark_failed([e["seq"]], str(r), final=True)
+        else:
+            if e["seq"] in _journal_waiting:
+                _journal_results[e["seq"]] = r
+            j.mark_done([e["seq"]])
+            n += 1
+    return n
+
+
+def flush_journal(ss: gspread.Spreadsheet, wait: float = 0.0,
+                  hint: gspread.Worksheet | None = None) -> int:
+    """
+    Reenvia as escritas pendentes de `ss`, na ordem, em lotes. Para no 1º erro
+    passageiro (o resto espera a próxima rodada, p/ não mudar a ordem).
+    `wait`: segundos esperando outro replayer terminar. Retorna quantas entradas saíram.
+    """
+    j = _journal(ss)
+    if j is None:
+        return 0
+    sid = str(getattr(ss, "id", ""))
+    enviados = 0
+    with j.flush_lock(wait) as pegou:
+        if not pegou:
+            return 0
+        _journal_last_try[sid] = time.monotonic()
+        while True:
+            fila = j.pending(sid, limit=JOURNAL_BATCH)
+            if not fila:
+                return enviados
+            for lote in _journal_batches(fila):
+                n = _journal_send(ss, j, lote, hint)
+                if n is None:
+                    return enviados
+                enviados += n
+
+
+def _flush_quiet(ss: gspread.Spreadsheet) -> None:
+    try:
+        flush_journal(ss, wait=JOURNAL_WAIT)
+    except Exception:
+        pass
+
+
+def _flush_later(ss: gspread.Spreadsheet) -> None:
+    """Reenvia a fila numa thread (uma por planilha)."""
+    sid = str(getattr(ss, "id", ""))
+    with _ws_cache_lock:
+        t = _journal_threads.get(sid)
+        if t is not None and t.is_alive():
+            return
+        t = _journal_threads[sid] = threading.Thread(target=_flush_quiet, args=(ss,),
+                                                     name="casulo-journal", daemon=True)
+    t.start()
+
+
+def _journaled(ws: gspread.Worksheet, op: str, payload: dict):
+    """
+    Grava a mutação no diário e tenta enviar a fila (ela inclusive) na hora.
+    Retorna o resultado da API; None se ficou pendente. Erro definitivo sobe
+    como subiria sem o diário.
+    """
+    ss = ws.spreadsheet
+    j = _journal(ss)
+    if j is None:
+        res = _journal_apply(ss, [{"seq": 0, "title": ws.title, "op": op, "payload": payload, "tries": 0}], ws)[0]
+        if isinstance(res, Exception):
+            raise res
+        return res
+    seq = j.add(str(getattr(ss, "id", "")), ws.title, op, payload)
+    if _journal_async():
+        _flush_later(ss)
+        return None
+    _journal_waiting.add(seq)
+    try:
+        flush_journal(ss, wait=JOURNAL_WAIT, hint=ws)
+    finally:
+        _journal_waiting.discard(seq)
+    estado = j.state(seq)
+    res, err = _journal_results.pop(seq, None), _journal_errors.pop(seq, None)
+    if estado is not None and estado[0] == DONE:
+        return res
+    if estado is not None and estado[0] == FAILED:
+        raise err or RuntimeError(estado[1])
+    _flush_later(ss)
+    try:
+        st.toast(f"Google Sheets indisponível: a gravação em **{ws.title}** ficou guardada "
+                 "e será enviada automaticamente.", icon="⏳")
+    except Exception:
+        pass
+    return None
+
+
+def pending_writes(ss: gspread.Spreadsheet) -> dict[str, dict[str, int]]:
+    """{"pending": {aba: n}, "failed": {aba: n}} das escritas ainda não gravadas na planilha."""
+    j = _journal(ss)
+    if j is None:
+        return {PENDING: {}, FAILED: {}}
+    return j.counts(str(getattr(ss, "id", "")))
+
+
+def saved_notice(ws: gspread.Worksheet, msg: str) -> bool:
+    """
+    Mensagem de "gravado" depois de uma escrita em `ws`: st.success se chegou
+    à planilha; st.warning se ficou só no diário local esperando o Google.
+    Retorna True se a aba não tem gravações pendentes. O aviso também é
+    repetido por `journal_sidebar` no próximo rerun (as páginas dão st.rerun logo depois).
+    """
+    pend = pending_writes(ws.spreadsheet)[PENDING].get(ws.title, 0)
+    if not pend:
+        st.success(msg)
+        return True
+    aviso = (f"⏳ {msg} — ainda NÃO está na planilha: ficou guardado neste servidor "
+             f"({pend} gravação(ões) de {ws.title} na fila) e será enviado quando o "
+             "Google Sheets responder. Acompanhe na barra lateral.")
+    st.warning(aviso)
+    st.session_state["__journal_notice"] = aviso
+    return False
+
+
+def journal_sidebar(ss: gspread.Spreadsheet) -> None:
+    """
+    Barra lateral: quantas escritas esperam o Google (e botão p/ reenviar) e
+    quais foram recusadas. Também dispara o reenvio automático a cada JOURNAL_RETRY s
+    e mostra, uma vez, o aviso de gravação pendente deixado por `saved_notice`.
+    """
+    j = _journal(ss)
+    if j is None:
+        return
+    aviso = st.session_state.pop("__journal_notice", None)
+    if aviso:
+        st.warning(aviso)
+    sid = str(getattr(ss, "id", ""))
+    c = j.counts(sid)
+    pend, fail = c[PENDING], c[FAILED]
+    if pend and time.monotonic() - _journal_last_try.get(sid, 0.0) > JOURNAL_RETRY:
+        _flush_later(ss)
+    if not pend and not fail:
+        return
+    with st.sidebar:
+        if pend:
+            abas = ", ".join(f"{t} ({n})" for t, n in pend.items())
+            st.warning(f"⏳ {sum(pend.values())} gravação(ões) aguardando o Google Sheets: {abas}.")
+            if st.button("Reenviar agora", key="__journal_flush", use_container_width=True):
+                n = flush_journal(ss, wait=JOURNAL_WAIT)
+                st.toast(f"{n} gravação(ões) enviada(s).")
+                st.rerun()
+        if fail:
+            with st.expander(f"❌ {sum(fail.values())} gravação(ões) recusada(s) pela planilha"):
+                for e in j.failed(sid):
+                    st.caption(f"{e['title']} · {e['op']} · {datetime.fromtimestamp(e['created']):%d/%m %H:%M}")
+                    st.code(f"{e['error']}\n{e['payload']}", language=None)
+                    if st.button("Descartar", key=f"__journal_discard_{e['seq']}"):
+                        j.discard(e["seq"])
+                        st.rerun()
+
+
+# =========================
+# Pré-carga em segundo plano
+# =========================
+# Quem abre o Dashboard vai depois para Sessões, Pagamentos, Paciente...
+# Um pool de threads (1 por processo, via st.cache_resource) mantém no cache
+# as mesmas chaves que as páginas leem, então a navegação não espera o Google.
+# Cada grupo é um read_many (1 batchGet p/ as abas que mudaram); os grupos
+# rodam em paralelo. Configuração em st.secrets:
+#   PREFETCH = false           desliga
+#   PREFETCH_INTERVAL = 60     s entre rodadas
+#   PREFETCH_QPM = 10          chamadas/min que a pré-carga pode gastar
+PREFETCH_GROUPS: list[tuple[dict[str, list[str]], bool]] = [
+    ({"Pacientes": PAC_COLS, "Sessoes": SES_COLS, "Pagamentos": PAG_COLS,
+      "Despesas": DESP_COLS, "Relatorios": REL_COLS}, True),
+    ({"Pacientes": PAC_COLS}, False),  # cadastro, lista de pacientes, fotos
+]
+PREFETCH_INTERVAL_PADRAO = 60
+PREFETCH_QPM_PADRAO = 10
+
+
+class _Prefetcher:
+    """
+    Rodadas periódicas de read_many(..., ttl=intervalo): o que tem menos de um
+    intervalo fica como está; o resto é revalidado pelo modifiedTime (1 chamada
+    p/ todos) ou baixado de novo se mudou. Antes de cada rodada (menos a 1ª)
+    reserva, num balde próprio, o pior caso de chamadas (sinal + 1 batchGet
+    por grupo).
+    """
+
+    def __init__(self, ss: gspread.Spreadsheet, interval: float, qpm: float):
+        self.ss = ss
+        self.interval = max(float(interval), 5.0)
+        self.bucket = _TokenBucket(qpm)
+        self.pool = ThreadPoolExecutor(max_workers=len(PREFETCH_GROUPS), thread_name_prefix="casulo-prefetch")
+        self.rounds = 0
+        self.last_error: str | None = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="casulo-prefetch", daemon=True)
+        self._thread.start()
+
+    def _group(self, specs: dict[str, list[str]], typed: bool) -> None:
+        read_many(self.ss, specs, ttl=self.interval, typed=typed)
+
+    def run_once(self) -> None:
+        if self.rounds:  # a 1ª rodada sai na hora: é ela que aquece o boot
+            for _ in range(1 + len(PREFETCH_GROUPS)):
+                self.bucket.acquire()
+        futs = [self.pool.submit(self._group, specs, typed) for specs, typed in PREFETCH_GROUPS]
+        wait(futs)
+        erros = [f.exception() for f in futs if f.exception() is not None]
+        self.last_error = str(erros[0]) if erros else None
+        self.rounds += 1
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:  # nunca derruba a thread; tenta na próxima rodada
+                self.last_error = str(e)
+            self._stop.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.pool.shutdown(wait=False)
+
+
+@st.cache_resource(show_spinner=False)
+def _prefetcher(sid: str, _ss: gspread.Spreadsheet) -> _Prefetcher | None:
+    try:
+        if str(st.secrets.get("PREFETCH", "true")).strip().lower() in ("0", "false", "nao", "não", "no"):
+            return None
+        interval = float(st.secrets.get("PREFETCH_INTERVAL", PREFETCH_INTERVAL_PADRAO))
+        qpm = float(st.secrets.get("PREFETCH_QPM", PREFETCH_QPM_PADRAO))
+    except Exception:
+        interval, qpm = float(PREFETCH_INTERVAL_PADRAO), float(PREFETCH_QPM_PADRAO)
+    return _Prefetcher(_ss, interval, qpm)
+
+
+def start_prefetch(ss: gspread.Spreadsheet) -> None:
+    """
+    Liga (uma vez por processo e planilha) a pré-carga em segundo plano.
+    Backends locais não precisam: já leem do disco/memória.
+    """
+    sid = str(getattr(ss, "id", ""))
+    if sid.startswith("local-"):
+        return
+    _prefetcher(sid, ss)
+
+
+# =========================
+# IDs
+# =========================
+# "<prefixo>-<epoch ms, 13 dígitos><8 chars base32 Crockford>" — ex.: S-1760732000123-0K8ZQ4M1.
+# O começo é o mesmo dos IDs antigos (prefixo-epoch ms), então antigos e novos
+# ordenam juntos por data de criação. O sufixo (40 bits) começa aleatório a cada
+# ms e é incrementado dentro do mesmo ms: IDs gerados no processo são únicos e
+# estritamente crescentes, e entre processos a chance de colisão é ~1/2^40 por ms.
+_B32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ID_SUFFIX_LEN = 8
+_ID_SUFFIX_MAX = 32 ** _ID_SUFFIX_LEN - 1
+_id_lock = threading.Lock()
+_id_last = [0, 0]  # [ms, sufixo] do último ID emitido
+
+
+def _b32(n: int, width: int) -> str:
+    out = []
+    for _ in range(width):
+        n, r = divmod(n, 32)
+        out.append(_B32[r])
+    return "".join(reversed(out))
+
+
+def new_ids(prefix: str = "R", n: int = 1) -> list[str]:
+    """
+    `n` IDs únicos e ordenáveis de uma vez (ex.: agenda recorrente), sem
+    necessidade de checar duplicados. Ver formato acima.
+    """
+    out = []
+    with _id_lock:
+        ms, seq = _id_last
+        for _ in range(max(int(n), 0)):
+            agora = int(time.time() * 1000)
+            if agora > ms:
+                # novo ms: sufixo aleatório, com folga p/ incrementar sem estourar
+                ms, seq = agora, random.getrandbits(5 * _ID_SUFFIX_LEN - 1)
+            elif seq < _ID_SUFFIX_MAX:
+                seq += 1
+            else:
+                ms, seq = ms + 1, random.getrandbits(5 * _ID_SUFFIX_LEN - 1)  # sufixo esgotado: avança o relógio
+            out.append(f"{prefix}-{ms:013d}{_b32(seq, _ID_SUFFIX_LEN)}")
+        _id_last[:] = [ms, seq]
+    return out
+
+
 def new_id(prefix: str = "R") -> str:
-    """ID curto com prefixo + timestamp (ms)."""
-    return f"{prefix}-{int(time.time() * 1000)}"
+    """Um ID único e ordenável com prefixo (ver `new_ids`)."""
+    return new_ids(prefix, 1)[0]
 
 
 def default_profissional() -> str:
@@ -167,4 +2230,9 @@ if _append_internal and _append_internal is not append_rows:
 
 
 # Limita o que será importado via `from utils_casulo import *`
-__all__ = ["connect", "read_ws", "append_rows", "new_id", "default_profissional"]
+__all__ = ["connect", "read_ws", "read_many", "read_range", "append_rows", "update_cells",
+           "row_of", "rows_of", "update_by_id", "update_many_by_id", "diff_by_id", "delete_by_id",
+           "read_ws_concurrent", "invalidate_ws", "clear_cache", "sync_mirror", "stale_sheets", "with_backoff",
+           "QuotaHTTPClient", "use_backend", "start_prefetch",
+           "flush_journal", "pending_writes", "saved_notice", "journal_sidebar", "rollup", "rebuild_rollups",
+           "archive_years", "archive_closed", "session_index", "ws_handle", "new_id", "new_ids", "default_profissional"]
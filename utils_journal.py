@@ -0,0 +1,181 @@
+# utils_journal.py — Diário (write-ahead) das escritas na planilha, em SQLite
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos
+    fcntl = None
+
+# estados de uma entrada
+PENDING, DONE, FAILED = "pending", "done", "failed"
+
+KEEP_DONE = 500  # entradas já enviadas mantidas p/ consulta (as mais antigas são apagadas)
+
+
+class Journal:
+    """
+    Fila durável de mutações (append / update / delete) por planilha.
+    - Toda escrita entra aqui ANTES de ir ao Google; sai como `done` quando a
+      API confirma ou `failed` quando o erro não é passageiro (ID inexistente...).
+    - `seq` dá a ordem de envio; `tries`/`error` guardam a última tentativa.
+    - `flush_lock` garante um único replayer por arquivo (entre processos).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._flush_thread_lock = threading.Lock()  # sem fcntl, vale só dentro do processo
+        with self._write() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, sid TEXT NOT NULL, title TEXT NOT NULL, "
+                "op TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL, "
+                "state TEXT NOT NULL DEFAULT 'pending', tries INTEGER NOT NULL DEFAULT 0, "
+                "error TEXT, done_at REAL)"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS ix_journal_state ON journal (sid, state, seq)")
+
+    # ---------- conexão ----------
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=FULL")  # a entrada tem que sobreviver a uma queda logo depois
+        return con
+
+    @contextmanager
+    def _write(self):
+        """Transação de escrita serializada no processo (commit/rollback automáticos)."""
+        with self._lock, closing(self._connect()) as con:
+            try:
+                yield con
+                con.commit()
+            except Exception:
+                con.rollback()
+                raise
+
+    # ---------- escrita ----------
+    def add(self, sid: str, title: str, op: str, payload: dict) -> int:
+        """Registra uma mutação pendente; retorna o `seq` dela."""
+        with self._write() as con:
+            cur = con.execute(
+                "INSERT INTO journal (sid, title, op, payload, created) VALUES (?, ?, ?, ?, ?)",
+                (sid, title, op, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+            return int(cur.lastrowid)
+
+    def mark_done(self, seqs: list[int]) -> None:
+        with self._write() as con:
+            con.executemany("UPDATE journal SET state=?, done_at=?, error=NULL WHERE seq=?",
+                            [(DONE, time.time(), s) for s in seqs])
+            # histórico enxuto: só as KEEP_DONE últimas enviadas
+            con.execute("DELETE FROM journal WHERE state=? AND seq NOT IN "
+                        "(SELECT seq FROM journal WHERE state=? ORDER BY seq DESC LIMIT ?)",
+                        (DONE, DONE, KEEP_DONE))
+
+    def mark_failed(self, seqs: list[int], error: str, final: bool) -> None:
+        """Conta a tentativa; `final=True` tira da fila (erro que não passa repetindo)."""
+        with self._write() as con:
+            con.executemany(
+                "UPDATE journal SET tries=tries+1, error=?, state=? WHERE seq=?",
+                [(error, FAILED if final else PENDING, s) for s in seqs],
+            )
+
+    def discard(self, seq: int) -> None:
+        """Tira uma entrada com falha da lista (o usuário desistiu dela)."""
+        with self._write() as con:
+            con.execute("DELETE FROM journal WHERE seq=? AND state=?", (seq, FAILED))
+
+    # ---------- leitura ----------
+    def pending(self, sid: str, limit: int | None = None) -> list[dict]:
+        """Entradas pendentes de `sid`, na ordem em que foram registradas."""
+        sql = "SELECT seq, title, op, payload, tries, error FROM journal WHERE sid=? AND state=? ORDER BY seq"
+        params: list = [sid, PENDING]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with closing(self._connect()) as con:
+            rows = con.execute(sql, params).fetchall()
+        return [{"seq": s, "title": t, "op": o, "payload": json.loads(p), "tries": n, "error": e}
+                for s, t, o, p, n, e in rows]
+
+    def state(self, seq: int) -> tuple[str, str | None] | None:
+        """(estado, último erro) da entrada `seq`; None se já foi apagada."""
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT state, error FROM journal WHERE seq=?", (seq,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def counts(self, sid: str) -> dict[str, dict[str, int]]:
+        """{estado: {aba: n}} das entradas pendentes e com falha de `sid`."""
+        out: dict[str, dict[str, int]] = {PENDING: {}, FAILED: {}}
+        with closing(self._connect()) as con:
+            for st_, title, n in con.execute(
+                "SELECT state, title, COUNT(*) FROM journal WHERE sid=? AND state IN (?, ?) "
+                "GROUP BY state, title", (sid, PENDING, FAILED)):
+                out[st_][title] = int(n)
+        return out
+
+    def failed(self, sid: str) -> list[dict]:
+        """Entradas que não puderam ser enviadas (com o erro), da mais antiga p/ a mais nova."""
+        with closing(self._connect()) as con:
+            rows = con.execute(
+                "SELECT seq, title, op, payload, error, created FROM journal "
+                "WHERE sid=? AND state=? ORDER BY seq", (sid, FAILED)).fetchall()
+        return [{"seq": s, "title": t, "op": o, "payload": json.loads(p), "error": e, "created": c}
+                for s, t, o, p, e, c in rows]
+
+    # ---------- lock do replayer ----------
+    @contextmanager
+    def flush_lock(self, timeout: float = 0.0):
+        """
+        Lock exclusivo entre processos p/ reenviar a fila. Entrega True se
+        conseguiu (esperando até `timeout` s) e False se outro já está enviando.
+        """
+        if fcntl is None:
+            pegou = self._flush_thread_lock.acquire(timeout=timeout) if timeout > 0 else \
+                self._flush_thread_lock.acquire(blocking=False)
+            try:
+                yield pegou
+            finally:
+                if pegou:
+                    self._flush_thread_lock.release()
+            return
+        with open(f"{self.path}.flush.lock", "a+") as fh:
+            fim = time.monotonic() + timeout
+            pegou = False
+            while True:
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    pegou = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= fim:
+                        break
+                    time.sleep(0.05)
+            try:
+                yield pegou
+            finally:
+                if pegou:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+_journals: dict[str, Journal] = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(path: str) -> Journal:
+    """Uma instância de Journal por arquivo, compartilhada no processo."""
+    with _journals_lock:
+        j = _journals.get(path)
+        if j is None:
+            j = _journals[path] = Journal(path)
+        return j
+
+
+__all__ = ["Journal", "get_journal", "PENDING", "DONE", "FAILED"]
@@ -0,0 +1,304 @@
+# utils_mirror.py — Espelho local (SQLite) das abas da planilha
+
+from __future__ import annotations
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from datetime import date
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos (cada um baixa por conta própria)
+    fcntl = None
+
+from utils_schema import ID_COLS, base_title, parse_dates
+
+# abas espelhadas: título -> coluna de ID
+MIRROR_TABLES = dict(ID_COLS)
+
+ROW_COL = "__row"        # nº da linha na planilha (header = 1)
+DATE_COL = "__data_iso"  # "Data" em AAAA-MM-DD, p/ filtros por intervalo
+
+FETCH_LOCK_TIMEOUT = 60  # s esperando outro processo terminar de baixar a mesma aba
+
+# formato das grades gravadas; subir o número invalida o que já está no arquivo.
+# 2: datas pedidas com dateTimeRenderOption=FORMATTED_STRING (antes vinham seriais)
+MIRROR_SCHEMA = 2
+
+
+def _q(name: str) -> str:
+    """Identificador SQL entre aspas."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def iso_dates(s: pd.Series) -> pd.Series:
+    """Converte a coluna Data (texto) para AAAA-MM-DD; inválidas viram None."""
+    d = parse_dates(s)
+    return d.dt.strftime("%Y-%m-%d").where(d.notna(), None)
+
+
+class Mirror:
+    """
+    Cópia local das worksheets em SQLite.
+    - Cada aba vira uma tabela com as colunas da planilha (TEXT) + __row e __data_iso.
+    - Índices em ID, PacienteID e __data_iso.
+    - `__sync` guarda quando cada aba foi puxada pela última vez, a versão
+      (modifiedTime do Drive) que ela tinha naquele momento e `gen`, um contador
+      que sobe a cada mudança na tabela (download, append, update, delete, sujo).
+    - Vários processos podem usar o mesmo arquivo: `gen` avisa os outros que o
+      cache em memória deles ficou velho, e `fetch_lock` garante que só um
+      baixa cada aba por vez.
+    - `PRAGMA user_version` guarda o MIRROR_SCHEMA do arquivo; abrir um mais
+      antigo marca todas as abas como sujas.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._write() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS __sync ("
+                "title TEXT PRIMARY KEY, cols TEXT NOT NULL, pulled_at REAL, stale INTEGER DEFAULT 0, "
+                "version TEXT)"
+            )
+            # arquivos criados antes das colunas `version` / `gen`
+            existentes = [r[1] for r in con.execute("PRAGMA table_info(__sync)")]
+            if "version" not in existentes:
+                con.execute("ALTER TABLE __sync ADD COLUMN version TEXT")
+            if "gen" not in existentes:
+                con.execute("ALTER TABLE __sync ADD COLUMN gen INTEGER DEFAULT 0")
+            # grades de um formato antigo: sujas, o próximo acesso baixa de novo
+            if con.execute("PRAGMA user_version").fetchone()[0] < MIRROR_SCHEMA:
+                con.execute("UPDATE __sync SET stale=1, gen=gen+1")
+                con.execute(f"PRAGMA user_version={MIRROR_SCHEMA}")
+
+    # ---------- conexão ----------
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    @contextmanager
+    def _write(self):
+        """Transação de escrita serializada no processo (commit/rollback automáticos)."""
+        with self._lock, closing(self._connect()) as con:
+            try:
+                yield con
+                con.commit()
+            except Exception:
+                con.rollback()
+                raise
+
+    # ---------- metadados ----------
+    def _meta(self, title: str) -> tuple[list[str], float, bool] | None:
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT cols, pulled_at, stale FROM __sync WHERE title=?", (title,)).fetchone()
+        if not row:
+            return None
+        return json.loads(row[0]), float(row[1] or 0), bool(row[2])
+
+    def is_fresh(self, title: str, max_age: float) -> bool:
+        """True se a aba foi puxada há menos de `max_age` s e não foi marcada como suja."""
+        meta = self._meta(title)
+        if meta is None:
+            return False
+        _, pulled_at, stale = meta
+        return not stale and time.time() - pulled_at < max_age
+
+    def pulled_at(self, title: str) -> float:
+        """Epoch do último download da aba (0.0 se nunca foi espelhada)."""
+        meta = self._meta(title)
+        return meta[1] if meta else 0.0
+
+    def version(self, title: str) -> str | None:
+        """Versão (sinal de mudança) gravada no último `replace` da aba."""
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT version FROM __sync WHERE title=?", (title,)).fetchone()
+        return row[0] if row else None
+
+    def revalidate(self, title: str, version: str) -> bool:
+        """
+        Se a aba foi puxada na versão `version` e não está suja, renova o
+        `pulled_at` (conta como recém-puxada) e retorna True.
+        """
+        with self._write() as con:
+            cur = con.execute(
+                "UPDATE __sync SET pulled_at=? WHERE title=? AND version=? AND stale=0",
+                (time.time(), title, version),
+            )
+            return cur.rowcount > 0
+
+    def mark_stale(self, title: str) -> None:
+        """Força o próximo acesso a puxar a aba de novo do Google Sheets."""
+        with self._write() as con:
+            con.execute("UPDATE __sync SET stale=1, gen=gen+1 WHERE title=?", (title,))
+
+    def generations(self) -> dict[str, int]:
+        """{aba: gen} de todas as abas espelhadas (1 consulta)."""
+        with closing(self._connect()) as con:
+            return {t: int(g or 0) for t, g in con.execute("SELECT title, gen FROM __sync")}
+
+    @contextmanager
+    def fetch_lock(self, title: str, timeout: float = FETCH_LOCK_TIMEOUT):
+        """
+        Lock exclusivo entre processos (e threads) p/ baixar `title`: quem
+        chega depois espera e, ao entrar, deve checar de novo se o espelho
+        já ficou em dia. Passado `timeout`, segue sem o lock.
+        """
+        if fcntl is None:
+            yield
+            return
+        lock_path = f"{self.path}.{re.sub(r'[^0-9A-Za-z_-]+', '_', title)}.lock"
+        with open(lock_path, "a+") as fh:
+            fim = time.monotonic() + timeout
+            pegou = False
+            while True:
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    pegou = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > fim:
+                        break
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                if pegou:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    # ---------- escrita ----------
+    def replace(self, title: str, df: pd.DataFrame, version: str | None = None) -> None:
+        """
+        Substitui a tabela inteira pelo conteúdo de `df` (linha i -> __row i+2).
+        `version` é o sinal de mudança da planilha no momento do download.
+        """
+        cols = [str(c) for c in df.columns]
+        out = df.fillna("").astype(str)
+        out.columns = cols
+        out[ROW_COL] = range(2, len(out) + 2)
+        out[DATE_COL] = iso_dates(out["Data"]) if "Data" in out.columns else None
+
+        t = _q(title)
+        col_defs = ", ".join([f"{ROW_COL} INTEGER PRIMARY KEY"] + [f"{_q(c)} TEXT" for c in cols] + [f"{DATE_COL} TEXT"])
+        ins_cols = [ROW_COL] + cols + [DATE_COL]
+        placeholders = ", ".join("?" for _ in ins_cols)
+
+        with self._write() as con:
+            con.execute(f"DROP TABLE IF EXISTS {t}")
+            con.execute(f"CREATE TABLE {t} ({col_defs})")
+            con.executemany(
+                f"INSERT INTO {t} ({', '.join(_q(c) for c in ins_cols)}) VALUES ({placeholders})",
+                out[ins_cols].itertuples(index=False, name=None),
+            )
+            for c in (MIRROR_TABLES.get(base_title(title)), "PacienteID", DATE_COL):
+                if c and (c in cols or c == DATE_COL):
+                    con.execute(f"CREATE INDEX IF NOT EXISTS {_q(f'ix_{title}_{c}')} ON {t} ({_q(c)})")
+            con.execute(
+                "INSERT OR REPLACE INTO __sync (title, cols, pulled_at, stale, version, gen) "
+                "VALUES (?, ?, ?, 0, ?, COALESCE((SELECT gen FROM __sync WHERE title=?), 0) + 1)",
+                (title, json.dumps(cols), time.time(), version, title),
+            )
+
+    def append(self, title: str, rows: list[dict], first_row: int) -> None:
+        """Insere linhas recém-anexadas na planilha a partir da linha `first_row`."""
+        meta = self._meta(title)
+        if meta is None:
+            return
+        cols = meta[0]
+        ins_cols = [ROW_COL] + cols + [DATE_COL]
+        placeholders = ", ".join("?" for _ in ins_cols)
+        params = []
+        for i, r in enumerate(rows):
+            vals = ["" if r.get(c) is None else str(r.get(c)) for c in cols]
+            iso = iso_dates(pd.Series([r.get("Data", "")])).iloc[0] if "Data" in cols else None
+            params.append([first_row + i] + vals + [iso])
+        with self._write() as con:
+            con.executemany(
+                f"INSERT OR REPLACE INTO {_q(title)} ({', '.join(_q(c) for c in ins_cols)}) VALUES ({placeholders})",
+                params,
+            )
+            con.execute("UPDATE __sync SET gen=gen+1 WHERE title=?", (title,))
+
+    def update(self, title: str, changes: list[tuple[int, str, object]]) -> None:
+        """Aplica (linha, coluna, valor) no espelho; colunas desconhecidas são ignoradas."""
+        meta = self._meta(title)
+        if meta is None:
+            return
+        cols = meta[0]
+        with self._write() as con:
+            for row, col, val in changes:
+                if col not in cols:
+                    continue
+                sval = "" if val is None else str(val)
+                con.execute(f"UPDATE {_q(title)} SET {_q(col)}=? WHERE {ROW_COL}=?", (sval, int(row)))
+                if col == "Data":
+                    iso = iso_dates(pd.Series([sval])).iloc[0]
+                    con.execute(f"UPDATE {_q(title)} SET {DATE_COL}=? WHERE {ROW_COL}=?", (iso, int(row)))
+            con.execute("UPDATE __sync SET gen=gen+1 WHERE title=?", (title,))
+
+    def delete(self, title: str, rows: list[int]) -> None:
+        """Remove as linhas `rows` (numeração da planilha) e sobe as de baixo, como no Sheets."""
+        if self._meta(title) is None or not rows:
+            return
+        t = _q(title)
+        with self._write() as con:
+            for r in sorted(set(int(x) for x in rows), reverse=True):
+                con.execute(f"DELETE FROM {t} WHERE {ROW_COL}=?", (r,))
+                # em 2 passos p/ não colidir com a PRIMARY KEY no meio do UPDATE
+                con.execute(f"UPDATE {t} SET {ROW_COL} = -({ROW_COL} - 1) WHERE {ROW_COL} > ?", (r,))
+                con.execute(f"UPDATE {t} SET {ROW_COL} = -{ROW_COL} WHERE {ROW_COL} < 0")
+            con.execute("UPDATE __sync SET gen=gen+1 WHERE title=?", (title,))
+
+    # ---------- leitura ----------
+    def read(self, title: str, cols: list[str] | None = None,
+             de: date | None = None, ate: date | None = None) -> pd.DataFrame | None:
+        """
+        Lê a tabela (ordem da planilha). `de`/`ate` filtram por Data via índice.
+        Retorna None se a aba ainda não foi espelhada.
+        """
+        meta = self._meta(title)
+        if meta is None:
+            return None
+        mcols = meta[0]
+        use = [c for c in (cols or mcols) if c in mcols]
+
+        where, params = [], []
+        if de is not None:
+            where.append(f"{DATE_COL} >= ?"); params.append(de.isoformat())
+        if ate is not None:
+            where.append(f"{DATE_COL} <= ?"); params.append(ate.isoformat())
+        sql = f"SELECT {', '.join(_q(c) for c in use) or ROW_COL} FROM {_q(title)}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {ROW_COL}"
+
+        with closing(self._connect()) as con:
+            df = pd.read_sql_query(sql, con, params=params)
+        if not use:
+            df = pd.DataFrame(index=df.index)
+        if cols:
+            df = df.reindex(columns=cols)
+        return df.fillna("")
+
+
+_mirrors: dict[str, Mirror] = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_mirror(path: str) -> Mirror:
+    """Uma instância de Mirror por arquivo, compartilhada no processo."""
+    with _mirrors_lock:
+        m = _mirrors.get(path)
+        if m is None:
+            m = _mirrors[path] = Mirror(path)
+        return m
+
+
+__all__ = ["Mirror", "MIRROR_TABLES", "get_mirror", "iso_dates"]
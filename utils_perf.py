@@ -0,0 +1,202 @@
+# utils_perf.py — Instrumentação por rerun (chamadas à API, bytes, tempos) + painel de debug
+
+from __future__ import annotations
+
+import functools
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+# Liga com DEBUG_PERF = true em st.secrets OU ?debug=perf na URL.
+# Desligado, cada ponto instrumentado custa só uma consulta a st.query_params.
+PERF_SECRET = "DEBUG_PERF"
+PERF_QUERY = ("debug", "perf")
+HIST_MAX = 20  # reruns guardados no histórico da sessão
+
+_TRACE_KEY = "__perf_trace"
+_HIST_KEY = "__perf_hist"
+_secret_on: bool | None = None
+
+
+def enabled() -> bool:
+    global _secret_on
+    if _secret_on is None:
+        try:
+            _secret_on = str(st.secrets.get(PERF_SECRET, "")).strip().lower() in ("1", "true", "sim", "yes")
+        except Exception:
+            _secret_on = False
+    if _secret_on:
+        return True
+    try:
+        return st.query_params.get(PERF_QUERY[0]) == PERF_QUERY[1]
+    except Exception:
+        return False
+
+
+class _Trace:
+    """Spans e chamadas de rede de um rerun (desde o último painel desenhado)."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.spans: list[tuple[str, float, float, str]] = []  # (nome, início, duração, detalhe)
+        self.calls: list[tuple[str, str, int]] = []           # (serviço, endpoint, bytes)
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, t0: float, dur: float, detail: str = "") -> None:
+        with self._lock:
+            self.spans.append((name, t0 - self.t0, dur, detail))
+
+    def add_call(self, service: str, endpoint: str, nbytes: int) -> None:
+        with self._lock:
+            self.calls.append((service, endpoint, int(nbytes)))
+
+
+def _trace() -> _Trace | None:
+    """Trace do rerun atual; None se desligado ou fora da thread do script."""
+    if not enabled():
+        return None
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        if get_script_run_ctx(suppress_warning=True) is None:
+            return None
+        tr = st.session_state.get(_TRACE_KEY)
+        if tr is None:
+            tr = st.session_state[_TRACE_KEY] = _Trace()
+        return tr
+    except Exception:
+        return None
+
+
+# =========================
+# Pontos de medição
+# =========================
+@contextmanager
+def span(name: str, detail: str = ""):
+    """Mede o bloco: `with span("merge"): ...`."""
+    tr = _trace()
+    if tr is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        tr.add_span(name, t0, time.perf_counter() - t0, detail)
+
+
+def timed(name: str | None = None):
+    """Decorador: mede cada chamada da função como um span `name` (padrão: nome da função)."""
+    def deco(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tr = _trace()
+            if tr is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                tr.add_span(label, t0, time.perf_counter() - t0, _detail_of(args))
+        return wrapper
+    return deco
+
+
+def _detail_of(args) -> str:
+    """Título da aba quando dá p/ descobrir pelos argumentos (read_ws(ss, "Sessoes") / append_rows(ws, ...))."""
+    for a in args[:2]:
+        if isinstance(a, str):
+            return a
+        t = getattr(a, "title", None)
+        if isinstance(t, str) and not hasattr(a, "worksheets"):
+            return t
+    return ""
+
+
+_RANGE_RE = re.compile(r"/values/[^/:]+")
+
+
+def endpoint_label(method: str, url: str) -> str:
+    """URL da API -> rótulo curto ("POST values:batchGet", "GET drive files")."""
+    path = url.split("?")[0]
+    if "/spreadsheets/" in path:
+        rest = path.split("/spreadsheets/", 1)[1]
+        rest = rest.split("/", 1)[1] if "/" in rest else ("" if ":" not in rest else rest.split(":", 1)[1])
+        rest = _RANGE_RE.sub("/values/{range}", "/" + rest).lstrip("/") or "metadata"
+        return f"{method.upper()} {rest}"
+    if "/drive/" in path:
+        return f"{method.upper()} drive files"
+    return f"{method.upper()} {path.rsplit('/', 1)[-1]}"
+
+
+def count_call(service: str, endpoint: str, nbytes: int, t0: float | None = None) -> None:
+    """Registra uma chamada de rede (`service` = "sheets", "telegram", "cloudinary"...)."""
+    tr = _trace()
+    if tr is None:
+        return
+    tr.add_call(service, endpoint, nbytes)
+    if t0 is not None:
+        tr.add_span(f"{service}: {endpoint}", t0, time.perf_counter() - t0, f"{nbytes / 1024:.1f} KB")
+
+
+# =========================
+# Painel
+# =========================
+def _caller_page() -> str:
+    f = sys._getframe(2).f_globals.get("__file__") or "?"
+    return Path(f).stem
+
+
+def perf_panel(page: str | None = None) -> None:
+    """
+    Desenha (na barra lateral) o resumo do rerun e zera o trace. Chame no FIM
+    da página; reruns interrompidos (st.stop/st.rerun antes daqui) somam no seguinte.
+    """
+    if not enabled():
+        return
+    tr = st.session_state.pop(_TRACE_KEY, None) or _Trace()
+    page = page or _caller_page()
+    total = (time.perf_counter() - tr.t0) * 1000
+    sheets = [c for c in tr.calls if c[0] == "sheets"]
+    kb = sum(c[2] for c in tr.calls) / 1024
+
+    hist = st.session_state.setdefault(_HIST_KEY, [])
+    hist.append({"página": page, "hora": time.strftime("%H:%M:%S"), "chamadas Sheets": len(sheets),
+                 "outras chamadas": len(tr.calls) - len(sheets), "KB": round(kb, 1), "ms": round(total)})
+    del hist[:-HIST_MAX]
+
+    with st.sidebar.expander("⏱️ Desempenho (debug)", expanded=True):
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Chamadas Sheets", len(sheets))
+        c2.metric("KB baixados", f"{kb:,.1f}")
+        c3.metric("Rerun (ms)", f"{total:,.0f}")
+
+        if tr.spans:
+            df = pd.DataFrame(tr.spans, columns=["span", "início", "dur", "detalhe"])
+            df["ms"] = df["dur"] * 1000
+            agg = (df.groupby("span", sort=False)["ms"].agg(["count", "sum", "max"])
+                   .rename(columns={"count": "n", "sum": "total ms", "max": "máx ms"})
+                   .sort_values("total ms", ascending=False).round(1))
+            st.caption("Tempo por etapa (spans aninhados se sobrepõem)")
+            st.dataframe(agg, use_container_width=True)
+            st.caption("Mais lentos")
+            top = df.nlargest(10, "ms")[["span", "detalhe", "ms"]].round(1)
+            st.dataframe(top, use_container_width=True, hide_index=True)
+        if tr.calls:
+            calls = (pd.DataFrame(tr.calls, columns=["serviço", "endpoint", "bytes"])
+                     .groupby(["serviço", "endpoint"])["bytes"].agg(["count", "sum"])
+                     .rename(columns={"count": "n", "sum": "bytes"}))
+            st.caption("Chamadas de rede")
+            st.dataframe(calls, use_container_width=True)
+        st.caption(f"Últimos {len(hist)} reruns nesta sessão")
+        st.dataframe(pd.DataFrame(hist[::-1]), use_container_width=True, hide_index=True)
+
+
+__all__ = ["enabled", "span", "timed", "count_call", "endpoint_label", "perf_panel"]
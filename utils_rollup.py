@@ -0,0 +1,137 @@
+# utils_rollup.py — Totais mensais pré-agregados (receita por forma, despesas por categoria)
+
+from __future__ import annotations
+
+import calendar
+from datetime import date
+
+import pandas as pd
+
+from utils_schema import ID_COLS, parse_dates, parse_money, typed_col
+
+# aba -> chaves do agrupamento (além do mês) e colunas somadas
+ROLLUPS: dict[str, dict[str, list[str]]] = {
+    "Pagamentos": {"keys": ["Forma"], "sums": ["Bruto", "Liquido", "TaxaValor"]},
+    "Despesas":   {"keys": ["Categoria", "CentroCusto"], "sums": ["Valor"]},
+}
+
+MES_COL = "Mes"  # "AAAA-MM" da Data ("" se a data é inválida)
+N_COL = "n"      # quantos lançamentos caíram no grupo
+
+
+def month_of(d) -> str:
+    """date/Timestamp -> "AAAA-MM"."""
+    return f"{d.year:04d}-{d.month:02d}"
+
+
+def aligned_months(de: date | None, ate: date | None) -> tuple[str | None, str | None] | None:
+    """
+    ("AAAA-MM" inicial, final) se o intervalo [de, ate] cobre meses inteiros
+    (None = aberto); None se corta algum mês no meio (aí o rollup não serve).
+    """
+    if de is not None and de.day != 1:
+        return None
+    if ate is not None and ate.day != calendar.monthrange(ate.year, ate.month)[1]:
+        return None
+    return (month_of(de) if de else None, month_of(ate) if ate else None)
+
+
+class Rollup:
+    """
+    Tabela mês × chaves de uma aba, mantida por incremento.
+    - `build(df)` agrega a aba inteira (vetorizado; usa as colunas tipadas se vierem).
+    - `add` / `update` / `remove` aplicam só a diferença de cada lançamento:
+      guarda, por ID, em que grupo ele caiu e quanto somou.
+    - `frame()` devolve a tabela (poucas centenas de linhas) como DataFrame.
+    """
+
+    def __init__(self, title: str):
+        spec = ROLLUPS[title]
+        self.title = title
+        self.id_col = ID_COLS[title]
+        self.keys: list[str] = list(spec["keys"])
+        self.sums: list[str] = list(spec["sums"])
+        self.cols = ["Data"] + self.keys + self.sums  # colunas de texto que alimentam o rollup
+        self._acc: dict[tuple, list[float]] = {}      # (mês, *chaves) -> [*somas, n]
+        self._rows: dict[str, tuple[tuple, tuple, dict]] = {}  # ID -> (grupo, valores, texto original)
+
+    # ---------- montagem ----------
+    def _prep(self, df: pd.DataFrame) -> tuple[list[str], list[tuple], list[tuple], list[dict]]:
+        """IDs, grupos, valores e texto de cada linha de `df` (colunas ausentes = "")."""
+        df = df.reset_index(drop=True)
+        txt = pd.DataFrame({c: (df[c].astype(str) if c in df.columns else "") for c in self.cols},
+                           index=df.index).fillna("")
+        d = df[typed_col("Data")] if typed_col("Data") in df.columns else parse_dates(txt["Data"])
+        mes = d.dt.strftime("%Y-%m").fillna("")
+        vals = [df[typed_col(c)] if typed_col(c) in df.columns else parse_money(txt[c]) for c in self.sums]
+        grupos = list(zip(mes, *[txt[k].str.strip() for k in self.keys]))
+        valores = list(zip(*[v.astype("float64").fillna(0.0) for v in vals]))
+        ids = df[self.id_col].astype(str).str.strip().tolist() if self.id_col in df.columns else [""] * len(df)
+        return ids, grupos, valores, txt.to_dict("records")
+
+    def _apply(self, grupo: tuple, valores: tuple, sinal: int) -> None:
+        acc = self._acc.setdefault(grupo, [0.0] * (len(self.sums) + 1))
+        for i, v in enumerate(valores):
+            acc[i] += sinal * float(v)
+        acc[-1] += sinal
+        if acc[-1] <= 0:
+            del self._acc[grupo]
+
+    def build(self, df: pd.DataFrame) -> "Rollup":
+        """Refaz tudo a partir da aba inteira."""
+        self._acc.clear()
+        self._rows.clear()
+        self.add(df)
+        return self
+
+    # ---------- incremento ----------
+    def add(self, df: pd.DataFrame) -> None:
+        """Soma as linhas de `df` (ID já conhecido é substituído)."""
+        ids, grupos, valores, textos = self._prep(df)
+        for pid, g, v, t in zip(ids, grupos, valores, textos):
+            if pid and pid in self._rows:
+                self._apply(*self._rows.pop(pid)[:2], sinal=-1)
+            self._apply(g, v, +1)
+            if pid:
+                self._rows[pid] = (g, v, t)
+
+    def remove(self, ids) -> None:
+        """Tira os lançamentos `ids` (desconhecidos são ignorados)."""
+        for pid in ids:
+            old = self._rows.pop(str(pid).strip(), None)
+            if old is not None:
+                self._apply(old[0], old[1], -1)
+
+    def update(self, changes: dict[str, dict[str, object]]) -> bool:
+        """
+        Aplica edições {ID: {coluna: valor novo}}. Retorna False se algum ID
+        não é conhecido (o rollup não sabe o que subtrair: refaça com `build`).
+        """
+        if any(str(pid).strip() not in self._rows for pid in changes):
+            return False
+        novas = []
+        for pid, vals in changes.items():
+            pid = str(pid).strip()
+            if not any(c in self.cols for c in vals):
+                continue
+            row = dict(self._rows[pid][2])
+            row.update({c: "" if v is None else str(v) for c, v in vals.items() if c in self.cols})
+            row[self.id_col] = pid
+            novas.append(row)
+        if novas:
+            self.add(pd.DataFrame(novas))
+        return True
+
+    # ---------- leitura ----------
+    def frame(self, de_mes: str | None = None, ate_mes: str | None = None) -> pd.DataFrame:
+        """Tabela [Mes, *chaves, *somas, n] (meses entre `de_mes` e `ate_mes`, "AAAA-MM")."""
+        cols = [MES_COL] + self.keys + self.sums + [N_COL]
+        linhas = [(*g, *(round(v, 2) for v in acc[:-1]), int(acc[-1])) for g, acc in self._acc.items()
+                  if (de_mes is None or g[0] >= de_mes) and (ate_mes is None or (g[0] and g[0] <= ate_mes))]
+        return pd.DataFrame(linhas, columns=cols).sort_values(cols[:1 + len(self.keys)]).reset_index(drop=True)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+__all__ = ["ROLLUPS", "MES_COL", "N_COL", "Rollup", "aligned_months", "month_of"]
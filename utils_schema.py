@@ -0,0 +1,255 @@
+# utils_schema.py — Tipos das colunas de cada aba (parse vetorizado, 1x por carga)
+
+from __future__ import annotations
+
+import re
+
+import pandas as pd
+
+from utils_perf import span
+
+# =========================
+# Colunas de cada aba
+# =========================
+PAC_COLS = ["PacienteID","Nome","DataNascimento","Responsavel","Telefone","Email",
+            "Diagnostico","Convenio","Status","Prioridade","FotoURL","Observacoes"]
+SES_COLS = ["SessaoID","PacienteID","Data","HoraInicio","HoraFim",
+            "Profissional","Status","Tipo","ObjetivosTrabalhados","Observacoes","AnexosURL"]
+PAG_COLS = ["PagamentoID","PacienteID","Data","Forma","Bruto","Liquido",
+            "TaxaValor","TaxaPct","Referencia","Obs","ReciboURL"]
+DESP_COLS = ["DespesaID","Data","Categoria","Descricao","Fornecedor","Forma",
+             "Valor","CentroCusto","Pago","Referencia","Obs","ComprovanteURL",
+             "RecorrenteID","Parcela"]
+REL_COLS = ["RelatorioID","PacienteID","Data","Tipo","Titulo","Autor","Texto","ArquivoURL"]
+
+# título da aba -> coluna de ID (chave única de cada linha)
+ID_COLS = {
+    "Pacientes":  "PacienteID",
+    "Sessoes":    "SessaoID",
+    "Pagamentos": "PagamentoID",
+    "Despesas":   "DespesaID",
+    "Relatorios": "RelatorioID",
+}
+
+# Abas de arquivo: "<aba>_<ano>" (ex.: "Sessoes_2023") têm o mesmo layout,
+# ID e tipos da aba de origem.
+_ARCHIVE_RE = re.compile(r"^(?P<base>.+)_(?P<ano>\d{4})$")
+
+
+def archive_title(title: str, year: int) -> str:
+    """Nome da aba de arquivo de `title` para o ano `year`."""
+    return f"{title}_{int(year)}"
+
+
+def split_archive(title: str) -> tuple[str, int | None]:
+    """"Sessoes_2023" -> ("Sessoes", 2023); aba comum -> (título, None)."""
+    m = _ARCHIVE_RE.match(title or "")
+    if m and m["base"] in ID_COLS:
+        return m["base"], int(m["ano"])
+    return title, None
+
+
+def base_title(title: str) -> str:
+    """Aba de origem (o próprio título se não for arquivo)."""
+    return split_archive(title)[0]
+
+# Tipos por aba. Colunas "date"/"time"/"money"/"number"/"bool" ganham uma coluna
+# tipada "__<coluna>" ao lado da original (texto, usada p/ exibir e gravar);
+# "category" converte a própria coluna.
+#   date   -> datetime64 (NaT se inválida)
+#   time   -> minuto do dia (Int64; <NA> se inválida)
+#   money  -> float64 (aceita "R$ 1.234,56", "1234.56", "1,234.56", "-R$ 10", "(10,00)"...;
+#             vazio/inválido = 0.0; os inválidos ficam listados em df.attrs["unparsed"])
+#   number -> float64 (idem money; "2,5%" -> 2.5)
+#   bool   -> bool ("true"/"sim"/"1")
+SCHEMAS: dict[str, dict[str, str]] = {
+    "Pacientes": {
+        "DataNascimento": "date",
+        "Status": "category", "Prioridade": "category", "Convenio": "category",
+    },
+    "Sessoes": {
+        "Data": "date", "HoraInicio": "time", "HoraFim": "time",
+        "Status": "category", "Tipo": "category",
+    },
+    "Pagamentos": {
+        "Data": "date", "Forma": "category",
+        "Bruto": "money", "Liquido": "money", "TaxaValor": "money", "TaxaPct": "number",
+    },
+    "Despesas": {
+        "Data": "date", "Valor": "money", "Pago": "bool",
+        "Forma": "category", "Categoria": "category", "CentroCusto": "category",
+    },
+    "Relatorios": {
+        "Data": "date", "Tipo": "category",
+    },
+}
+
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%Y/%m/%d")
+
+
+def typed_col(col: str) -> str:
+    """Nome da coluna tipada que acompanha `col` ("Data" -> "__Data")."""
+    return f"__{col}"
+
+
+# =========================
+# Parsers vetorizados
+# =========================
+def parse_dates(s: pd.Series) -> pd.Series:
+    """Texto -> datetime64, tentando os formatos de DATE_FORMATS em ordem."""
+    s = s.astype(str).str.strip()
+    out = pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns]")
+    for fmt in DATE_FORMATS:
+        faltando = out.isna() & (s != "")
+        if not faltando.any():
+            break
+        out[faltando] = pd.to_datetime(s[faltando], format=fmt, errors="coerce")
+    return out
+
+
+def parse_times(s: pd.Series) -> pd.Series:
+    """"HH:MM" -> minuto do dia (Int64)."""
+    t = pd.to_datetime(s.astype(str).str.strip(), format="%H:%M", errors="coerce")
+    return (t.dt.hour * 60 + t.dt.minute).astype("Int64")
+
+
+UNPARSED_ATTR = "unparsed"  # df.attrs[UNPARSED_ATTR] = {coluna: [rótulos das linhas não convertidas]}
+
+# "1.234" / "1.234.567": ponto de milhar, sem decimais (grupo inicial "0" não é milhar: "0.125")
+_MILHAR_RE = r"[1-9]\d{0,2}(?:\.\d{3})+"
+_MILHAR_MULTI_RE = r"[1-9]\d{0,2}(?:\.\d{3}){2,}"  # dois pontos ou mais: não pode ser decimal
+# moeda e espaços (inclusive os não separáveis que o Sheets usa): marcam texto formatado
+_FORMATO = ("R$", " ", "\u00a0", "\u202f")
+_LIXO = _FORMATO + ("%",)  # removidos do texto antes de converter
+_NUM_RE = r"(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?"
+# número cru da API/planilha ("144.765", "80", "-5.5"): ponto é sempre decimal
+_CRU_RE = r"-?\d+(?:\.\d+)?"
+
+
+def _to_float(num: pd.Series, ok: pd.Series) -> pd.Series:
+    """Texto já validado (`ok`) -> float64; o resto vira NaN. Com pyarrow o cast é bem mais rápido."""
+    try:
+        return num.where(ok).astype("float64[pyarrow]").astype("float64")
+    except (ImportError, TypeError, ValueError):
+        return num.where(ok, "nan").astype("float64")
+
+
+def _money_text(txt: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """Formatos com "R$", vírgula, milhar, sinal...: (valores, não convertidos)."""
+    txt = txt.str.strip()
+    formatado = pd.Series(False, index=txt.index)
+    for marca in _FORMATO:
+        formatado |= txt.str.contains(marca, regex=False)
+    for lixo in _LIXO:  # replace literal: regex aqui custa 3x mais
+        txt = txt.str.replace(lixo, "", regex=False)
+    neg = txt.str.startswith("-") | (txt.str.startswith("(") & txt.str.endswith(")"))
+    txt = txt.str.strip("()+-")
+    virg = txt.str.contains(",", regex=False)
+    us = virg & txt.str.contains(r",[^,]*\.", regex=True)       # "1,234.56"
+    br = virg & ~us                                             # "1.234,56" / "12,5"
+    # "R$ 1.234" é milhar; "1.234" sozinho é número cru (decimal), salvo "1.234.567"
+    milhar = ~virg & ((formatado & txt.str.fullmatch(_MILHAR_RE)) | txt.str.fullmatch(_MILHAR_MULTI_RE))
+    num = txt.copy()
+    num[br] = txt[br].str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    num[us] = txt[us].str.replace(",", "", regex=False)
+    num[milhar] = txt[milhar].str.replace(".", "", regex=False)
+    ok = num.str.fullmatch(_NUM_RE)
+    val = _to_float(num, ok)
+    return val.where(~neg, -val), ~ok & (txt != "")
+
+
+def _money(s: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """(valores float64, máscara das células não vazias que não viraram número)."""
+    txt = s.fillna("").astype(str)
+    # número cru da API ("1234.5", "80"): converte direto, sem limpar o texto
+    direto = txt.str.fullmatch(_CRU_RE)
+    val = _to_float(txt, direto)
+    ruim = pd.Series(False, index=txt.index)
+    resto = ~direto & (txt != "")
+    if resto.any():
+        val[resto], ruim[resto] = _money_text(txt[resto])
+    return val.fillna(0.0), ruim
+
+
+def parse_money(s: pd.Series) -> pd.Series:
+    """
+    Valores em BRL -> float64, sem laço por linha. Tira "R$", "%" e espaços
+    (inclusive o não separável do Sheets); o separador decimal é o último entre
+    vírgula e ponto ("1.234,56", "1,234.56"). Número cru com um ponto é sempre
+    decimal ("144.765" = 144,765); ponto como milhar só em texto formatado
+    ("R$ 1.234") ou com vários grupos ("1.234.567"). Sinal por "-" ou
+    parênteses. Vazio ou inválido = 0.0 (ver `unparsed_money`).
+    """
+    return _money(s)[0]
+
+
+def unparsed_money(s: pd.Series) -> pd.Series:
+    """Máscara das células preenchidas que `parse_money` não conseguiu converter."""
+    return _money(s)[1]
+
+
+def unparsed_rows(df: pd.DataFrame, title: str) -> pd.DataFrame:
+    """
+    Linhas de `df` (frame tipado) com valor não convertido, p/ mostrar ao
+    usuário: [ID, Data, Coluna, Valor]. Vazio se todas converteram.
+    """
+    id_col = ID_COLS.get(base_title(title))
+    linhas = []
+    for col, rotulos in (df.attrs.get(UNPARSED_ATTR) or {}).items():
+        if col not in df.columns:
+            continue
+        for r in (r for r in rotulos if r in df.index):
+            linhas.append({"ID": df.at[r, id_col] if id_col in df.columns else r,
+                           "Data": df.at[r, "Data"] if "Data" in df.columns else "",
+                           "Coluna": col, "Valor": df.at[r, col]})
+    return pd.DataFrame(linhas, columns=["ID", "Data", "Coluna", "Valor"])
+
+
+def parse_bool(s: pd.Series) -> pd.Series:
+    return s.astype(str).str.strip().str.lower().isin(["true", "verdadeiro", "sim", "1"])
+
+
+_PARSERS = {
+    "date": parse_dates,
+    "time": parse_times,
+    "money": parse_money,
+    "number": parse_money,
+    "bool": parse_bool,
+}
+
+
+def apply_schema(df: pd.DataFrame, title: str) -> pd.DataFrame:
+    """
+    Devolve uma cópia de `df` com os tipos de SCHEMAS[title] aplicados.
+    Colunas ausentes em `df` são ignoradas; abas sem schema voltam iguais.
+    Abas de arquivo ("Sessoes_2023") usam o schema da aba de origem.
+    Valores monetários não convertidos ficam em out.attrs["unparsed"] (ver `unparsed_rows`).
+    """
+    schema = SCHEMAS.get(base_title(title))
+    if not schema:
+        return df
+    out = df.copy()
+    ruins: dict[str, list] = {}
+    for col, kind in schema.items():
+        if col not in out.columns:
+            continue
+        with span(f"parse {kind}", f"{title}.{col}"):
+            if kind == "category":
+                out[col] = out[col].astype(str).astype("category")
+            elif kind in ("money", "number"):
+                out[typed_col(col)], ruim = _money(out[col])
+                if ruim.any():
+                    ruins[col] = out.index[ruim].tolist()
+            else:
+                out[typed_col(col)] = _PARSERS[kind](out[col])
+    if ruins:
+        out.attrs[UNPARSED_ATTR] = ruins
+    return out
+
+
+__all__ = [
+    "PAC_COLS", "SES_COLS", "PAG_COLS", "DESP_COLS", "REL_COLS", "ID_COLS", "SCHEMAS", "DATE_FORMATS",
+    "archive_title", "split_archive", "base_title",
+    "typed_col", "parse_dates", "parse_times", "parse_money", "parse_bool", "apply_schema",
+    "UNPARSED_ATTR", "unparsed_money", "unparsed_rows",
+]
@@ -0,0 +1,81 @@
+# utils_snapshot.py — Fotografia em disco (Parquet) dos frames já tipados, p/ partida a quente
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # sem pyarrow: snapshot desligado (tudo volta a ser baixado no boot)
+    pa = pq = None
+
+_META_KEY = b"casulo"
+_ATTRS_KEY = b"casulo.attrs"  # df.attrs (ex.: valores não reconhecidos), que o Parquet não guarda
+
+
+def available() -> bool:
+    """True se o pyarrow está instalado."""
+    return pq is not None
+
+
+def snapshot_path(folder: str, key: tuple) -> str:
+    """
+    Arquivo da entrada de cache `key` = (spreadsheet_id, título, colunas, typed):
+    "<título>-<hash da chave>.parquet" dentro de `folder`.
+    """
+    title = str(key[1])
+    h = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(folder, f"{re.sub(r'[^0-9A-Za-z_-]+', '_', title)}-{h}.parquet")
+
+
+def save(path: str, df: pd.DataFrame, meta: dict) -> bool:
+    """
+    Grava `df` (tipos preservados: datas, Int64, categorias) + `meta` (JSON) em
+    `path`. A troca é atômica: quem lê nunca vê arquivo pela metade.
+    Retorna False se não deu p/ gravar (sem pyarrow, disco, tipo não suportado).
+    """
+    if pq is None:
+        return False
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tbl = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+        md = dict(tbl.schema.metadata or {})
+        md[_META_KEY] = json.dumps(meta, default=str).encode("utf-8")
+        md[_ATTRS_KEY] = json.dumps(df.attrs, default=str).encode("utf-8")
+        tbl = tbl.replace_schema_metadata(md)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        os.close(fd)
+        try:
+            pq.write_table(tbl, tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return True
+    except (OSError, pa.ArrowException, TypeError, ValueError):
+        return False
+
+
+def load(path: str) -> tuple[pd.DataFrame, dict] | None:
+    """(df, meta) gravados por `save`; None se o arquivo não existe ou não abre."""
+    if pq is None or not os.path.exists(path):
+        return None
+    try:
+        tbl = pq.read_table(path)
+        md = tbl.schema.metadata or {}
+        meta = json.loads(md.get(_META_KEY, b"{}"))
+        df = tbl.to_pandas()
+        df.attrs.update(json.loads(md.get(_ATTRS_KEY, b"{}")))
+        return df, meta
+    except (OSError, pa.ArrowException, ValueError):
+        return None
+
+
+__all__ = ["available", "snapshot_path", "save", "load"]
@@ -1,5 +1,6 @@
 # utils_telegram.py
-import os, requests, streamlit as st
+import os, time, requests, streamlit as st
+from utils_perf import count_call
 
 _TOKEN_KEYS  = ("TELEGRAM_TOKEN", "TELEGRAM_BOT_TOKEN")
 _CHATID_KEYS = ("TELEGRAM_CHAT_ID", "TELEGRAM_CHAT_ID_CASULO", "TELEGRAM_CHAT_ID_PADRAO")
@@ -43,9 +44,11 @@ def tg_send_message(text: str, chat_id: str | None = None):
     token = tg_token(); chat = chat_id or tg_chat_id()
     if not token or not chat: return False, "Token/ChatID ausente"
     try:
+        t0 = time.perf_counter()
         r = requests.post(f"https://api.telegram.org/bot{token}/sendMessage",
                           json={"chat_id": chat, "text": text, "parse_mode": "HTML",
                                 "disable_web_page_preview": True}, timeout=30)
+        count_call("telegram", "sendMessage", len(r.content or b""), t0)
         ok = r.ok and r.json().get("ok", False)
         return (bool(ok), "" if ok else f"HTTP {r.status_code}: {r.text}")
     except Exception as e:
@@ -55,9 +58,11 @@ def tg_send_document(file_bytes: bytes, filename: str, caption: str = "", chat_i
     token = tg_token(); chat = chat_id or tg_chat_id()
     if not token or not chat: return False, "Token/ChatID ausente"
     try:
+        t0 = time.perf_counter()
         r = requests.post(f"https://api.telegram.org/bot{token}/sendDocument",
                           data={"chat_id": chat, "caption": caption[:1024]},
                           files={"document": (filename, file_bytes, "application/pdf")}, timeout=60)
+        count_call("telegram", "sendDocument", len(r.content or b""), t0)
         ok = r.ok and r.json().get("ok", False)
         return (bool(ok), "" if ok else f"HTTP {r.status_code}: {r.text}")
     except Exception as e:
@@ -1,8 +1,11 @@
 # utils_ui.py
 import streamlit as st
 import base64
+import pandas as pd
 from pathlib import Path
 
+from utils_schema import unparsed_rows
+
 def set_bg_logo(
     url: str | None = None,
     local_path: str | None = None,
@@ -63,3 +66,16 @@ def set_bg_logo(
     </style>
     """
     st.markdown(css, unsafe_allow_html=True)
+
+
+def warn_unparsed(df: pd.DataFrame, title: str):
+    """
+    Lista os valores de `df` (frame tipado de `title`) que não puderam ser lidos
+    como número; eles entram como R$ 0 nos totais até serem corrigidos na planilha.
+    """
+    ruins = unparsed_rows(df, title)
+    if ruins.empty:
+        return
+    with st.expander(f"⚠️ {len(ruins)} valor(es) de {title} não reconhecido(s) — contados como R$ 0"):
+        st.caption("Corrija na planilha (formatos aceitos: 1.234,56 · 1234.56 · R$ 1.234,56).")
+        st.dataframe(ruins, use_container_width=True, hide_index=True)